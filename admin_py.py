@@ -1,14 +1,61 @@
 import customtkinter as ctk
+import tkinter as tk
 from tkinter import messagebox, filedialog
+from collections import namedtuple
 import json
+import os
 import datetime
-import threading
-import time
-from shared import load_json_file, save_json_file, log_event
+from event_log import SYSTEM_LOG_FILE
+from storage import (
+    get_storage, log_event,
+    USERS, FILES, SYSTEM_LOGS, ENCRYPTION_ACTIVITY
+)
+from log_ingest import LogIngestor, count_active_sessions
+from refresh_worker import RefreshWorker
+from log_view import LogView
+from log_query import LogIndex, QueryError, parse_query, quote_value
+from incremental_backup import create_incremental_backup
+from data_export import export_data as export_records, parse_export_filter, available_formats, PARQUET_FORMAT
+from job_runner import JobRunner, RUNNING, DONE, CANCELLED
+from change_watch import DataWatcher, DATA_DIR
+
+# Immutable result of one background refresh, applied on the UI thread
+DashboardSnapshot = namedtuple("DashboardSnapshot", [
+    "total_users", "total_logs", "total_files", "active_sessions",
+    "encryption_ops", "last_activity", "activity_text",
+    "tab_widget", "tab_text", "log_view", "status_message", "rendered"
+])
+
+# Stores each refreshable panel is built from; a panel is rebuilt only after
+# one of its stores has changed since it was last shown
+PANEL_STORES = {
+    "activity_text": (SYSTEM_LOGS,),
+    "users_text": (USERS, SYSTEM_LOGS),
+    "log_view": (SYSTEM_LOGS,),
+    "files_text": (FILES,),
+    "encryption_activity_text": (ENCRYPTION_ACTIVITY,),
+}
 
 class AdminApp:
     def __init__(self, username):
         self.username = username
+        self.storage = get_storage()
+        
+        # Incremental aggregates over the event streams
+        self.log_ingestor = LogIngestor(self.storage, SYSTEM_LOGS)
+        self.encryption_ingestor = LogIngestor(self.storage, ENCRYPTION_ACTIVITY)
+        
+        # Paginated System Logs tab state
+        self.log_view = LogView()
+        self.log_page = 0
+        self.log_filter = ""
+        self.log_index = LogIndex(self.storage, SYSTEM_LOGS)
+        
+        # Background loader; the UI thread only applies finished snapshots
+        self.refresh_worker = RefreshWorker(self.build_dashboard_snapshot, self.deliver_snapshot)
+        
+        # Data exports stream to disk off the UI thread
+        self.export_jobs = JobRunner(workers=1, on_update=self.on_export_update, name="admin-export")
         
         # Set theme
         ctk.set_appearance_mode("dark")
@@ -22,8 +69,12 @@ class AdminApp:
         # Center the window
         self.center_window()
         
-        # Auto-refresh flag
+        # Auto-refresh flag; refreshes are driven by changes under data/
         self.auto_refresh = True
+        self.data_watcher = None
+        # Change counter per store, and the counters each panel was last built at
+        self.store_versions = dict.fromkeys((USERS, FILES, SYSTEM_LOGS, ENCRYPTION_ACTIVITY), 0)
+        self.shown_versions = {}
         
         # Log admin session start
         log_event(self.username, "admin_session_start", f"Admin dashboard opened by {username}")
@@ -87,7 +138,7 @@ class AdminApp:
         logout_button.pack()
         
         # Main tabview
-        self.tabview = ctk.CTkTabview(self.root)
+        self.tabview = ctk.CTkTabview(self.root, command=self.on_tab_changed)
         self.tabview.pack(fill="both", expand=True, padx=20, pady=(0, 10))
         
         # Create tabs
@@ -250,7 +301,37 @@ class AdminApp:
         )
         refresh_logs_button.pack(side="left")
         
-        # Logs display
+        # Page navigation
+        nav_frame = ctk.CTkFrame(tab, height=50)
+        nav_frame.pack(fill="x", padx=20, pady=(0, 10))
+        nav_frame.pack_propagate(False)
+        
+        for text, command in (
+            ("⏮ Newest", lambda: self.show_log_page(0)),
+            ("◀ Newer", lambda: self.show_log_page(self.log_page - 1)),
+            ("Older ▶", lambda: self.show_log_page(self.log_page + 1)),
+            ("Oldest ⏭", lambda: self.show_log_page(self.log_view.page_count() - 1)),
+        ):
+            ctk.CTkButton(
+                nav_frame, text=text, command=command, width=80, height=30
+            ).pack(side="left", padx=(15, 0), pady=10)
+            
+        self.log_page_label = ctk.CTkLabel(
+            nav_frame, text="Page 1 of 1", font=ctk.CTkFont(size=11), text_color="gray"
+        )
+        self.log_page_label.pack(side="left", padx=15, pady=10)
+        
+        jump_button = ctk.CTkButton(
+            nav_frame, text="🕒 Jump", command=self.jump_to_log_time, width=70, height=30
+        )
+        jump_button.pack(side="right", padx=15, pady=10)
+        
+        self.log_jump_entry = ctk.CTkEntry(
+            nav_frame, placeholder_text="YYYY-MM-DD HH:MM", width=160
+        )
+        self.log_jump_entry.pack(side="right", pady=10)
+        
+        # Logs display (one page at a time)
         logs_frame = ctk.CTkFrame(tab)
         logs_frame.pack(fill="both", expand=True, padx=20, pady=(0, 20))
         
@@ -259,6 +340,11 @@ class AdminApp:
         )
         self.logs_text.pack(fill="both", expand=True, padx=15, pady=15)
         
+        # Scrolling past either end of the page turns the page
+        self.logs_text.bind("<MouseWheel>", self.on_logs_scroll)
+        self.logs_text.bind("<Button-4>", self.on_logs_scroll)
+        self.logs_text.bind("<Button-5>", self.on_logs_scroll)
+        
     def create_files_tab(self):
         tab = self.tabview.add("📁 File Tracking")
         
@@ -394,19 +480,32 @@ class AdminApp:
         
     def manual_refresh(self):
         """Manual refresh triggered by button"""
-        self.refresh_data()
-        self.update_status("🔄 Manual refresh completed")
+        self.refresh_data(status_message="🔄 Manual refresh completed")
         
     def start_auto_refresh(self):
-        """Start auto-refresh thread"""
-        def auto_refresh_loop():
-            while self.auto_refresh:
-                time.sleep(10)  # Refresh every 10 seconds
-                if self.auto_refresh:
-                    self.root.after(0, self.refresh_data)
-        
-        refresh_thread = threading.Thread(target=auto_refresh_loop, daemon=True)
-        refresh_thread.start()
+        """Start watching data/ and refresh when a store changes"""
+        if self.data_watcher is None:
+            self.data_watcher = DataWatcher(DATA_DIR, self.on_data_changed).start()
+            
+    def stop_auto_refresh(self):
+        if self.data_watcher is not None:
+            self.data_watcher.stop()
+            self.data_watcher = None
+            
+    def on_data_changed(self, stores):
+        """Stores changed on disk (watcher thread); refresh the panels built from them"""
+        for store in stores:
+            if store in self.store_versions:
+                self.store_versions[store] += 1
+        try:
+            self.root.after(0, lambda: self.refresh_data(full=False))
+        except (RuntimeError, tk.TclError):
+            # Window already destroyed
+            pass
+            
+    def on_tab_changed(self):
+        """Build the newly visible tab if its data changed since it was last shown"""
+        self.refresh_data(full=False)
         
     def toggle_auto_refresh(self):
         """Toggle auto-refresh on/off"""
@@ -421,80 +520,131 @@ class AdminApp:
         
         if self.auto_refresh:
             self.start_auto_refresh()
-            self.update_status("🔄 Auto-refresh enabled")
+            # Catch up on anything that changed while it was off
+            self.refresh_data(status_message="🔄 Auto-refresh enabled")
         else:
+            self.stop_auto_refresh()
             self.update_status("⏸️ Auto-refresh disabled")
             
         log_event(self.username, "admin_toggle_refresh", f"Auto-refresh {status_text}")
         
-    def refresh_data(self):
-        """Refresh all dashboard data"""
+    def refresh_data(self, status_message=None, full=True):
+        """Request a dashboard refresh; data is loaded off the UI thread
+
+        A full refresh rebuilds every visible panel; otherwise only panels
+        whose stores changed since they were last shown are rebuilt.
+        """
+        if full:
+            self.shown_versions.clear()
+        self.refresh_worker.request(self.tabview.get(), status_message)
+        
+    def stale_panels(self, versions):
+        """Panels whose stores changed since they were last shown"""
+        stale = set()
+        for panel, stores in PANEL_STORES.items():
+            shown = self.shown_versions.get(panel)
+            if shown is None or any(shown.get(store) != versions[store] for store in stores):
+                stale.add(panel)
+        return stale
+        
+    def build_dashboard_snapshot(self, generation, current_tab, status_message):
+        """Load and aggregate dashboard data (runs on the refresh worker thread)"""
+        versions = dict(self.store_versions)
+        stale = self.stale_panels(versions)
+        
+        # Load document stores
+        users_data = self.storage.load_document(USERS)
+        files_data = self.storage.load_document(FILES)
+        
+        # Fold in only the events appended since the last refresh
+        self.log_ingestor.poll()
+        self.encryption_ingestor.poll()
+        log_stats = self.log_ingestor.aggregates
+        self.refresh_worker.check(generation)
+        
+        # Time-indexed range queries: newest entries and the last hour only
+        recent_logs = self.storage.recent_events(SYSTEM_LOGS, 15)
+        activity_text = self.format_recent_activity(recent_logs) if "activity_text" in stale else None
+        cutoff_time = datetime.datetime.now() - datetime.timedelta(hours=1)
+        active_sessions = count_active_sessions(
+            self.storage.events_since(SYSTEM_LOGS, cutoff_time.isoformat())
+        )
+        
+        # Pre-render whichever extra tab is currently visible
+        tab_widget = tab_text = log_view = None
+        if "Users" in current_tab and "users_text" in stale:
+            tab_widget, tab_text = "users_text", self.format_users_display(users_data)
+        elif "Logs" in current_tab and "log_view" in stale:
+            log_view = self.load_log_view()
+        elif "Files" in current_tab and "files_text" in stale:
+            tab_widget, tab_text = "files_text", self.format_files_display(files_data)
+        elif "Activity" in current_tab and "encryption_activity_text" in stale:
+            tab_widget = "encryption_activity_text"
+            tab_text = self.format_encryption_activity_display(self.storage.read_events(ENCRYPTION_ACTIVITY))
+        self.refresh_worker.check(generation)
+        
+        rendered = {
+            panel: {store: versions[store] for store in PANEL_STORES[panel]}
+            for panel in ("activity_text" if activity_text is not None else None, tab_widget,
+                          "log_view" if log_view is not None else None)
+            if panel is not None
+        }
+        
+        return DashboardSnapshot(
+            total_users=len(users_data),
+            total_logs=log_stats.total,
+            total_files=len(files_data),
+            active_sessions=active_sessions,
+            encryption_ops=self.encryption_ingestor.aggregates.total,
+            last_activity=self.get_last_activity(recent_logs),
+            activity_text=activity_text,
+            tab_widget=tab_widget,
+            tab_text=tab_text,
+            log_view=log_view,
+            status_message=status_message,
+            rendered=rendered
+        )
+        
+    def deliver_snapshot(self, generation, snapshot, error):
+        """Hand a finished snapshot to the UI thread"""
         try:
-            # Load all data files
-            users_data = load_json_file("data/users_data.json")
-            logs_data = load_json_file("data/system_logs.json")
-            files_data = load_json_file("data/files_data.json")
-            encryption_data = load_json_file("data/encryption_activity.json")
-            
-            # Calculate statistics
-            total_users = len(users_data)
-            total_logs = len(logs_data)
-            total_files = len(files_data)
-            
-            # Count encryption operations
-            encryption_ops = len(encryption_data)
-            
-            # Count active sessions (recent logins without logout)
-            active_sessions = self.count_active_sessions(logs_data)
-            
-            # Get last activity timestamp
-            last_activity = self.get_last_activity(logs_data)
+            self.root.after(0, lambda: self.apply_snapshot(generation, snapshot, error))
+        except (RuntimeError, tk.TclError):
+            # Window already destroyed
+            pass
             
-            # Update dashboard stats
-            self.total_users_label.configure(text=f"👥 Total Users: {total_users}")
-            self.total_logs_label.configure(text=f"📋 Total Logs: {total_logs}")
-            self.total_files_label.configure(text=f"📁 Files Accessed: {total_files}")
-            self.active_sessions_label.configure(text=f"🔄 Active Sessions: {active_sessions}")
-            self.encryption_ops_label.configure(text=f"🔐 Encryption Ops: {encryption_ops}")
-            self.last_activity_label.configure(text=f"🕒 Last Activity: {last_activity}")
+    def apply_snapshot(self, generation, snapshot, error):
+        """Apply a dashboard snapshot to the widgets (UI thread only)"""
+        if not self.refresh_worker.is_current(generation):
+            return
+        if error is not None:
+            self.update_status(f"❌ Refresh failed: {str(error)}")
+            return
             
-            # Update recent activity display
-            self.update_recent_activity(logs_data)
+        # Update dashboard stats
+        self.total_users_label.configure(text=f"👥 Total Users: {snapshot.total_users}")
+        self.total_logs_label.configure(text=f"📋 Total Logs: {snapshot.total_logs}")
+        self.total_files_label.configure(text=f"📁 Files Accessed: {snapshot.total_files}")
+        self.active_sessions_label.configure(text=f"🔄 Active Sessions: {snapshot.active_sessions}")
+        self.encryption_ops_label.configure(text=f"🔐 Encryption Ops: {snapshot.encryption_ops}")
+        self.last_activity_label.configure(text=f"🕒 Last Activity: {snapshot.last_activity}")
+        
+        # Update recent activity display and the visible tab if they changed
+        if snapshot.activity_text is not None:
+            self.set_text(self.activity_text, snapshot.activity_text)
+        if snapshot.tab_widget:
+            self.set_text(getattr(self, snapshot.tab_widget), snapshot.tab_text)
+        if snapshot.log_view is not None:
+            self.show_log_view(snapshot.log_view, keep_position=True)
+        self.shown_versions.update(snapshot.rendered)
             
-            # Update other tabs if they're currently visible
-            current_tab = self.tabview.get()
-            if "Users" in current_tab:
-                self.update_users_display(users_data)
-            elif "Logs" in current_tab:
-                self.update_logs_display(logs_data)
-            elif "Files" in current_tab:
-                self.update_files_display(files_data)
-            elif "Activity" in current_tab:
-                self.update_encryption_activity_display(encryption_data)
-                
-        except Exception as e:
-            self.update_status(f"❌ Refresh failed: {str(e)}")
+        if snapshot.status_message:
+            self.update_status(snapshot.status_message)
             
-    def count_active_sessions(self, logs_data):
-        """Count currently active user sessions"""
-        recent_logins = {}
-        cutoff_time = datetime.datetime.now() - datetime.timedelta(hours=1)
-        
-        for log in logs_data:
-            try:
-                log_time = datetime.datetime.fromisoformat(log.get('timestamp', ''))
-                if log_time > cutoff_time:
-                    username = log.get('username', '')
-                    action = log.get('action', '')
-                    
-                    if 'login' in action and 'client_session_start' in action:
-                        recent_logins[username] = log_time
-                    elif 'logout' in action and username in recent_logins:
-                        del recent_logins[username]
-            except:
-                continue
-                
-        return len(recent_logins)
+    def set_text(self, textbox, text):
+        """Replace the contents of a textbox"""
+        textbox.delete("0.0", "end")
+        textbox.insert("0.0", text)
         
     def get_last_activity(self, logs_data):
         """Get timestamp of last system activity"""
@@ -514,7 +664,10 @@ class AdminApp:
         
     def update_recent_activity(self, logs_data):
         """Update recent activity display"""
-        self.activity_text.delete("0.0", "end")
+        self.set_text(self.activity_text, self.format_recent_activity(logs_data))
+        
+    def format_recent_activity(self, logs_data):
+        """Build recent activity panel text"""
         
         # Get last 15 log entries
         recent_logs = sorted(logs_data, key=lambda x: x.get('timestamp', ''), reverse=True)[:15]
@@ -549,7 +702,7 @@ class AdminApp:
             activity_text += f"    📝 Details: {details}\n"
             activity_text += "-" * 60 + "\n\n"
             
-        self.activity_text.insert("0.0", activity_text)
+        return activity_text
         
     def get_action_icon(self, action):
         """Get appropriate icon for action type"""
@@ -569,7 +722,10 @@ class AdminApp:
         
     def update_users_display(self, users_data):
         """Update users tab display"""
-        self.users_text.delete("0.0", "end")
+        self.set_text(self.users_text, self.format_users_display(users_data))
+        
+    def format_users_display(self, users_data):
+        """Build users tab text"""
         
         users_text = "👥 REGISTERED USERS DATABASE\n"
         users_text += "=" * 80 + "\n"
@@ -603,36 +759,58 @@ class AdminApp:
                 users_text += f"🆔 User ID: {hash(username) % 10000:04d}\n"
                 users_text += f"📊 Activity: {activity_summary}\n\n"
                 
-        self.users_text.insert("0.0", users_text)
+        return users_text
         
     def get_user_activity_summary(self, username):
         """Get activity summary for a specific user"""
-        try:
-            logs_data = load_json_file("data/system_logs.json")
-            user_logs = [log for log in logs_data if log.get('username') == username]
-            
-            login_count = len([log for log in user_logs if 'login' in log.get('action', '')])
-            file_access_count = len([log for log in user_logs if 'file_access' in log.get('action', '')])
-            encryption_count = len([log for log in user_logs if 'encryption' in log.get('action', '')])
-            
-            return f"Logins: {login_count}, Files: {file_access_count}, Encryption: {encryption_count}"
-        except:
+        # Maintained incrementally by the log ingestor, so this is O(1) per user
+        row = self.log_ingestor.aggregates.users.get(username)
+        if row is None:
             return "No activity recorded"
+        return (
+            f"Logins: {row['logins']}, Files: {row['file_access']}, Encryption: {row['encryption']}, "
+            f"Last Seen: {row['last_seen'] or 'N/A'}"
+        )
             
-    def update_logs_display(self, logs_data):
-        """Update system logs display"""
-        self.logs_text.delete("0.0", "end")
+    def current_user_activity(self):
+        """Return the up-to-date per-user activity table as a dict"""
+        self.log_ingestor.poll()
+        return self.log_ingestor.aggregates.users.as_dict()
+        
+    def show_log_view(self, log_view, keep_position=False):
+        """Swap in a new log view, optionally staying on the same entries"""
+        page = 0
+        if keep_position and self.log_page > 0 and len(self.log_view):
+            anchor = self.log_view.timestamp_at(
+                min(self.log_page * self.log_view.page_size, len(self.log_view) - 1)
+            )
+            page = log_view.page_for_time(anchor)
+        self.log_view = log_view
+        self.show_log_page(page)
+        
+    def show_log_page(self, page):
+        """Render one page of the current log view"""
+        self.log_page = self.log_view.clamp_page(page)
+        self.set_text(self.logs_text, self.format_log_page(self.log_view, self.log_page))
+        self.log_page_label.configure(
+            text=f"Page {self.log_page + 1} of {self.log_view.page_count()}"
+        )
+        
+    def format_log_page(self, log_view, page):
+        """Build system logs text for one page"""
+        entries = log_view.page(page)
         
         logs_text = "📋 COMPLETE SYSTEM ACTIVITY LOGS\n"
         logs_text += "=" * 100 + "\n"
-        logs_text += f"📊 Total Log Entries: {len(logs_data)}\n"
+        logs_text += f"📊 Total Log Entries: {len(log_view)}\n"
+        if entries:
+            logs_text += f"📄 Showing entries {entries[0][0] + 1}-{entries[-1][0] + 1} (newest first)\n"
+        if self.log_filter:
+            logs_text += f"🔍 Filter: {self.log_filter}\n"
         logs_text += f"🕒 Report Generated: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
         logs_text += "=" * 100 + "\n\n"
         
-        # Sort logs by timestamp (newest first)
-        sorted_logs = sorted(logs_data, key=lambda x: x.get('timestamp', ''), reverse=True)
-        
-        for i, log in enumerate(sorted_logs, 1):
+        for position, log in entries:
             timestamp = log.get('timestamp', 'Unknown')
             username = log.get('username', 'Unknown')
             action = log.get('action', 'Unknown')
@@ -647,16 +825,52 @@ class AdminApp:
                 
             action_icon = self.get_action_icon(action)
             
-            logs_text += f"{i:3d}. {action_icon} [{formatted_datetime}] USER: {username}\n"
+            logs_text += f"{position + 1:3d}. {action_icon} [{formatted_datetime}] USER: {username}\n"
             logs_text += f"     ⚡ ACTION: {action}\n"
             logs_text += f"     📝 DETAILS: {details}\n"
             logs_text += "-" * 80 + "\n\n"
             
-        self.logs_text.insert("0.0", logs_text)
+        return logs_text
+        
+    def on_logs_scroll(self, event):
+        """Turn the page when scrolling past the top or bottom of the logs"""
+        top, bottom = self.logs_text.yview()
+        scrolling_down = getattr(event, "num", None) == 5 or getattr(event, "delta", 0) < 0
+        
+        if scrolling_down and bottom >= 1.0 and self.log_page < self.log_view.page_count() - 1:
+            self.show_log_page(self.log_page + 1)
+            self.logs_text.yview_moveto(0.0)
+            return "break"
+        if not scrolling_down and top <= 0.0 and self.log_page > 0:
+            self.show_log_page(self.log_page - 1)
+            self.logs_text.yview_moveto(1.0)
+            return "break"
+            
+    def jump_to_log_time(self):
+        """Show the page containing the given date/time"""
+        text = self.log_jump_entry.get().strip()
+        try:
+            target = datetime.datetime.fromisoformat(text).isoformat()
+        except ValueError:
+            messagebox.showwarning("Invalid Time", "Enter a time as YYYY-MM-DD or YYYY-MM-DD HH:MM[:SS]")
+            return
+        self.show_log_page(self.log_view.page_for_time(target))
+        self.update_status(f"🕒 Jumped to {text}")
+        
+    def load_log_view(self):
+        """Build the (optionally filtered) log view from the log index
+
+        The view holds ids and timestamps only; each page is read from
+        storage when it is shown.
+        """
+        return self.log_index.view(self.log_filter)
         
     def update_files_display(self, files_data):
         """Update file tracking display"""
-        self.files_text.delete("0.0", "end")
+        self.set_text(self.files_text, self.format_files_display(files_data))
+        
+    def format_files_display(self, files_data):
+        """Build file tracking tab text"""
         
         files_text = "📁 FILE ACCESS MONITORING REPORT\n"
         files_text += "=" * 100 + "\n"
@@ -690,11 +904,14 @@ class AdminApp:
                     
                 files_text += "-" * 70 + "\n\n"
                 
-        self.files_text.insert("0.0", files_text)
+        return files_text
         
     def update_encryption_activity_display(self, encryption_data):
         """Update encryption activity display"""
-        self.encryption_activity_text.delete("0.0", "end")
+        self.set_text(self.encryption_activity_text, self.format_encryption_activity_display(encryption_data))
+        
+    def format_encryption_activity_display(self, encryption_data):
+        """Build encryption activity tab text"""
         
         activity_text = "🔐 ENCRYPTION/DECRYPTION ACTIVITY MONITOR\n"
         activity_text += "=" * 100 + "\n"
@@ -760,83 +977,97 @@ class AdminApp:
                 activity_text += f"    🆔 Session: {session_id}\n"
                 activity_text += "-" * 60 + "\n\n"
                 
-        self.encryption_activity_text.insert("0.0", activity_text)
+        return activity_text
         
     def refresh_users(self):
         """Refresh users tab"""
-        users_data = load_json_file("data/users_data.json")
-        self.update_users_display(users_data)
-        self.update_status("👥 User data refreshed")
+        # The refresh worker brings the activity table up to date before rendering
+        self.refresh_data(status_message="👥 User data refreshed")
         
     def refresh_logs(self):
         """Refresh logs tab"""
-        logs_data = load_json_file("data/system_logs.json")
-        self.update_logs_display(logs_data)
-        self.update_status("📋 System logs refreshed")
+        # The refresh worker rebuilds the visible tab, keeping the current position
+        self.refresh_data(status_message="📋 System logs refreshed")
         
     def refresh_files(self):
         """Refresh files tab"""
-        files_data = load_json_file("data/files_data.json")
-        self.update_files_display(files_data)
-        self.update_status("📁 File tracking data refreshed")
+        self.refresh_data(status_message="📁 File tracking data refreshed")
         
     def refresh_encryption_activity(self):
         """Refresh encryption activity tab"""
-        encryption_data = load_json_file("data/encryption_activity.json")
-        self.update_encryption_activity_display(encryption_data)
-        self.update_status("🔐 Encryption activity refreshed")
+        self.refresh_data(status_message="🔐 Encryption activity refreshed")
         
     def show_log_filter(self):
         """Show log filtering options"""
         filter_window = ctk.CTkToplevel(self.root)
         filter_window.title("Log Filter")
-        filter_window.geometry("400x300")
+        filter_window.geometry("400x420")
         filter_window.transient(self.root)
         filter_window.grab_set()
         
         # Center the filter window
         filter_window.update_idletasks()
         x = (filter_window.winfo_screenwidth() // 2) - (200)
-        y = (filter_window.winfo_screenheight() // 2) - (150)
-        filter_window.geometry(f"400x300+{x}+{y}")
+        y = (filter_window.winfo_screenheight() // 2) - (210)
+        filter_window.geometry(f"400x420+{x}+{y}")
         
         # Filter options
         ctk.CTkLabel(filter_window, text="🔍 Log Filter Options", 
                     font=ctk.CTkFont(size=16, weight="bold")).pack(pady=20)
         
         # User filter
-        ctk.CTkLabel(filter_window, text="Filter by User:").pack(anchor="w", padx=20)
+        ctk.CTkLabel(filter_window, text="Filter by User (names starting with):").pack(anchor="w", padx=20)
         user_entry = ctk.CTkEntry(filter_window, placeholder_text="Enter username or leave empty")
         user_entry.pack(fill="x", padx=20, pady=(5, 15))
         
         # Action filter
-        ctk.CTkLabel(filter_window, text="Filter by Action:").pack(anchor="w", padx=20)
+        ctk.CTkLabel(filter_window, text="Filter by Action (actions starting with):").pack(anchor="w", padx=20)
         action_entry = ctk.CTkEntry(filter_window, placeholder_text="Enter action type or leave empty")
         action_entry.pack(fill="x", padx=20, pady=(5, 15))
         
+        # Free-form query
+        ctk.CTkLabel(filter_window, text="Query:").pack(anchor="w", padx=20)
+        query_entry = ctk.CTkEntry(filter_window, placeholder_text='e.g. action:login* time:2024-05 -"wrong password"')
+        query_entry.pack(fill="x", padx=20, pady=(5, 5))
+        if self.log_filter:
+            query_entry.insert(0, self.log_filter)
+        ctk.CTkLabel(filter_window, text="user:, action: (trailing * for prefix), time:A..B,\n"
+                     "words in details, AND / OR / NOT, ( )",
+                     font=ctk.CTkFont(size=11), justify="left").pack(anchor="w", padx=20, pady=(0, 10))
+        
         # Apply filter button
         def apply_filter():
-            user_filter = user_entry.get().strip()
-            action_filter = action_entry.get().strip()
-            self.apply_log_filter(user_filter, action_filter)
-            filter_window.destroy()
+            terms = []
+            for field, entry in (("user", user_entry), ("action", action_entry)):
+                value = entry.get().strip()
+                if value:
+                    # Quoted, so any characters are taken literally; still a prefix match
+                    terms.append(f"{field}:{quote_value(value)}*")
+            query = query_entry.get().strip()
+            if query:
+                terms.append(f"({query})" if terms else query)
+            if self.apply_log_filter(" ".join(terms)):
+                filter_window.destroy()
             
         apply_button = ctk.CTkButton(filter_window, text="Apply Filter", command=apply_filter)
         apply_button.pack(pady=20)
         
-    def apply_log_filter(self, user_filter, action_filter):
-        """Apply filters to log display"""
-        logs_data = load_json_file("data/system_logs.json")
-        
-        # Filter logs
-        filtered_logs = logs_data
-        if user_filter:
-            filtered_logs = [log for log in filtered_logs if user_filter.lower() in log.get('username', '').lower()]
-        if action_filter:
-            filtered_logs = [log for log in filtered_logs if action_filter.lower() in log.get('action', '').lower()]
+    def apply_log_filter(self, query):
+        """Apply a log query to the log display; returns False if it is invalid"""
+        try:
+            # Only parse here; the search itself runs on the refresh worker
+            parse_query(query)
+        except QueryError as e:
+            messagebox.showerror("Invalid Filter", str(e))
+            return False
             
-        self.update_logs_display(filtered_logs)
-        self.update_status(f"🔍 Filter applied: {len(filtered_logs)} of {len(logs_data)} logs shown")
+        # Kept so auto-refresh re-applies the filter instead of resetting it
+        self.log_filter = query
+        # Rebuild the log view and start it from the newest entries
+        self.shown_versions.pop("log_view", None)
+        self.log_page = 0
+        self.refresh_data(status_message=f"🔍 Filter applied: {query or 'none'}", full=False)
+        return True
         
     def clear_logs(self):
         """Clear all system logs with confirmation"""
@@ -852,18 +1083,14 @@ class AdminApp:
         
         if result:
             try:
-                # Backup logs before clearing
+                # Move the logs into a backup directory; sealed segments are
+                # already compressed, so they are moved rather than rewritten
                 timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                backup_filename = f"logs_backup_{timestamp}.json"
-                
-                logs_data = load_json_file("data/system_logs.json")
-                save_json_file(f"data/backups/{backup_filename}", logs_data)
-                
-                # Clear logs
-                save_json_file("data/system_logs.json", [])
+                backup_filename = f"logs_backup_{timestamp}"
+                archived_count = self.storage.archive_events(SYSTEM_LOGS, f"data/backups/{backup_filename}")
                 
                 # Log the clearing action
-                log_event(self.username, "admin_clear_logs", f"All system logs cleared by admin (backup saved as {backup_filename})")
+                log_event(self.username, "admin_clear_logs", f"All system logs cleared by admin ({archived_count} entries backed up to {backup_filename})")
                 
                 # Refresh display
                 self.refresh_data()
@@ -872,7 +1099,7 @@ class AdminApp:
                 self.tools_output_text.insert("0.0", 
                     f"✅ LOGS CLEARED SUCCESSFULLY\n"
                     f"🕒 Time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                    f"💾 Backup saved: {backup_filename}\n"
+                    f"💾 Backup saved: {backup_filename} ({archived_count} entries)\n"
                     f"🗑️ All previous logs have been permanently deleted.\n"
                     f"📊 System logs reset to zero entries."
                 )
@@ -886,153 +1113,196 @@ class AdminApp:
                 self.update_status("❌ Log clearing failed")
                 
     def export_data(self):
-        """Export all system data to JSON file"""
-        try:
-            # Load all data
-            users_data = load_json_file("data/users_data.json")
-            logs_data = load_json_file("data/system_logs.json")
-            files_data = load_json_file("data/files_data.json")
-            encryption_data = load_json_file("data/encryption_activity.json")
-            
-            # Create comprehensive export data structure
-            export_data = {
-                "export_info": {
-                    "exported_by": self.username,
-                    "export_timestamp": datetime.datetime.now().isoformat(),
-                    "system_name": "SecureVault",
-                    "version": "1.0",
-                    "export_type": "complete_system_backup"
-                },
-                "system_statistics": {
-                    "total_users": len(users_data),
-                    "total_logs": len(logs_data),
-                    "total_files_tracked": len(files_data),
-                    "total_encryption_operations": len(encryption_data),
-                    "admin_users": len([u for u in users_data.values() if u.get('role') == 'admin']),
-                    "regular_users": len([u for u in users_data.values() if u.get('role') == 'user'])
-                },
-                "users_data": users_data,
-                "system_logs": logs_data,
-                "files_data": files_data,
-                "encryption_activity": encryption_data
-            }
+        """Export system data, streamed to a file on a background job"""
+        if self.export_jobs.active_jobs():
+            messagebox.showinfo("Export Running", "An export is already in progress.")
+            return
             
-            # Ask user for save location
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            default_filename = f"securevault_complete_export_{timestamp}.json"
+        # Ask user for save location; the extension picks the format
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        default_filename = f"securevault_complete_export_{timestamp}.json"
+        filetypes = [
+            ("JSON files", "*.json"), ("NDJSON files", "*.ndjson"), ("CSV files", "*.csv")
+        ]
+        if PARQUET_FORMAT in available_formats():
+            filetypes.append(("Parquet files", "*.parquet"))
+        
+        file_path = filedialog.asksaveasfilename(
+            title="Export Complete System Data",
+            defaultextension=".json",
+            filetypes=filetypes + [("All files", "*.*")],
+            initialfile=default_filename
+        )
+        if not file_path:
+            return
             
-            file_path = filedialog.asksaveasfilename(
-                title="Export Complete System Data",
-                defaultextension=".json",
-                filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
-                initialname=default_filename
-            )
+        filter_text = ctk.CTkInputDialog(
+            title="Export Filter",
+            text="Optional filter, e.g. user:alice time:2024-05-01..2024-05-07\n(leave empty to export everything)"
+        ).get_input()
+        if filter_text is None:
+            return
+        try:
+            start, end, username = parse_export_filter(filter_text)
+        except QueryError as e:
+            messagebox.showerror("Export Error", f"Invalid filter: {e}")
+            return
             
-            if file_path:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(export_data, f, indent=2, ensure_ascii=False)
-                
-                log_event(self.username, "admin_export_data", f"Complete system data exported to: {file_path}")
+        def start_export(user_activity, error):
+            if error is not None:
+                messagebox.showerror("Export Error", f"Failed to export data: {error}")
+                self.update_status("❌ Data export failed")
+                return
                 
-                self.tools_output_text.delete("0.0", "end")
-                self.tools_output_text.insert("0.0", 
-                    f"✅ COMPLETE DATA EXPORT SUCCESSFUL\n"
-                    f"🕒 Time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                    f"📁 File: {file_path}\n"
-                    f"📊 Export Contents:\n"
-                    f"   • Users: {len(users_data)} accounts\n"
-                    f"   • Logs: {len(logs_data)} entries\n"
-                    f"   • Files: {len(files_data)} tracked\n"
-                    f"   • Encryption Ops: {len(encryption_data)} operations\n\n"
-                    f"💾 All system data successfully exported!"
+            def work(job):
+                return export_records(
+                    file_path, start=start, end=end, username=username, user_activity=user_activity,
+                    exported_by=self.username, storage=self.storage, progress=job.report
                 )
                 
-                messagebox.showinfo("Export Complete", 
-                    f"✅ Complete system data exported successfully!\n\n"
-                    f"📁 Location: {file_path}\n"
-                    f"📊 Contains: {len(users_data)} users, {len(logs_data)} logs, "
-                    f"{len(files_data)} files, {len(encryption_data)} encryption operations"
-                )
-                
-                self.update_status("💾 Complete data export successful")
-                
-        except Exception as e:
-            error_msg = f"Failed to export data: {str(e)}"
-            messagebox.showerror("Export Error", error_msg)
-            log_event(self.username, "admin_export_error", error_msg)
-            self.update_status("❌ Data export failed")
+            self.export_jobs.submit(
+                "Exporting data", work,
+                on_done=lambda job: self.run_on_ui(lambda: self.finish_export(file_path, filter_text, job))
+            )
             
-    def create_backup(self):
-        """Create system backup"""
+        # The activity table belongs to the refresh worker, so snapshot it there
+        self.run_in_worker(self.current_user_activity, start_export)
+        self.update_status("⏳ Export started...")
+        
+    def run_in_worker(self, task, apply):
+        """Run task() on the refresh worker, then apply(result, error) on the UI thread"""
+        self.refresh_worker.submit(task, lambda result, error: self.run_on_ui(lambda: apply(result, error)))
+        
+    def run_on_ui(self, callback):
+        """Schedule callback on the Tk thread (safe to call from worker threads)"""
         try:
-            # Ensure backup directory exists
-            backup_dir = "data/backups"
-            os.makedirs(backup_dir, exist_ok=True)
-            
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_filename = f"system_backup_{timestamp}.json"
-            backup_path = os.path.join(backup_dir, backup_filename)
+            self.root.after(0, callback)
+        except (RuntimeError, tk.TclError):
+            # Window already destroyed
+            pass
             
-            # Create backup data
-            backup_data = {
-                "backup_info": {
-                    "created_by": self.username,
-                    "backup_timestamp": datetime.datetime.now().isoformat(),
-                    "backup_type": "automated_system_backup"
-                },
-                "users_data": load_json_file("data/users_data.json"),
-                "system_logs": load_json_file("data/system_logs.json"),
-                "files_data": load_json_file("data/files_data.json"),
-                "encryption_activity": load_json_file("data/encryption_activity.json")
-            }
+    def on_export_update(self, job):
+        """Export progress changed (worker thread)"""
+        if job.state == RUNNING and job.done_bytes:
+            self.run_on_ui(lambda: self.status_label.configure(
+                text=f"⏳ Exporting data... {job.done_bytes:,} records written"
+            ))
             
-            # Save backup
-            with open(backup_path, 'w', encoding='utf-8') as f:
-                json.dump(backup_data, f, indent=2, ensure_ascii=False)
-                
-            log_event(self.username, "admin_create_backup", f"System backup created: {backup_filename}")
+    def finish_export(self, file_path, filter_text, job):
+        """Report a finished export job (runs on the UI thread)"""
+        if job.state == CANCELLED:
+            self.update_status("✖ Data export cancelled")
+            return
+        if job.state != DONE:
+            error_msg = f"Failed to export data: {job.error}"
+            messagebox.showerror("Export Error", error_msg)
+            log_event(self.username, "admin_export_error", error_msg)
+            self.update_status("❌ Data export failed")
+            return
             
-            self.tools_output_text.delete("0.0", "end")
-            self.tools_output_text.insert("0.0", 
-                f"✅ SYSTEM BACKUP CREATED\n"
-                f"🕒 Time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                f"📁 File: {backup_filename}\n"
-                f"📂 Location: {backup_path}\n\n"
-                f"💾 Complete system state backed up successfully!"
-            )
+        result = job.result
+        counts = result["sections"]
+        filter_note = f" (filter: {filter_text.strip()})" if filter_text.strip() else ""
+        log_event(self.username, "admin_export_data", f"System data exported to: {file_path}{filter_note}")
+        
+        self.tools_output_text.delete("0.0", "end")
+        self.tools_output_text.insert("0.0", 
+            f"✅ COMPLETE DATA EXPORT SUCCESSFUL\n"
+            f"🕒 Time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"📁 Files: {', '.join(result['paths'])}\n"
+            f"🗂️ Format: {result['format'].upper()}{filter_note}\n"
+            f"📊 Export Contents:\n"
+            f"   • Users: {counts.get('users_data', 0)} accounts\n"
+            f"   • Logs: {counts.get('system_logs', 0)} entries\n"
+            f"   • Files: {counts.get('files_data', 0)} tracked\n"
+            f"   • Encryption Ops: {counts.get('encryption_activity', 0)} operations\n"
+            f"⏱️ Took {result['seconds']}s\n\n"
+            f"💾 All system data successfully exported!"
+        )
+        
+        messagebox.showinfo("Export Complete", 
+            f"✅ System data exported successfully!\n\n"
+            f"📁 Location: {file_path}\n"
+            f"📊 Contains: {counts.get('users_data', 0)} users, {counts.get('system_logs', 0)} logs, "
+            f"{counts.get('files_data', 0)} files, {counts.get('encryption_activity', 0)} encryption operations"
+        )
+        
+        self.update_status("💾 Complete data export successful")
             
-            self.update_status(f"💾 Backup created: {backup_filename}")
+    def create_backup(self):
+        """Create system backup"""
+        # Chunking and compressing every store takes a while, so it runs as a job
+        def work(job):
+            # Only chunks that changed since the last backup are written
+            return create_incremental_backup(created_by=self.username, storage=self.storage)
             
-        except Exception as e:
-            error_msg = f"Backup creation failed: {str(e)}"
+        self.export_jobs.submit(
+            "Creating backup", work,
+            on_done=lambda job: self.run_on_ui(lambda: self.finish_backup(job))
+        )
+        self.update_status("⏳ Creating backup...")
+        
+    def finish_backup(self, job):
+        """Report a finished backup job (runs on the UI thread)"""
+        if job.state == CANCELLED:
+            self.update_status("✖ Backup cancelled")
+            return
+        if job.state != DONE:
+            error_msg = f"Backup creation failed: {job.error}"
             messagebox.showerror("Backup Error", error_msg)
             self.update_status("❌ Backup creation failed")
+            return
+            
+        summary = job.result
+        backup_path = summary["path"]
+        backup_filename = os.path.basename(backup_path)
+        record_count = sum(summary["sections"].values())
+        
+        log_event(self.username, "admin_create_backup", f"System backup created: {backup_filename}")
+        
+        self.tools_output_text.delete("0.0", "end")
+        self.tools_output_text.insert("0.0", 
+            f"✅ SYSTEM BACKUP CREATED\n"
+            f"🕒 Time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"📁 File: {backup_filename}\n"
+            f"📂 Location: {backup_path}\n"
+            f"🧩 Chunks: {summary['new_chunks']} new of {summary['chunks']} "
+            f"({summary['bytes_written'] / 1024:.1f} KB written, {record_count} records)\n\n"
+            f"💾 Complete system state backed up successfully!"
+        )
+        
+        self.update_status(f"💾 Backup created: {backup_filename}")
             
     def show_system_info(self):
         """Show detailed system information"""
-        try:
-            # Gather system information
-            users_data = load_json_file("data/users_data.json")
-            logs_data = load_json_file("data/system_logs.json")
-            files_data = load_json_file("data/files_data.json")
-            encryption_data = load_json_file("data/encryption_activity.json")
-            
-            # Calculate detailed statistics
-            admin_count = len([u for u in users_data.values() if u.get('role') == 'admin'])
-            user_count = len([u for u in users_data.values() if u.get('role') == 'user'])
-            
-            # Get date ranges
-            if logs_data:
-                log_dates = [log.get('timestamp', '') for log in logs_data if log.get('timestamp')]
-                if log_dates:
-                    first_log = min(log_dates)
-                    last_log = max(log_dates)
-                else:
-                    first_log = last_log = "N/A"
-            else:
-                first_log = last_log = "N/A"
-            
-            system_info = f"""🖥️ SECUREVAULT SYSTEM INFORMATION
+        # Gathered on the refresh worker, which owns the log aggregates
+        self.run_in_worker(self.build_system_info, self.display_system_info)
+        
+    def build_system_info(self):
+        """Build the system information report (runs on the refresh worker thread)"""
+        # Gather system information
+        users_data = self.storage.load_document(USERS)
+        files_data = self.storage.load_document(FILES)
+        self.log_ingestor.poll()
+        self.encryption_ingestor.poll()
+        log_stats = self.log_ingestor.aggregates
+        activity = log_stats.users.as_dict()
+        
+        # Calculate detailed statistics
+        admin_count = len([u for u in users_data.values() if u.get('role') == 'admin'])
+        user_count = len([u for u in users_data.values() if u.get('role') == 'user'])
+        
+        # Get date ranges from the per-user first/last seen times
+        first_seen = [row['first_seen'] for row in activity.values() if row['first_seen']]
+        last_seen = [row['last_seen'] for row in activity.values() if row['last_seen']]
+        first_log = min(first_seen) if first_seen else "N/A"
+        last_log = max(last_seen) if last_seen else "N/A"
+        
+        most_active = ""
+        for username, row in log_stats.users.most_active(5):
+            most_active += f"\n   👤 {username}: {row['events']} events (last seen {row['last_seen'] or 'N/A'})"
+        
+        system_info = f"""🖥️ SECUREVAULT SYSTEM INFORMATION
 {'=' * 80}
 🕒 Generated: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 👨‍💼 Requested by: {self.username}
@@ -1044,14 +1314,16 @@ class AdminApp:
    👤 Regular Users: {user_count}
 
 📋 Activity Statistics:
-   📝 Total Log Entries: {len(logs_data)}
+   📝 Total Log Entries: {log_stats.total}
    📁 Files Tracked: {len(files_data)}
-   🔐 Encryption Operations: {len(encryption_data)}
+   🔐 Encryption Operations: {self.encryption_ingestor.aggregates.total}
 
 📅 System Timeline:
    🎯 First Activity: {first_log}
    🕒 Latest Activity: {last_log}
 
+🏆 Most Active Users:{most_active or chr(10) + '   No activity recorded'}
+
 🔧 SYSTEM HEALTH:
 {'.' * 40}
 📁 Data Directory: ✅ Operational
@@ -1061,31 +1333,47 @@ class AdminApp:
 
 💾 STORAGE INFORMATION:
 {'.' * 40}"""
+        
+        try:
+            # File sizes
+            users_size = os.path.getsize("data/users_data.json")
+            logs_size = os.path.getsize(SYSTEM_LOG_FILE)
+            files_size = os.path.getsize("data/files_data.json")
             
-            try:
-                # File sizes
-                users_size = os.path.getsize("data/users_data.json")
-                logs_size = os.path.getsize("data/system_logs.json")
-                files_size = os.path.getsize("data/files_data.json")
-                
-                system_info += f"""
+            system_info += f"""
 📁 users_data.json: {users_size} bytes
-📋 system_logs.json: {logs_size} bytes  
+📋 system_logs.jsonl: {logs_size} bytes  
 📂 files_data.json: {files_size} bytes
 📊 Total Data Size: {users_size + logs_size + files_size} bytes"""
-            except:
-                system_info += "\n📊 File size information unavailable"
-                
-            self.tools_output_text.delete("0.0", "end")
-            self.tools_output_text.insert("0.0", system_info)
-            
-            self.update_status("ℹ️ System information displayed")
-            
-        except Exception as e:
-            error_msg = f"Failed to generate system info: {str(e)}"
+        except:
+            system_info += "\n📊 File size information unavailable"
+
+        # Read cache effectiveness (JSON backend only)
+        cache = getattr(self.storage, "cache", None)
+        if cache is not None:
+            cache_stats = cache.stats()
+            system_info += f"""
+
+🧠 READ CACHE:
+{'.' * 40}
+✅ Hits: {cache_stats['hits']} | ❌ Misses: {cache_stats['misses']} | 📈 Hit Rate: {cache_stats['hit_rate']:.1%}
+📦 Cached Files: {cache_stats['entries']} ({cache_stats['bytes']} / {cache_stats['max_bytes']} bytes)
+🗑️ Evictions: {cache_stats['evictions']}"""
+        return system_info
+        
+    def display_system_info(self, system_info, error):
+        """Show a finished system information report (UI thread only)"""
+        if error is not None:
+            error_msg = f"Failed to generate system info: {str(error)}"
             messagebox.showerror("System Info Error", error_msg)
             self.update_status("❌ System info generation failed")
+            return
             
+        self.tools_output_text.delete("0.0", "end")
+        self.tools_output_text.insert("0.0", system_info)
+        
+        self.update_status("ℹ️ System information displayed")
+        
     def update_status(self, message):
         """Update status bar"""
         self.status_label.configure(text=message)
@@ -1096,6 +1384,8 @@ class AdminApp:
         """Logout and return to login screen"""
         # Stop auto-refresh
         self.auto_refresh = False
+        self.stop_auto_refresh()
+        self.refresh_worker.stop()
         
         # Log detailed logout information
         session_duration = datetime.datetime.now()
@@ -1111,6 +1401,7 @@ class AdminApp:
         
     def _complete_logout(self):
         """Complete the logout process"""
+        self.export_jobs.shutdown()
         self.root.destroy()
         
         # Restart main application
@@ -1132,11 +1423,14 @@ class AdminApp:
     def on_closing(self):
         """Handle window closing event"""
         self.auto_refresh = False
+        self.stop_auto_refresh()
+        self.refresh_worker.stop()
         log_event(
             self.username, 
             "admin_window_closed", 
             f"Admin dashboard closed by {self.username}"
         )
+        self.export_jobs.shutdown()
         self.root.destroy()
 
 if __name__ == "__main__":
@@ -0,0 +1,423 @@
+"""Streaming, compressed system backups
+
+Usage:
+    python backup_archive.py create [--out data/backups/x.svbk] [--codec gzip]
+    python backup_archive.py list data/backups/system_backup_20240501_120000.svbk
+    python backup_archive.py verify data/backups/system_backup_20240501_120000.svbk
+    python backup_archive.py extract data/backups/system_backup_20240501_120000.svbk system_logs > logs.jsonl
+    python backup_archive.py restore data/backups/system_backup_20240501_120000.svbk [--section users_data]
+
+A backup file is a header, one independently compressed section per store
+and a JSON index at the end:
+
+    SVBACKUP 1\\n | section | section | ... | index JSON | index length (8 bytes) | SVBKIDX1
+
+Each section holds one JSON record per line (events as-is, document records
+as [key, record] pairs), compressed with zstd when the zstandard package is
+installed and gzip otherwise. The index records each section's offset,
+length, record count and SHA-256 of its compressed bytes, so a single
+section can be streamed back and checked without reading the others.
+Records are written and read in batches, so memory use does not grow with
+the size of the stores.
+"""
+import os
+import sys
+import json
+import struct
+import hashlib
+import datetime
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    # Optional; backups fall back to gzip
+    zstandard = None
+
+import key_ring
+from storage import get_storage, USERS, FILES, SYSTEM_LOGS, ENCRYPTION_ACTIVITY, KEY_RING
+
+BACKUP_DIR = "data/backups"
+BACKUP_FILE_NAME = "system_backup_{timestamp}.svbk"
+BACKUP_MAGIC = b"SVBACKUP 1\n"
+INDEX_MAGIC = b"SVBKIDX1"
+INDEX_FOOTER = struct.Struct(">Q")
+BACKUP_VERSION = 1
+
+ZSTD = "zstd"
+GZIP = "gzip"
+DEFAULT_CODEC = ZSTD if zstandard is not None else GZIP
+COMPRESS_LEVELS = {ZSTD: 3, GZIP: 6}
+
+# Serialized records are compressed in batches of about this many bytes
+BACKUP_BATCH_BYTES = 1 << 20
+# Bytes read from the file per step when streaming a section back
+BACKUP_READ_SIZE = 1 << 20
+# Events appended per storage call when restoring
+RESTORE_BATCH_SIZE = 10000
+
+DOCUMENT = "document"
+EVENTS = "events"
+# Section name -> (kind, storage name); names match the old JSON backup keys
+BACKUP_SECTIONS = {
+    "users_data": (DOCUMENT, USERS),
+    "system_logs": (EVENTS, SYSTEM_LOGS),
+    "files_data": (DOCUMENT, FILES),
+    "encryption_activity": (EVENTS, ENCRYPTION_ACTIVITY),
+    # Rotated key versions, wrapped with the local master key (which is not
+    # backed up); without them restored v2+ files can't be decrypted
+    "key_ring": (DOCUMENT, KEY_RING),
+}
+
+
+class BackupIntegrityError(ValueError):
+    """A backup section does not match the checksum or count in its index"""
+
+
+def _compressor(codec, level=None):
+    level = COMPRESS_LEVELS[codec] if level is None else level
+    if codec == ZSTD:
+        if zstandard is None:
+            raise ValueError("zstd backups need the zstandard package")
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    if codec == GZIP:
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+    raise ValueError(f"Unknown backup codec: {codec}")
+
+
+def _decompressor(codec):
+    if codec == ZSTD:
+        if zstandard is None:
+            raise ValueError("This backup is zstd-compressed; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompressobj()
+    if codec == GZIP:
+        return zlib.decompressobj(47)
+    raise ValueError(f"Unknown backup codec: {codec}")
+
+
+def compress_bytes(codec, data, level=None):
+    compressor = _compressor(codec, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress_bytes(codec, data):
+    return _decompressor(codec).decompress(data)
+
+
+def encode_record(record):
+    """One backup line: compact JSON and a trailing newline"""
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class BackupWriter:
+    """Write a backup section by section to a temporary file, then move it into place"""
+
+    def __init__(self, path, codec=None, level=None):
+        self.path = path
+        self.codec = codec or DEFAULT_CODEC
+        self.level = level
+        self.sections = []
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._tmp_path = f"{path}.tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(BACKUP_MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+
+    def write_section(self, name, kind, records):
+        """Compress an iterable of JSON-serializable records as one section"""
+        compressor = _compressor(self.codec, self.level)
+        digest = hashlib.sha256()
+        offset = self._file.tell()
+        count = 0
+        size = 0
+        batch = bytearray()
+
+        def emit(data):
+            if data:
+                digest.update(data)
+                self._file.write(data)
+
+        for record in records:
+            batch += encode_record(record)
+            count += 1
+            if len(batch) >= BACKUP_BATCH_BYTES:
+                size += len(batch)
+                emit(compressor.compress(bytes(batch)))
+                batch.clear()
+        size += len(batch)
+        if batch:
+            emit(compressor.compress(bytes(batch)))
+        emit(compressor.flush())
+
+        section = {
+            "name": name,
+            "kind": kind,
+            "offset": offset,
+            "length": self._file.tell() - offset,
+            "records": count,
+            "size": size,
+            "sha256": digest.hexdigest(),
+        }
+        self.sections.append(section)
+        return section
+
+    def close(self, info=None):
+        """Write the index and atomically publish the backup"""
+        index = json.dumps({
+            "version": BACKUP_VERSION,
+            "codec": self.codec,
+            "info": info or {},
+            "sections": self.sections,
+        }, ensure_ascii=False).encode("utf-8")
+        self._file.write(index)
+        self._file.write(INDEX_FOOTER.pack(len(index)) + INDEX_MAGIC)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class BackupReader:
+    """Random access to the sections of a backup file
+
+    Backups written before the streaming format (one pretty-printed JSON
+    document) are also accepted; they are loaded whole.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._legacy = None
+        with open(path, "rb") as f:
+            if f.read(len(BACKUP_MAGIC)) != BACKUP_MAGIC:
+                self._load_legacy()
+                return
+            f.seek(-(INDEX_FOOTER.size + len(INDEX_MAGIC)), os.SEEK_END)
+            footer = f.read(INDEX_FOOTER.size + len(INDEX_MAGIC))
+            if not footer.endswith(INDEX_MAGIC):
+                raise BackupIntegrityError(f"{path} has no backup index (incomplete write?)")
+            (index_length,) = INDEX_FOOTER.unpack(footer[:INDEX_FOOTER.size])
+            f.seek(-(INDEX_FOOTER.size + len(INDEX_MAGIC) + index_length), os.SEEK_END)
+            index = json.loads(f.read(index_length))
+        if index.get("version") != BACKUP_VERSION:
+            raise ValueError(f"Unsupported backup version: {index.get('version')!r}")
+        self.codec = index["codec"]
+        self.info = index.get("info", {})
+        self.sections = {section["name"]: section for section in index["sections"]}
+
+    def _load_legacy(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            self._legacy = json.load(f)
+        self.codec = None
+        self.info = self._legacy.get("backup_info", {})
+        self.sections = {}
+        for name, (kind, _) in BACKUP_SECTIONS.items():
+            if name in self._legacy:
+                data = self._legacy[name]
+                self.sections[name] = {"name": name, "kind": kind, "records": len(data)}
+
+    def section_kind(self, name):
+        return self._section(name)["kind"]
+
+    def _section(self, name):
+        try:
+            return self.sections[name]
+        except KeyError:
+            raise KeyError(f"Backup has no section {name!r}") from None
+
+    def _iter_chunks(self, section):
+        """Yield the decompressed bytes of a section, checking its checksum at the end"""
+        decompressor = _decompressor(self.codec)
+        digest = hashlib.sha256()
+        remaining = section["length"]
+        with open(self.path, "rb") as f:
+            f.seek(section["offset"])
+            while remaining:
+                data = f.read(min(BACKUP_READ_SIZE, remaining))
+                if not data:
+                    raise BackupIntegrityError(f"Section {section['name']} is truncated")
+                remaining -= len(data)
+                digest.update(data)
+                try:
+                    chunk = decompressor.decompress(data)
+                except Exception as e:
+                    raise BackupIntegrityError(f"Section {section['name']} is corrupt: {e}") from e
+                yield chunk
+        if digest.hexdigest() != section["sha256"]:
+            raise BackupIntegrityError(f"Checksum mismatch in section {section['name']}")
+
+    def iter_lines(self, name):
+        """Yield the raw JSON lines of a section"""
+        section = self._section(name)
+        if self._legacy is not None:
+            for record in self._legacy_records(name):
+                yield json.dumps(record, ensure_ascii=False).encode("utf-8")
+            return
+        count = 0
+        pending = b""
+        for chunk in self._iter_chunks(section):
+            if not chunk:
+                continue
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                count += 1
+                yield line
+        if pending:
+            raise BackupIntegrityError(f"Section {name} ends in a partial record")
+        if count != section["records"]:
+            raise BackupIntegrityError(f"Section {name} has {count} records, index says {section['records']}")
+
+    def iter_records(self, name):
+        """Yield a section's records: events, or (key, record) pairs for documents"""
+        if self._legacy is not None:
+            yield from self._legacy_records(name)
+            return
+        document = self.section_kind(name) == DOCUMENT
+        for line in self.iter_lines(name):
+            record = json.loads(line)
+            yield tuple(record) if document else record
+
+    def _legacy_records(self, name):
+        data = self._legacy[name]
+        return iter(data.items()) if isinstance(data, dict) else iter(data)
+
+    def verify(self, names=None):
+        """Stream through sections and check their checksums and counts; returns records checked"""
+        total = 0
+        for name in names or self.sections:
+            for _ in self.iter_lines(name):
+                total += 1
+        return total
+
+
+def backup_path(timestamp=None):
+    timestamp = timestamp or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(BACKUP_DIR, BACKUP_FILE_NAME.format(timestamp=timestamp))
+
+
+def create_backup(path=None, created_by=None, storage=None, codec=None, level=None):
+    """Stream every store into a compressed backup; returns a summary dict"""
+    storage = storage or get_storage()
+    path = path or backup_path()
+    started = datetime.datetime.now()
+    # Only wrapped keys may reach the backup
+    key_ring.wrap_key_ring(storage)
+    with BackupWriter(path, codec=codec, level=level) as writer:
+        for name, (kind, store) in BACKUP_SECTIONS.items():
+            if kind == DOCUMENT:
+                records = ([key, record] for key, record in storage.iter_document(store))
+            else:
+                records = storage.iter_events(store)
+            writer.write_section(name, kind, records)
+        writer.close({
+            "created_by": created_by,
+            "backup_timestamp": started.isoformat(),
+            "backup_type": "automated_system_backup",
+        })
+    return {
+        "path": path,
+        "codec": writer.codec,
+        "bytes": os.path.getsize(path),
+        "sections": {section["name"]: section["records"] for section in writer.sections},
+        "seconds": round((datetime.datetime.now() - started).total_seconds(), 3),
+    }
+
+
+def restore_records(name, records, storage=None):
+    """Replace the store behind a backup section with records; returns the count"""
+    storage = storage or get_storage()
+    if name not in BACKUP_SECTIONS:
+        raise KeyError(f"Unknown backup section {name!r}")
+    kind, store = BACKUP_SECTIONS[name]
+    if kind == DOCUMENT:
+        # Documents are saved whole, so this section is held in memory
+        data = dict(records)
+        if store == KEY_RING:
+            # Merged rather than replaced: keys made after the backup must survive
+            return key_ring.merge_key_ring(data, storage)
+        storage.save_document(store, data)
+        return len(data)
+    count = 0
+    with storage.restoring_events(store):
+        storage.clear_events(store)
+        batch = []
+        for event in records:
+            batch.append(event)
+            if len(batch) >= RESTORE_BATCH_SIZE:
+                storage.append_events(store, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            storage.append_events(store, batch)
+            count += len(batch)
+    return count
+
+
+def restore_backup(path, sections=None, storage=None):
+    """Replace stores with the contents of a backup; returns records restored per section
+
+    Each section is verified in full before its store is touched, so a
+    damaged section leaves the current data in place.
+    """
+    reader = BackupReader(path)
+    restored = {}
+    for name in sections or reader.sections:
+        reader.verify([name])
+        restored[name] = restore_records(name, reader.iter_records(name), storage)
+    return restored
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create, inspect and restore SecureVault backups")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="Write a backup of every store")
+    create.add_argument("--out", help="Backup path (default: data/backups/system_backup_TIMESTAMP.svbk)")
+    create.add_argument("--codec", choices=[ZSTD, GZIP], default=DEFAULT_CODEC)
+    create.add_argument("--level", type=int, help="Compression level")
+    for command in ("list", "verify"):
+        commands.add_parser(command).add_argument("backup")
+    extract = commands.add_parser("extract", help="Stream one section to stdout as JSON lines")
+    extract.add_argument("backup")
+    extract.add_argument("section", choices=list(BACKUP_SECTIONS))
+    restore = commands.add_parser("restore", help="Replace the current stores with a backup")
+    restore.add_argument("backup")
+    restore.add_argument("--section", action="append", choices=list(BACKUP_SECTIONS),
+                         help="Restore only this section (repeatable)")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "create":
+            print(json.dumps(create_backup(args.out, codec=args.codec, level=args.level), indent=2))
+        elif args.command == "list":
+            reader = BackupReader(args.backup)
+            print(json.dumps({"codec": reader.codec, "info": reader.info,
+                              "sections": list(reader.sections.values())}, indent=2))
+        elif args.command == "verify":
+            print(json.dumps({"backup": args.backup, "records": BackupReader(args.backup).verify()}))
+        elif args.command == "extract":
+            out = sys.stdout.buffer
+            for line in BackupReader(args.backup).iter_lines(args.section):
+                out.write(line + b"\n")
+            out.flush()
+        else:
+            print(json.dumps(restore_backup(args.backup, args.section), indent=2))
+    except (ValueError, KeyError, OSError) as e:
+        print(json.dumps({"backup": getattr(args, "backup", None), "error": str(e)}))
+        sys.exit(2)
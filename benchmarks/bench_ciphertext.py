@@ -0,0 +1,76 @@
+"""Compare ciphertext size and CPU time of the legacy and versioned formats
+
+Usage: python benchmarks/bench_ciphertext.py [--sizes 100 10000 1000000] [--repeat 5]
+"""
+import io
+import os
+import sys
+import time
+import base64
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+import ciphertext
+import file_crypto
+
+
+def legacy_encrypt(fernet, text):
+    return base64.b64encode(fernet.encrypt(text.encode('utf-8'))).decode('utf-8')
+
+
+def legacy_decrypt(fernet, data):
+    return fernet.decrypt(base64.b64decode(data.encode('utf-8'))).decode('utf-8')
+
+
+def binary_encrypt(key, text):
+    out = io.BytesIO()
+    file_crypto.encrypt_stream(key, io.BytesIO(text.encode('utf-8')), out, workers=1)
+    return out.getvalue()
+
+
+def binary_decrypt(key, data):
+    out = io.BytesIO()
+    file_crypto.decrypt_stream(key, io.BytesIO(data), out, workers=1)
+    return out.getvalue().decode('utf-8')
+
+
+def best_time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    key = Fernet.generate_key()
+    fernet = Fernet(key)
+    formats = {
+        "legacy b64(b64)": (lambda t: legacy_encrypt(fernet, t), lambda d: legacy_decrypt(fernet, d)),
+        "text v1": (lambda t: ciphertext.encrypt_text(fernet, t), lambda d: ciphertext.decrypt_text(fernet, d)[0]),
+        "binary .svlt": (lambda t: binary_encrypt(key, t), lambda d: binary_decrypt(key, d)),
+    }
+
+    print(f"{'payload':>10}  {'format':<16}{'size':>12}{'growth':>9}{'encrypt ms':>12}{'decrypt ms':>12}")
+    for size in args.sizes:
+        text = "x" * size
+        for name, (encrypt, decrypt) in formats.items():
+            encrypt_seconds, data = best_time(lambda: encrypt(text), args.repeat)
+            decrypt_seconds, plain = best_time(lambda: decrypt(data), args.repeat)
+            assert plain == text
+            growth = (len(data) - size) / size * 100
+            print(f"{size:>10}  {name:<16}{len(data):>12}{growth:>8.1f}%"
+                  f"{encrypt_seconds * 1000:>12.3f}{decrypt_seconds * 1000:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Measure chunked file encryption throughput as worker threads are added
+
+Usage: python benchmarks/bench_file_crypto.py [--size-mb 1024] [--workers 1 2 4 8] [--chunk-kb 1024]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+import file_crypto
+
+
+class NullSink:
+    """Write target that discards data, so decryption timings exclude disk writes"""
+
+    def write(self, data):
+        return len(data)
+
+
+def default_worker_counts():
+    counts = []
+    workers = 1
+    while workers < (os.cpu_count() or 1):
+        counts.append(workers)
+        workers *= 2
+    counts.append(os.cpu_count() or 1)
+    return counts
+
+
+def write_random_file(path, size_mb):
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        for i in range(size_mb):
+            # Vary each block cheaply so the input isn't one repeated MiB
+            f.write(i.to_bytes(8, "big") + block[8:])
+
+
+def timed(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--workers", type=int, nargs="+", default=default_worker_counts())
+    parser.add_argument("--chunk-kb", type=int, default=file_crypto.FILE_CHUNK_SIZE // 1024)
+    args = parser.parse_args()
+
+    key = Fernet.generate_key()
+    chunk_size = args.chunk_kb * 1024
+    with tempfile.TemporaryDirectory() as workdir:
+        plain_path = os.path.join(workdir, "input.bin")
+        encrypted_path = os.path.join(workdir, "input.bin.svlt")
+        write_random_file(plain_path, args.size_mb)
+
+        print(f"{args.size_mb} MiB input, {args.chunk_kb} KiB chunks, {os.cpu_count()} CPUs")
+        print(f"{'workers':>8}{'encrypt MB/s':>15}{'decrypt MB/s':>15}{'speedup':>10}")
+        baseline = None
+        for workers in args.workers:
+            encrypt_seconds = timed(lambda: file_crypto.encrypt_file(
+                key, plain_path, encrypted_path, chunk_size=chunk_size, workers=workers))
+
+            def decrypt():
+                with open(encrypted_path, "rb") as src:
+                    file_crypto.decrypt_stream(key, src, NullSink(), workers=workers)
+            decrypt_seconds = timed(decrypt)
+
+            encrypt_rate = args.size_mb / encrypt_seconds
+            decrypt_rate = args.size_mb / decrypt_seconds
+            baseline = baseline or encrypt_rate
+            print(f"{workers:>8}{encrypt_rate:>15.1f}{decrypt_rate:>15.1f}{encrypt_rate / baseline:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
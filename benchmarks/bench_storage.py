@@ -0,0 +1,99 @@
+"""Compare the JSON and SQLite storage backends on synthetic event logs
+
+Usage: python benchmarks/bench_storage.py [--sizes 10000 100000 1000000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import event_log
+from log_ingest import LogIngestor
+from log_query import LogIndex
+from storage import create_storage, SYSTEM_LOGS
+
+ACTIONS = [
+    "login", "logout", "file_access", "text_encryption", "text_decryption",
+    "client_session_start", "client_logout", "copy_encrypted"
+]
+USERS = [f"user{i:03d}" for i in range(50)]
+
+
+def generate_events(count):
+    """Yield synthetic log events in timestamp order ending now"""
+    start = datetime.datetime.now() - datetime.timedelta(seconds=count)
+    rng = random.Random(42)
+    for i in range(count):
+        yield {
+            "timestamp": (start + datetime.timedelta(seconds=i)).isoformat(),
+            "username": rng.choice(USERS),
+            "action": rng.choice(ACTIONS),
+            "details": f"Synthetic event {i}"
+        }
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def bench_backend(kind, count):
+    storage = create_storage(kind)
+    results = {}
+
+    def load():
+        batch = []
+        for entry in generate_events(count):
+            batch.append(entry)
+            if len(batch) == 10000:
+                storage.append_events(SYSTEM_LOGS, batch)
+                batch = []
+        if batch:
+            storage.append_events(SYSTEM_LOGS, batch)
+        event_log.flush_all()
+
+    results["bulk insert"], _ = timed(load)
+    results["recent 15"], _ = timed(lambda: storage.recent_events(SYSTEM_LOGS, 15))
+    cutoff = (datetime.datetime.now() - datetime.timedelta(hours=1)).isoformat()
+    results["last hour"], _ = timed(lambda: storage.events_since(SYSTEM_LOGS, cutoff))
+    # What the admin dashboard uses for filtering and per-user summaries
+    index = LogIndex(storage, SYSTEM_LOGS)
+    results["index build"], _ = timed(index.refresh)
+    results["filter user"], _ = timed(lambda: index.match("user:user007"))
+    ingestor = LogIngestor(storage, SYSTEM_LOGS)
+    results["aggregate"], _ = timed(ingestor.poll)
+    results["user summary"], _ = timed(lambda: ingestor.aggregates.users.get("user007"))
+    results["full read"], _ = timed(lambda: storage.read_events(SYSTEM_LOGS))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10 ** 4, 10 ** 5, 10 ** 6])
+    args = parser.parse_args()
+
+    original_cwd = os.getcwd()
+    for count in args.sizes:
+        print(f"\n=== {count:,} events ===")
+        rows = {}
+        for kind in ("json", "sqlite"):
+            with tempfile.TemporaryDirectory() as workdir:
+                os.chdir(workdir)
+                try:
+                    rows[kind] = bench_backend(kind, count)
+                finally:
+                    os.chdir(original_cwd)
+
+        print(f"{'operation':<14}{'json (s)':>12}{'sqlite (s)':>12}")
+        for op in rows["json"]:
+            print(f"{op:<14}{rows['json'][op]:>12.4f}{rows['sqlite'][op]:>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
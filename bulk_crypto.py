@@ -0,0 +1,310 @@
+"""Headless bulk encryption and decryption of directory trees
+
+Usage:
+    python bulk_crypto.py encrypt SOURCE_DIR DEST_DIR --user alice [--workers 8] [--hash]
+    python bulk_crypto.py decrypt SOURCE_DIR DEST_DIR --user alice
+
+Every file under SOURCE_DIR is written to the same relative path under
+DEST_DIR (with ENCRYPTED_FILE_SUFFIX added on encrypt and removed on
+decrypt). A manifest in DEST_DIR records each source file's size and mtime
+(and SHA-256 with --hash), so re-running the same command only processes
+new or changed files. A JSON summary is printed to stdout, and the run is
+logged once at the end rather than once per file.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import file_crypto
+from file_crypto import ENCRYPTED_FILE_SUFFIX
+from file_lock import atomic_write_json
+from key_cache import default_key_cache
+from key_ring import current_key_version, find_file_key_version
+from storage import get_storage, log_event, ENCRYPTION_ACTIVITY
+
+ENCRYPT = "encrypt"
+DECRYPT = "decrypt"
+
+# Manifest written into the destination tree (never treated as an input)
+MANIFEST_FILE_NAME = ".securevault-manifest.json"
+MANIFEST_VERSION = 1
+# Seconds between manifest checkpoints, so an interrupted run keeps its progress
+MANIFEST_SAVE_INTERVAL = 30
+# Files queued per worker; bounds memory when walking very large trees
+BULK_QUEUE_PER_WORKER = 4
+# Most per-file errors included in the summary (the counts are always exact)
+SUMMARY_MAX_ERRORS = 100
+BULK_WORKERS = file_crypto.FILE_CRYPTO_WORKERS
+
+
+def file_digest(path):
+    """Hex SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_source_files(source_dir, operation, exclude=()):
+    """Yield (relative_path, DirEntry) for every input file under source_dir
+
+    Directories in exclude (absolute paths, e.g. a destination nested inside
+    the source) are not descended into. Symlinks are not followed.
+    """
+    exclude = {os.path.abspath(path) for path in exclude}
+    pending = [os.path.abspath(source_dir)]
+    root = pending[0]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.path not in exclude:
+                            pending.append(entry.path)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    name = entry.name
+                    if name == MANIFEST_FILE_NAME or name.endswith(".part"):
+                        continue
+                    # Encrypt leaves existing .svlt files alone; decrypt only takes them
+                    if name.endswith(ENCRYPTED_FILE_SUFFIX) != (operation == DECRYPT):
+                        continue
+                    yield os.path.relpath(entry.path, root), entry
+        except OSError as e:
+            print(f"Debug - Cannot scan {directory}: {e}", file=sys.stderr)
+
+
+def output_relpath(relpath, operation):
+    if operation == ENCRYPT:
+        return relpath + ENCRYPTED_FILE_SUFFIX
+    return relpath[:-len(ENCRYPTED_FILE_SUFFIX)]
+
+
+class BulkManifest:
+    """Per-file signatures of inputs already processed into a destination tree
+
+    An input is skipped when its size and mtime match the recorded ones; with
+    use_hash, a file whose mtime changed but whose content hash didn't (a
+    touch or a copy) is skipped too. A manifest written for the other
+    operation is ignored.
+    """
+
+    def __init__(self, path, operation, use_hash=False):
+        self.path = path
+        self.operation = operation
+        self.use_hash = use_hash
+        self._lock = threading.Lock()
+        self._last_save = time.monotonic()
+        self.files = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION and data.get("operation") == operation:
+                self.files = data.get("files", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Debug - Ignoring unreadable manifest {path}: {e}", file=sys.stderr)
+
+    def is_current(self, relpath, stat, output_path):
+        """True if the input is unchanged since it was last processed"""
+        record = self.files.get(relpath)
+        if record is None or record.get("size") != stat.st_size or not os.path.exists(output_path):
+            return False
+        return record.get("mtime_ns") == stat.st_mtime_ns
+
+    def hash_matches(self, relpath, digest):
+        record = self.files.get(relpath)
+        return record is not None and digest is not None and record.get("sha256") == digest
+
+    def record(self, relpath, stat, digest=None):
+        entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if digest is not None:
+            entry["sha256"] = digest
+        with self._lock:
+            self.files[relpath] = entry
+
+    def save(self, force=True):
+        """Write the manifest atomically (or only if MANIFEST_SAVE_INTERVAL has passed)"""
+        now = time.monotonic()
+        if not force and now - self._last_save < MANIFEST_SAVE_INTERVAL:
+            return
+        with self._lock:
+            self._last_save = now
+            data = {"version": MANIFEST_VERSION, "operation": self.operation, "files": dict(self.files)}
+        atomic_write_json(self.path, data)
+
+
+def _process_file(operation, key_for, source_path, output_path, relpath, stat, manifest):
+    """Encrypt or decrypt one file; returns ("processed"|"skipped", bytes_read, bytes_written)
+
+    key_for(source_path) returns the key to use for that file.
+    """
+    digest = None
+    if manifest.use_hash:
+        # Content unchanged since the last run (touched or copied): nothing to do
+        digest = file_digest(source_path)
+        if manifest.hash_matches(relpath, digest) and os.path.exists(output_path):
+            manifest.record(relpath, stat, digest)
+            return "skipped", 0, 0
+    transform = file_crypto.encrypt_file if operation == ENCRYPT else file_crypto.decrypt_file
+    # Parallelism is across files; each small file is handled by one worker
+    bytes_read, bytes_written = transform(key_for(source_path), source_path, output_path, workers=1)
+    manifest.record(relpath, stat, digest)
+    return "processed", bytes_read, bytes_written
+
+
+def run_bulk(operation, source_dir, dest_dir, username, workers=None, manifest_path=None,
+             use_hash=False, key_cache=default_key_cache):
+    """Encrypt or decrypt every file under source_dir into dest_dir; returns a summary dict"""
+    if operation not in (ENCRYPT, DECRYPT):
+        raise ValueError(f"Unknown operation {operation!r}")
+    if not os.path.isdir(source_dir):
+        raise ValueError(f"Source directory does not exist: {source_dir}")
+    workers = max(1, workers or BULK_WORKERS)
+    if operation == ENCRYPT:
+        encrypt_key = key_cache.key(username, current_key_version(username))
+        key_for = lambda path: encrypt_key
+    else:
+        # Files may still be under any unretired version after a partial rotation
+        def key_for(path):
+            _, key = find_file_key_version(username, path, key_cache)
+            if key is None:
+                raise file_crypto.StreamIntegrityError(
+                    "No key version of this user opens the file (retired key, other user or tampered header)"
+                )
+            return key
+    os.makedirs(dest_dir, exist_ok=True)
+    manifest = BulkManifest(manifest_path or os.path.join(dest_dir, MANIFEST_FILE_NAME), operation, use_hash)
+
+    started = time.monotonic()
+    summary = {
+        "operation": operation,
+        "source": os.path.abspath(source_dir),
+        "destination": os.path.abspath(dest_dir),
+        "username": username,
+        "files_seen": 0,
+        "processed": 0,
+        "skipped": 0,
+        "failed": 0,
+        "bytes_read": 0,
+        "bytes_written": 0,
+        "errors": [],
+    }
+    created_dirs = set()
+
+    def finish(future, relpath):
+        try:
+            status, bytes_read, bytes_written = future.result()
+        except Exception as e:
+            summary["failed"] += 1
+            if len(summary["errors"]) < SUMMARY_MAX_ERRORS:
+                summary["errors"].append({"path": relpath, "error": str(e) or type(e).__name__})
+            return
+        summary[status] += 1
+        summary["bytes_read"] += bytes_read
+        summary["bytes_written"] += bytes_written
+
+    in_flight = {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-crypto") as pool:
+            for relpath, entry in iter_source_files(source_dir, operation, exclude=[dest_dir]):
+                summary["files_seen"] += 1
+                output_path = os.path.join(dest_dir, output_relpath(relpath, operation))
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError as e:
+                    summary["failed"] += 1
+                    if len(summary["errors"]) < SUMMARY_MAX_ERRORS:
+                        summary["errors"].append({"path": relpath, "error": str(e)})
+                    continue
+                if manifest.is_current(relpath, stat, output_path):
+                    summary["skipped"] += 1
+                    continue
+
+                parent = os.path.dirname(output_path)
+                if parent not in created_dirs:
+                    os.makedirs(parent, exist_ok=True)
+                    created_dirs.add(parent)
+
+                future = pool.submit(_process_file, operation, key_for, entry.path, output_path,
+                                     relpath, stat, manifest)
+                in_flight[future] = relpath
+                # Keep the queue short instead of submitting the whole tree up front
+                if len(in_flight) >= workers * BULK_QUEUE_PER_WORKER:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finish(future, in_flight.pop(future))
+                    manifest.save(force=False)
+            for future in list(in_flight):
+                finish(future, in_flight.pop(future))
+    finally:
+        # Cancelled or failed runs keep the progress made so far
+        for future in list(in_flight):
+            future.cancel()
+        manifest.save()
+
+    summary["seconds"] = round(time.monotonic() - started, 3)
+    log_bulk_run(summary)
+    return summary
+
+
+def log_bulk_run(summary):
+    """Record a finished run as one system log event and one activity entry"""
+    operation = summary["operation"]
+    username = summary["username"]
+    if summary["processed"]:
+        now = datetime.datetime.now()
+        action = "encryption" if operation == ENCRYPT else "decryption"
+        activity_entry = {
+            "timestamp": now.isoformat(),
+            "username": username,
+            "action": action,
+            "file_count": summary["processed"],
+            "source": "bulk",
+            "session_id": f"{username}_{now.strftime('%Y%m%d_%H%M%S')}",
+        }
+        if operation == ENCRYPT:
+            activity_entry["original_length"] = summary["bytes_read"]
+            activity_entry["encrypted_length"] = summary["bytes_written"]
+        else:
+            activity_entry["encrypted_length"] = summary["bytes_read"]
+            activity_entry["decrypted_length"] = summary["bytes_written"]
+        get_storage().append_event(ENCRYPTION_ACTIVITY, activity_entry)
+
+    log_event(username, f"bulk_{operation}",
+              f"Bulk {operation} of {summary['source']}: {summary['processed']} processed, "
+              f"{summary['skipped']} skipped, {summary['failed']} failed "
+              f"({summary['bytes_read']} → {summary['bytes_written']} bytes)")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Encrypt or decrypt directory trees without the GUI")
+    parser.add_argument("operation", choices=[ENCRYPT, DECRYPT])
+    parser.add_argument("source", help="Directory to read")
+    parser.add_argument("destination", help="Directory to write (created if missing)")
+    parser.add_argument("--user", required=True, help="User whose key is used")
+    parser.add_argument("--workers", type=int, default=BULK_WORKERS, help="Files processed in parallel")
+    parser.add_argument("--manifest", help=f"Manifest path (default: DESTINATION/{MANIFEST_FILE_NAME})")
+    parser.add_argument("--hash", action="store_true",
+                        help="Also record SHA-256, skipping files whose mtime changed but content didn't")
+    args = parser.parse_args()
+
+    try:
+        result = run_bulk(args.operation, args.source, args.destination, args.user,
+                          workers=args.workers, manifest_path=args.manifest, use_hash=args.hash)
+    except (ValueError, KeyError, OSError) as e:
+        print(json.dumps({"operation": args.operation, "error": str(e)}))
+        sys.exit(2)
+    print(json.dumps(result, indent=2))
+    sys.exit(1 if result["failed"] else 0)
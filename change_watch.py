@@ -0,0 +1,226 @@
+"""Change notification for the data/ directory
+
+DataWatcher reports which stores changed, in debounced batches, by calling
+on_change(stores) on its own thread. On Linux it blocks on inotify (through
+ctypes, no extra dependency), so an idle system costs nothing. Elsewhere,
+or if inotify can't be set up, it falls back to polling file signatures
+with os.stat.
+"""
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import threading
+import ctypes
+import ctypes.util
+
+from storage import DOCUMENT_FILES, EVENT_FILES, SQLITE_DB_FILE
+
+DATA_DIR = "data"
+# A batch is delivered once writes pause for the debounce time, or at the
+# latest this long after its first change, whichever comes first
+WATCH_DEBOUNCE = 0.03
+WATCH_MAX_DELAY = 0.1
+# Seconds between scans when inotify isn't available
+STAT_POLL_INTERVAL = 0.5
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+INOTIFY_EVENT = struct.Struct("iIII")
+INOTIFY_READ_SIZE = 64 * 1024
+
+
+def store_file_names(directory):
+    """Map file names inside directory to the store(s) they hold"""
+    names = {}
+    for store, path in list(DOCUMENT_FILES.items()) + list(EVENT_FILES.items()):
+        if os.path.dirname(os.path.abspath(path)) == os.path.abspath(directory):
+            names[os.path.basename(path)] = frozenset([store])
+    if os.path.dirname(os.path.abspath(SQLITE_DB_FILE)) == os.path.abspath(directory):
+        # One database holds every store; a commit may have touched any of them
+        every_store = frozenset(DOCUMENT_FILES) | frozenset(EVENT_FILES)
+        db_name = os.path.basename(SQLITE_DB_FILE)
+        names[db_name] = names[f"{db_name}-wal"] = every_store
+    return names
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class DataWatcher:
+    """Background watcher that reports changed stores in debounced batches"""
+
+    def __init__(self, directory, on_change, debounce=None, max_delay=None, use_inotify=True):
+        self.directory = directory
+        self.on_change = on_change
+        self.debounce = WATCH_DEBOUNCE if debounce is None else debounce
+        self.max_delay = WATCH_MAX_DELAY if max_delay is None else max_delay
+        self.names = store_file_names(directory)
+        self.every_store = frozenset().union(*self.names.values()) if self.names else frozenset()
+        self._stopped = threading.Event()
+        self._pending = set()
+        self._first_change = None
+        self._last_change = None
+        self._inotify_fd = None
+        self._watch = None
+        self._wake_read, self._wake_write = os.pipe()
+        libc = _load_libc() if use_inotify else None
+        if libc is not None:
+            self._setup_inotify(libc)
+        self.mode = "inotify" if self._inotify_fd is not None else "stat"
+        self._thread = threading.Thread(target=self._run, name="data-watcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop watching; a batch already being delivered finishes first"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        os.write(self._wake_write, b"x")
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(1.0)
+        if not self._thread.is_alive():
+            os.close(self._wake_read)
+            os.close(self._wake_write)
+
+    def _setup_inotify(self, libc):
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            print(f"Debug - inotify unavailable ({os.strerror(ctypes.get_errno())}), polling instead")
+            return
+        self._libc = libc
+        self._inotify_fd = fd
+        self._add_watch()
+
+    def _add_watch(self):
+        os.makedirs(self.directory, exist_ok=True)
+        wd = self._libc.inotify_add_watch(self._inotify_fd, os.fsencode(self.directory), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            print(f"Debug - Could not watch {self.directory} ({os.strerror(error)}), polling instead")
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+            return
+        self._watch = wd
+
+    def _note(self, stores):
+        now = time.monotonic()
+        if not self._pending:
+            self._first_change = now
+        self._pending |= stores
+        self._last_change = now
+
+    def _timeout(self):
+        """Seconds until the pending batch is due, or None with nothing pending"""
+        if not self._pending:
+            return None
+        now = time.monotonic()
+        due = min(self._last_change + self.debounce, self._first_change + self.max_delay)
+        return max(0.0, due - now)
+
+    def _deliver(self):
+        stores, self._pending = frozenset(self._pending), set()
+        try:
+            self.on_change(stores)
+        except Exception as e:
+            print(f"Debug - Change handler failed: {e}")
+
+    def _run(self):
+        try:
+            if self._inotify_fd is not None:
+                self._run_inotify()
+            if not self._stopped.is_set():
+                self._run_polling()
+        finally:
+            if self._inotify_fd is not None:
+                os.close(self._inotify_fd)
+                self._inotify_fd = None
+
+    def _run_inotify(self):
+        while not self._stopped.is_set() and self._inotify_fd is not None:
+            # Blocks indefinitely while nothing is pending: no work when idle
+            timeout = self._timeout()
+            readable, _, _ = select.select([self._inotify_fd, self._wake_read], [], [], timeout)
+            if self._stopped.is_set():
+                return
+            if self._inotify_fd in readable:
+                self._read_inotify()
+            if self._pending and self._timeout() == 0:
+                self._deliver()
+
+    def _read_inotify(self):
+        try:
+            data = os.read(self._inotify_fd, INOTIFY_READ_SIZE)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return
+            raise
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, so anything may have changed
+                self._note(self.every_store)
+            elif mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                # The directory itself went away or was replaced
+                self._note(self.every_store)
+                if mask & IN_IGNORED:
+                    # Watch it again, or fall back to polling if that fails
+                    self._add_watch()
+                    if self._inotify_fd is None:
+                        self.mode = "stat"
+                        return
+            elif name in self.names:
+                self._note(self.names[name])
+
+    def _signatures(self):
+        signatures = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name in self.names:
+                        st = entry.stat()
+                        signatures[entry.name] = (st.st_ino, st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            pass
+        return signatures
+
+    def _run_polling(self):
+        previous = self._signatures()
+        while not self._stopped.wait(STAT_POLL_INTERVAL):
+            current = self._signatures()
+            for name in set(previous) | set(current):
+                if previous.get(name) != current.get(name):
+                    self._note(self.names[name])
+            previous = current
+            if self._pending:
+                self._deliver()
@@ -0,0 +1,54 @@
+import base64
+import binascii
+from cryptography.fernet import InvalidToken
+
+# Clipboard/text ciphertext format, version 1: a version tag followed by the
+# Fernet token itself. Fernet tokens are already URL-safe Base64, so they are
+# not encoded a second time. Binary ciphertext (files) uses the chunked .svlt
+# format from file_crypto instead.
+TEXT_FORMAT_PREFIX = "sv1:"
+# Every Fernet token starts with version byte 0x80, which encodes as "gAAAAA"
+FERNET_TOKEN_PREFIX = "gAAAAA"
+
+FORMAT_TEXT_V1 = "text-v1"
+FORMAT_FERNET = "fernet"
+FORMAT_LEGACY = "legacy-base64"
+
+
+def encrypt_text(fernet, text):
+    """Encrypt a string into the versioned, single-encoded text format"""
+    return TEXT_FORMAT_PREFIX + fernet.encrypt(text.encode('utf-8')).decode('ascii')
+
+
+def detect_text_format(data):
+    """Identify which text ciphertext format a pasted string uses"""
+    data = data.strip()
+    if data.startswith(TEXT_FORMAT_PREFIX):
+        return FORMAT_TEXT_V1
+    if data.startswith(FERNET_TOKEN_PREFIX):
+        return FORMAT_FERNET
+    # Before versioning, the token was Base64-encoded again
+    return FORMAT_LEGACY
+
+
+def decrypt_text(fernet, data):
+    """Decrypt text ciphertext in any supported format; returns (text, format)
+
+    Raises ValueError for input that is not valid ciphertext for this key.
+    """
+    data = "".join(data.split())
+    text_format = detect_text_format(data)
+    if text_format == FORMAT_TEXT_V1:
+        token = data[len(TEXT_FORMAT_PREFIX):].encode('ascii')
+    elif text_format == FORMAT_FERNET:
+        token = data.encode('ascii')
+    else:
+        try:
+            token = base64.b64decode(data.encode('ascii'), validate=True)
+        except (binascii.Error, UnicodeEncodeError):
+            raise ValueError("Invalid ciphertext format") from None
+
+    try:
+        return fernet.decrypt(token).decode('utf-8'), text_format
+    except InvalidToken:
+        raise ValueError("Ciphertext is corrupted or was encrypted with a different key") from None
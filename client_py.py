@@ -1,19 +1,38 @@
 import customtkinter as ctk
-from tkinter import filedialog, messagebox
-import base64
+from tkinter import filedialog, messagebox, TclError
 import os
 import datetime
-from shared import (
-    load_json_file, save_json_file, log_event, 
-    get_user_encryption_key
-)
-from cryptography.fernet import Fernet
+import file_crypto
+import ciphertext
+from file_preview import FilePreview, PREVIEW_PAGE_LINES
+from job_runner import JobRunner, RUNNING, DONE, CANCELLED
+from file_metadata import FileMetadataStore
+from key_cache import default_key_cache
+from key_ring import multi_fernet, find_file_key_version, current_key_version
+from storage import get_storage, log_event, ENCRYPTION_ACTIVITY
+
+# Plaintext shown when previewing an encrypted file; only the blocks covering
+# it are decrypted
+ENCRYPTED_PREVIEW_BYTES = 64 * 1024
+# Worker threads for queued crypto jobs; log writes have a single worker of
+# their own so events reach the append-only logs in the order they happened
+CLIENT_JOB_WORKERS = 2
 
 class ClientApp:
     def __init__(self, username):
         self.username = username
-        self.encryption_key = get_user_encryption_key(username)
-        self.fernet = Fernet(self.encryption_key)
+        self.storage = get_storage()
+        
+        # Crypto jobs and log writes run off the Tk thread
+        self.jobs = JobRunner(workers=CLIENT_JOB_WORKERS, on_update=self.on_job_update, name="client-jobs")
+        self.log_writer = JobRunner(workers=1, name="client-log")
+        self.file_metadata = FileMetadataStore(self.storage)
+        self._job_status_pending = False
+        self._closing = False
+        
+        # Windowed File Manager preview state
+        self.file_preview = None
+        self.preview_page = 0
         
         # Set theme
         ctk.set_appearance_mode("dark")
@@ -28,7 +47,7 @@ class ClientApp:
         self.center_window()
         
         # Log client session start
-        log_event(self.username, "client_session_start", f"Client interface opened by {username}")
+        self.log_async("client_session_start", f"Client interface opened by {username}")
         
         self.setup_ui()
         
@@ -96,7 +115,14 @@ class ClientApp:
             self.status_frame, text="🟢 Ready - SecureVault Client Active",
             font=ctk.CTkFont(size=12), text_color="green"
         )
-        self.status_label.pack(pady=10)
+        self.status_label.pack(side="left", expand=True, pady=10)
+        
+        self.cancel_job_button = ctk.CTkButton(
+            self.status_frame, text="✖ Cancel", width=90, height=26,
+            command=self.cancel_current_job, state="disabled",
+            fg_color=("#CC4125", "#8B0000"), hover_color=("#B23A1F", "#A00000")
+        )
+        self.cancel_job_button.pack(side="right", padx=10, pady=7)
         
     def create_file_tab(self):
         tab = self.tabview.add("📁 File Manager")
@@ -128,6 +154,20 @@ class ClientApp:
         )
         clear_button.pack(side="left")
         
+        encrypt_file_button = ctk.CTkButton(
+            controls_frame, text="🔒 Encrypt File", 
+            command=self.encrypt_file, height=35, width=130,
+            font=ctk.CTkFont(size=12)
+        )
+        encrypt_file_button.pack(side="left", padx=(10, 0))
+        
+        decrypt_file_button = ctk.CTkButton(
+            controls_frame, text="🔓 Decrypt File", 
+            command=self.decrypt_file, height=35, width=130,
+            font=ctk.CTkFont(size=12)
+        )
+        decrypt_file_button.pack(side="left", padx=(10, 0))
+        
         # File info display
         self.file_info_frame = ctk.CTkFrame(file_ops_frame)
         self.file_info_frame.pack(fill="x", padx=15, pady=(0, 15))
@@ -153,12 +193,36 @@ class ClientApp:
             font=ctk.CTkFont(size=14, weight="bold")
         ).pack(anchor="w", padx=15, pady=(15, 5))
         
+        # Page navigation (large files are shown one window at a time)
+        nav_frame = ctk.CTkFrame(content_frame, fg_color="transparent")
+        nav_frame.pack(fill="x", padx=15, pady=(0, 5))
+        
+        for text, command in (
+            ("⏮ Top", lambda: self.show_preview_page(0)),
+            ("◀ Prev", lambda: self.show_preview_page(self.preview_page - 1)),
+            ("Next ▶", lambda: self.show_preview_page(self.preview_page + 1)),
+            ("Bottom ⏭", lambda: self.show_preview_page(self.file_preview.page_count() - 1 if self.file_preview else 0)),
+        ):
+            ctk.CTkButton(
+                nav_frame, text=text, command=command, width=80, height=28
+            ).pack(side="left", padx=(0, 10))
+            
+        self.preview_page_label = ctk.CTkLabel(
+            nav_frame, text="", font=ctk.CTkFont(size=11), text_color="gray"
+        )
+        self.preview_page_label.pack(side="left", padx=5)
+        
         # Scrollable text widget with line numbers
         self.file_content_text = ctk.CTkTextbox(
             content_frame, font=ctk.CTkFont(family="Courier New", size=11)
         )
         self.file_content_text.pack(fill="both", expand=True, padx=15, pady=(0, 15))
         
+        # Scrolling past either end of the window loads the next/previous page
+        self.file_content_text.bind("<MouseWheel>", self.on_preview_scroll)
+        self.file_content_text.bind("<Button-4>", self.on_preview_scroll)
+        self.file_content_text.bind("<Button-5>", self.on_preview_scroll)
+        
     def create_encrypt_tab(self):
         tab = self.tabview.add("🔐 Encrypt")
         
@@ -308,26 +372,31 @@ class ClientApp:
                 file_size = os.path.getsize(file_path)
                 file_name = os.path.basename(file_path)
                 
-                # Read file content
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-                    content = file.read()
-                    
-                # Update UI
-                self.file_content_text.delete("0.0", "end")
-                self.file_content_text.insert("0.0", content)
-                
-                self.file_path_label.configure(text=f"📄 {file_name}")
-                self.file_size_label.configure(text=f"📊 Size: {file_size} bytes | Lines: {len(content.splitlines())}")
+                self.close_file_preview()
+                if file_crypto.is_encrypted_file(file_path):
+                    self.preview_encrypted_file(file_path)
+                else:
+                    # Map the file and index lines in the background; only the
+                    # visible page is ever decoded
+                    preview = FilePreview(
+                        file_path,
+                        on_progress=lambda lines, scanned, done: self.run_on_ui(
+                            lambda: self.update_preview_progress(preview)
+                        )
+                    )
+                    self.file_preview = preview
+                    self.file_path_label.configure(text=f"📄 {file_name}")
+                    self.update_preview_progress(preview)
+                    self.show_preview_page(0)
                 
                 # Log file access with detailed info
-                log_event(
-                    self.username, 
+                self.log_async(
                     "file_access", 
                     f"Accessed file: {file_name} (Size: {file_size} bytes, Path: {file_path})"
                 )
                 
                 # Update file metadata for admin tracking
-                self.update_file_metadata(file_path, "accessed")
+                self.update_file_metadata(file_path, "accessed", file_size)
                 
                 # Update status
                 self.update_status(f"✅ File loaded: {file_name}")
@@ -335,17 +404,181 @@ class ClientApp:
             except Exception as e:
                 error_msg = f"Could not read file: {str(e)}"
                 messagebox.showerror("File Error", error_msg)
-                log_event(self.username, "file_access_error", f"Failed to access file: {file_path} - Error: {str(e)}")
+                self.log_async("file_access_error", f"Failed to access file: {file_path} - Error: {str(e)}")
                 self.update_status("❌ File loading failed")
                 
+    def show_preview_page(self, page):
+        """Render one window of lines of the previewed file"""
+        preview = self.file_preview
+        if preview is None:
+            return
+        page = min(max(page, 0), preview.page_count() - 1)
+        self.preview_page = page
+        first_line = page * PREVIEW_PAGE_LINES
+        lines = preview.lines(first_line, PREVIEW_PAGE_LINES)
+        
+        self.file_content_text.delete("0.0", "end")
+        self.file_content_text.insert("0.0", "\n".join(lines))
+        self.update_preview_page_label()
+        
+    def update_preview_page_label(self):
+        preview = self.file_preview
+        if preview is None:
+            self.preview_page_label.configure(text="")
+            return
+        first_line = self.preview_page * PREVIEW_PAGE_LINES
+        last_line = min(first_line + PREVIEW_PAGE_LINES, max(preview.line_count, 1))
+        suffix = "" if preview.done else "+"
+        self.preview_page_label.configure(
+            text=f"Lines {first_line + 1}-{last_line} | Page {self.preview_page + 1} of {preview.page_count()}{suffix}"
+        )
+        
+    def update_preview_progress(self, preview):
+        """Show line count and indexing progress (runs on the UI thread)"""
+        if preview is not self.file_preview:
+            # A newer file was selected since this update was scheduled
+            return
+        if preview.done:
+            lines = f"Lines: {preview.line_count}"
+        else:
+            percent = preview.scanned_bytes * 100 // max(preview.size, 1)
+            lines = f"Lines: {preview.line_count}+ (indexing {percent}%)"
+        self.file_size_label.configure(text=f"📊 Size: {preview.size} bytes | {lines}")
+        self.update_preview_page_label()
+        
+    def on_preview_scroll(self, event):
+        """Load the next/previous page when scrolling past the window's edges"""
+        if self.file_preview is None:
+            return
+        top, bottom = self.file_content_text.yview()
+        scrolling_down = getattr(event, "num", None) == 5 or getattr(event, "delta", 0) < 0
+        
+        if scrolling_down and bottom >= 1.0 and self.preview_page < self.file_preview.page_count() - 1:
+            self.show_preview_page(self.preview_page + 1)
+            self.file_content_text.yview_moveto(0.0)
+            return "break"
+        if not scrolling_down and top <= 0.0 and self.preview_page > 0:
+            self.show_preview_page(self.preview_page - 1)
+            self.file_content_text.yview_moveto(1.0)
+            return "break"
+            
+    def close_file_preview(self):
+        """Release the current preview's mapping and indexing thread"""
+        if self.file_preview is not None:
+            self.file_preview.close()
+            self.file_preview = None
+        self.preview_page = 0
+        self.preview_page_label.configure(text="")
+        
+    def preview_encrypted_file(self, file_path):
+        """Show the start of an encrypted file, decrypting only the blocks it needs"""
+        with file_crypto.EncryptedFileReader(self.file_key(file_path), file_path) as reader:
+            content = reader.read(0, ENCRYPTED_PREVIEW_BYTES).decode('utf-8', errors='replace')
+            plaintext_size = len(reader)
+            
+        self.file_content_text.delete("0.0", "end")
+        self.file_content_text.insert("0.0", content)
+        
+        shown = f"first {ENCRYPTED_PREVIEW_BYTES // 1024} KiB" if plaintext_size > ENCRYPTED_PREVIEW_BYTES else "all"
+        self.file_path_label.configure(text=f"🔐 {os.path.basename(file_path)} (encrypted, decrypted preview)")
+        self.file_size_label.configure(
+            text=f"📊 Size: {os.path.getsize(file_path)} bytes encrypted | {plaintext_size} bytes plaintext | Showing {shown}"
+        )
+        
     def clear_file_content(self):
         """Clear file content display"""
+        self.close_file_preview()
         self.file_content_text.delete("0.0", "end")
         self.file_path_label.configure(text="📄 No file selected")
         self.file_size_label.configure(text="📊 Size: N/A")
-        log_event(self.username, "file_clear", "File content cleared")
+        self.log_async("file_clear", "File content cleared")
         self.update_status("🗑️ File content cleared")
         
+    def encrypt_file(self):
+        """Encrypt a file of any size to <name>.svlt without loading it into memory"""
+        input_path = filedialog.askopenfilename(title="Select a file to encrypt")
+        if not input_path:
+            return
+        output_path = filedialog.asksaveasfilename(
+            title="Save encrypted file as",
+            initialfile=os.path.basename(input_path) + file_crypto.ENCRYPTED_FILE_SUFFIX,
+            defaultextension=file_crypto.ENCRYPTED_FILE_SUFFIX
+        )
+        if not output_path:
+            return
+        self.run_file_operation("encrypt", file_crypto.encrypt_file, input_path, output_path)
+        
+    def decrypt_file(self):
+        """Decrypt a .svlt file, verifying every chunk as it streams"""
+        input_path = filedialog.askopenfilename(
+            title="Select a file to decrypt",
+            filetypes=[("SecureVault files", "*" + file_crypto.ENCRYPTED_FILE_SUFFIX), ("All files", "*.*")]
+        )
+        if not input_path:
+            return
+        suggested = os.path.basename(input_path)
+        if suggested.endswith(file_crypto.ENCRYPTED_FILE_SUFFIX):
+            suggested = suggested[:-len(file_crypto.ENCRYPTED_FILE_SUFFIX)]
+        output_path = filedialog.asksaveasfilename(title="Save decrypted file as", initialfile=suggested)
+        if not output_path:
+            return
+        self.run_file_operation("decrypt", file_crypto.decrypt_file, input_path, output_path)
+        
+    def current_key(self):
+        """The user's current key; looked up per use so a rotation elsewhere takes effect"""
+        return default_key_cache.key(self.username, current_key_version(self.username))
+        
+    def current_fernet(self):
+        """Fernet for the user's current key (see current_key)"""
+        return default_key_cache.fernet(self.username, current_key_version(self.username))
+        
+    def file_key(self, path):
+        """Key version an encrypted file was written with (falls back to the current key)"""
+        _, key = find_file_key_version(self.username, path)
+        return key if key is not None else self.current_key()
+        
+    def run_file_operation(self, operation, transform, input_path, output_path):
+        """Queue a file encrypt/decrypt job; it streams with progress and can be cancelled"""
+        file_name = os.path.basename(input_path)
+        verb = "Encrypting" if operation == "encrypt" else "Decrypting"
+        
+        def work(job):
+            key = self.current_key() if operation == "encrypt" else self.file_key(input_path)
+            return transform(key, input_path, output_path, progress=job.report)
+            
+        self.jobs.submit(
+            f"{verb} {file_name}", work, total=os.path.getsize(input_path),
+            on_done=lambda job: self.run_on_ui(
+                lambda: self.finish_file_operation(operation, input_path, output_path, job)
+            )
+        )
+        
+    def finish_file_operation(self, operation, input_path, output_path, job):
+        """Report a finished file encrypt/decrypt (runs on the UI thread)"""
+        file_name = os.path.basename(input_path)
+        if job.state == CANCELLED:
+            self.log_async(f"file_{operation}ion_cancelled", f"Cancelled {operation}ion of file: {input_path}")
+            self.update_status(f"✖ File {operation}ion cancelled")
+            return
+        if job.state != DONE:
+            title = "Encryption Error" if operation == "encrypt" else "Decryption Error"
+            messagebox.showerror(title, f"Could not {operation} {file_name}: {job.error}")
+            self.log_async(f"file_{operation}ion_error", f"Failed to {operation} file: {input_path} - Error: {job.error}")
+            self.update_status(f"❌ File {operation}ion failed")
+            return
+            
+        bytes_read, bytes_written = job.result
+        self.log_async(
+            f"file_{operation}ion",
+            f"{operation.capitalize()}ed file: {file_name} ({bytes_read} → {bytes_written} bytes, Output: {output_path})"
+        )
+        if operation == "encrypt":
+            self.log_encryption_activity(bytes_read, bytes_written)
+        else:
+            self.log_decryption_activity(bytes_read, bytes_written)
+        self.update_file_metadata(input_path, f"{operation}ed")
+        self.update_status(f"✅ {file_name} {operation}ed ({bytes_read} → {bytes_written} bytes)")
+        
     def encrypt_text(self):
         """Encrypt user input text"""
         text = self.encrypt_input_text.get("0.0", "end-1c").strip()
@@ -354,18 +587,28 @@ class ClientApp:
             messagebox.showwarning("Input Required", "Please enter text to encrypt")
             return
             
+        # Encrypt the text (versioned format, Fernet token encoded once)
+        self.jobs.submit(
+            "Encrypting text", lambda job: ciphertext.encrypt_text(self.current_fernet(), text),
+            total=len(text), on_done=lambda job: self.run_on_ui(lambda: self.finish_text_encryption(text, job))
+        )
+        
+    def finish_text_encryption(self, text, job):
+        """Show the result of an encrypt_text job (runs on the UI thread)"""
         try:
-            # Encrypt the text
-            encrypted_bytes = self.fernet.encrypt(text.encode('utf-8'))
-            encrypted_b64 = base64.b64encode(encrypted_bytes).decode('utf-8')
+            if job.state == CANCELLED:
+                self.update_status("✖ Encryption cancelled")
+                return
+            if job.state != DONE:
+                raise job.error
+            encrypted_b64 = job.result
             
             # Display result
             self.encrypt_output_text.delete("0.0", "end")
             self.encrypt_output_text.insert("0.0", encrypted_b64)
             
             # Log encryption activity with details
-            log_event(
-                self.username, 
+            self.log_async(
                 "text_encryption", 
                 f"Encrypted text (Original length: {len(text)} chars, Encrypted length: {len(encrypted_b64)} chars)"
             )
@@ -379,7 +622,7 @@ class ClientApp:
         except Exception as e:
             error_msg = f"Encryption failed: {str(e)}"
             messagebox.showerror("Encryption Error", error_msg)
-            log_event(self.username, "encryption_error", f"Encryption failed: {str(e)}")
+            self.log_async("encryption_error", f"Encryption failed: {str(e)}")
             self.update_status("❌ Encryption failed")
             
     def decrypt_text(self):
@@ -390,26 +633,31 @@ class ClientApp:
             messagebox.showwarning("Input Required", "Please enter encrypted text to decrypt")
             return
             
+        # Decrypt the text; older double-Base64 blobs are detected automatically
+        self.jobs.submit(
+            "Decrypting text", lambda job: ciphertext.decrypt_text(multi_fernet(self.username), encrypted_text),
+            total=len(encrypted_text),
+            on_done=lambda job: self.run_on_ui(lambda: self.finish_text_decryption(encrypted_text, job))
+        )
+        
+    def finish_text_decryption(self, encrypted_text, job):
+        """Show the result of a decrypt_text job (runs on the UI thread)"""
         try:
-            # Validate base64 format
-            try:
-                encrypted_bytes = base64.b64decode(encrypted_text.encode('utf-8'))
-            except Exception:
-                raise ValueError("Invalid Base64 format")
-            
-            # Decrypt the text
-            decrypted_bytes = self.fernet.decrypt(encrypted_bytes)
-            decrypted_text = decrypted_bytes.decode('utf-8')
+            if job.state == CANCELLED:
+                self.update_status("✖ Decryption cancelled")
+                return
+            if job.state != DONE:
+                raise job.error
+            decrypted_text, text_format = job.result
             
             # Display result
             self.decrypt_output_text.delete("0.0", "end")
             self.decrypt_output_text.insert("0.0", decrypted_text)
             
             # Log decryption activity with details
-            log_event(
-                self.username, 
+            self.log_async(
                 "text_decryption", 
-                f"Decrypted text (Encrypted length: {len(encrypted_text)} chars, Decrypted length: {len(decrypted_text)} chars)"
+                f"Decrypted text (Encrypted length: {len(encrypted_text)} chars, Decrypted length: {len(decrypted_text)} chars, Format: {text_format})"
             )
             
             # Update file metadata for decryption activity
@@ -421,7 +669,7 @@ class ClientApp:
         except Exception as e:
             error_msg = f"Decryption failed: {str(e)}"
             messagebox.showerror("Decryption Error", error_msg)
-            log_event(self.username, "decryption_error", f"Decryption failed: {str(e)}")
+            self.log_async("decryption_error", f"Decryption failed: {str(e)}")
             self.update_status("❌ Decryption failed")
             
     def copy_encrypted_text(self):
@@ -430,7 +678,7 @@ class ClientApp:
         if encrypted_text.strip():
             self.root.clipboard_clear()
             self.root.clipboard_append(encrypted_text)
-            log_event(self.username, "copy_encrypted", "Copied encrypted text to clipboard")
+            self.log_async("copy_encrypted", "Copied encrypted text to clipboard")
             self.update_status("📋 Encrypted text copied to clipboard")
         else:
             messagebox.showwarning("Nothing to Copy", "No encrypted text available")
@@ -441,46 +689,28 @@ class ClientApp:
         if decrypted_text.strip():
             self.root.clipboard_clear()
             self.root.clipboard_append(decrypted_text)
-            log_event(self.username, "copy_decrypted", "Copied decrypted text to clipboard")
+            self.log_async("copy_decrypted", "Copied decrypted text to clipboard")
             self.update_status("📋 Decrypted text copied to clipboard")
         else:
             messagebox.showwarning("Nothing to Copy", "No decrypted text available")
             
-    def update_file_metadata(self, file_path, action):
+    def update_file_metadata(self, file_path, action, file_size=None):
         """Update file metadata for admin tracking"""
-        files_data = load_json_file("data/files_data.json")
-        
-        file_key = os.path.basename(file_path)
-        current_time = datetime.datetime.now().isoformat()
-        
-        if file_key not in files_data:
-            files_data[file_key] = {
-                "full_path": file_path,
-                "accessed_count": 0,
-                "first_access": None,
-                "last_access": None,
-                "accessed_by": [],
-                "file_size": 0
-            }
-            
-        # Update metadata
-        files_data[file_key]["accessed_count"] += 1
-        files_data[file_key]["last_access"] = current_time
-        files_data[file_key]["file_size"] = os.path.getsize(file_path)
-        
-        if files_data[file_key]["first_access"] is None:
-            files_data[file_key]["first_access"] = current_time
-            
-        # Track which users accessed the file
-        if self.username not in files_data[file_key]["accessed_by"]:
-            files_data[file_key]["accessed_by"].append(self.username)
+        if file_size is None:
+            file_size = os.path.getsize(file_path)
+        # Coalesced in memory and written in batches by the metadata store's
+        # own flusher instead of rewriting the tracking file on every access
+        self.file_metadata.record_access(os.path.basename(file_path), file_path, self.username, file_size)
+        
+    def close_file_metadata(self):
+        """Write pending file-access records before the window goes away"""
+        try:
+            self.file_metadata.close()
+        except Exception as e:
+            print(f"Debug - Could not save file metadata: {e}")
             
-        save_json_file("data/files_data.json", files_data)
-        
     def log_encryption_activity(self, original_length, encrypted_length):
         """Log encryption activity for admin monitoring"""
-        activity_data = load_json_file("data/encryption_activity.json")
-        
         activity_entry = {
             "timestamp": datetime.datetime.now().isoformat(),
             "username": self.username,
@@ -490,13 +720,10 @@ class ClientApp:
             "session_id": f"{self.username}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
         }
         
-        activity_data.append(activity_entry)
-        save_json_file("data/encryption_activity.json", activity_data)
+        self.log_writer.background(self.storage.append_event, ENCRYPTION_ACTIVITY, activity_entry)
         
     def log_decryption_activity(self, encrypted_length, decrypted_length):
         """Log decryption activity for admin monitoring"""
-        activity_data = load_json_file("data/encryption_activity.json")
-        
         activity_entry = {
             "timestamp": datetime.datetime.now().isoformat(),
             "username": self.username,
@@ -506,9 +733,52 @@ class ClientApp:
             "session_id": f"{self.username}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
         }
         
-        activity_data.append(activity_entry)
-        save_json_file("data/encryption_activity.json", activity_data)
+        self.log_writer.background(self.storage.append_event, ENCRYPTION_ACTIVITY, activity_entry)
+        
+    def log_async(self, action, details):
+        """Queue a system log write for this user on the ordered log worker"""
+        self.log_writer.background(log_event, self.username, action, details)
         
+    def run_on_ui(self, callback):
+        """Schedule callback on the Tk thread from a worker thread"""
+        if self._closing:
+            # The Tk thread is waiting for the workers; don't call into Tk
+            return
+        try:
+            self.root.after(0, callback)
+        except (RuntimeError, TclError):
+            # Window already destroyed
+            pass
+            
+    def on_job_update(self, job):
+        """Job progress/state changed (worker thread); coalesce into one UI update"""
+        if not self._job_status_pending:
+            self._job_status_pending = True
+            self.run_on_ui(self.show_job_status)
+                
+    def show_job_status(self):
+        """Show the running job's progress in the status bar (UI thread)"""
+        self._job_status_pending = False
+        active = self.jobs.active_jobs()
+        self.cancel_job_button.configure(state="normal" if active else "disabled")
+        if not active:
+            return
+        running = [job for job in active if job.state == RUNNING]
+        job = running[0] if running else active[0]
+        percent = job.percent()
+        progress = f" {percent}%" if percent is not None and job.state == RUNNING else ""
+        queued = len(active) - 1
+        suffix = f" (+{queued} more)" if queued else ""
+        self.status_label.configure(text=f"⏳ {job.name}...{progress}{suffix}")
+        
+    def cancel_current_job(self):
+        """Cancel the job shown in the status bar"""
+        active = self.jobs.active_jobs()
+        running = [job for job in active if job.state == RUNNING]
+        if running or active:
+            (running or active)[0].cancel()
+            self.status_label.configure(text="✖ Cancelling...")
+            
     def update_status(self, message):
         """Update status bar with message"""
         self.status_label.configure(text=message)
@@ -519,8 +789,7 @@ class ClientApp:
         """Logout and return to login screen"""
         # Log detailed logout information
         session_duration = datetime.datetime.now()
-        log_event(
-            self.username, 
+        self.log_async(
             "client_logout", 
             f"Client session ended by {self.username} at {session_duration.strftime('%Y-%m-%d %H:%M:%S')}"
         )
@@ -531,6 +800,12 @@ class ClientApp:
         
     def _complete_logout(self):
         """Complete the logout process"""
+        self._closing = True
+        self.close_file_preview()
+        self.jobs.shutdown()
+        # Drains the queued log writes
+        self.log_writer.shutdown()
+        self.close_file_metadata()
         self.root.destroy()
         
         # Restart main application
@@ -551,11 +826,17 @@ class ClientApp:
         
     def on_closing(self):
         """Handle window closing event"""
-        log_event(
-            self.username, 
+        self.log_async(
             "client_window_closed", 
             f"Client window closed by {self.username}"
         )
+        # Cancel running jobs and finish pending log writes before exiting
+        self._closing = True
+        self.close_file_preview()
+        self.jobs.shutdown()
+        # Drains the queued log writes
+        self.log_writer.shutdown()
+        self.close_file_metadata()
         self.root.destroy()
 
 if __name__ == "__main__":
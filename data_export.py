@@ -0,0 +1,403 @@
+"""Streaming export of the system stores to JSON, NDJSON, CSV or Parquet
+
+Usage:
+    python data_export.py export.json
+    python data_export.py export.ndjson --filter 'user:alice time:2024-05'
+    python data_export.py export.csv --filter 'time:2024-05-01..2024-05-07'
+    python data_export.py export.parquet
+
+Records are read from each store one at a time and written straight to the
+output, so memory use does not depend on the number of records.
+
+- json: one document with the same top-level keys as earlier exports.
+- ndjson: one {"section", "key", "data"} object per line.
+- csv / parquet: one file per section next to the given path
+  (export.system_logs.csv, ...), with fixed columns per section. Fields
+  without a column of their own go into an "extra" column as JSON.
+  Parquet needs the optional pyarrow package.
+
+Filters: user:NAME keeps that user's events, account, activity row and the
+files they accessed; time:RANGE (the System Logs filter syntax) applies to
+event timestamps.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import datetime
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    # Optional; only needed for Parquet output
+    pyarrow = None
+
+from log_query import parse_query, QueryError
+from storage import get_storage, USERS, FILES, SYSTEM_LOGS, ENCRYPTION_ACTIVITY
+
+JSON_FORMAT = "json"
+NDJSON_FORMAT = "ndjson"
+CSV_FORMAT = "csv"
+PARQUET_FORMAT = "parquet"
+EXPORT_FORMATS = (JSON_FORMAT, NDJSON_FORMAT, CSV_FORMAT, PARQUET_FORMAT)
+FORMAT_EXTENSIONS = {".json": JSON_FORMAT, ".ndjson": NDJSON_FORMAT, ".jsonl": NDJSON_FORMAT,
+                     ".csv": CSV_FORMAT, ".parquet": PARQUET_FORMAT}
+
+# Rows buffered per Parquet row group
+EXPORT_BATCH_ROWS = 10000
+# progress(records) is called after every this many records
+EXPORT_PROGRESS_INTERVAL = 2000
+
+DOCUMENT = "document"
+EVENTS = "events"
+# Section name -> (kind, store); user_activity is supplied by the caller
+EXPORT_SECTIONS = {
+    "users_data": (DOCUMENT, USERS),
+    "user_activity": (DOCUMENT, None),
+    "system_logs": (EVENTS, SYSTEM_LOGS),
+    "files_data": (DOCUMENT, FILES),
+    "encryption_activity": (EVENTS, ENCRYPTION_ACTIVITY),
+}
+# Tabular columns per section as (name, type); the first column of a document
+# section holds the record key
+SECTION_COLUMNS = {
+    "users_data": [("username", str), ("role", str), ("timestamp", str), ("password", str)],
+    "user_activity": [("username", str), ("events", int), ("logins", int), ("file_access", int),
+                      ("encryption", int), ("first_seen", str), ("last_seen", str)],
+    "system_logs": [("timestamp", str), ("username", str), ("action", str), ("details", str)],
+    "files_data": [("file_key", str), ("full_path", str), ("accessed_count", int), ("first_access", str),
+                   ("last_access", str), ("accessed_by", str), ("file_size", int)],
+    "encryption_activity": [("timestamp", str), ("username", str), ("action", str),
+                            ("original_length", int), ("encrypted_length", int), ("decrypted_length", int),
+                            ("file_count", int), ("session_id", str)],
+}
+EXTRA_COLUMN = "extra"
+
+
+def format_for_path(path):
+    """Export format implied by a file extension (JSON if unknown)"""
+    return FORMAT_EXTENSIONS.get(os.path.splitext(path)[1].lower(), JSON_FORMAT)
+
+
+def available_formats():
+    return [fmt for fmt in EXPORT_FORMATS if fmt != PARQUET_FORMAT or pyarrow is not None]
+
+
+def parse_export_filter(text):
+    """Parse 'user:NAME time:RANGE' into (start, end, username); either term is optional"""
+    start = end = username = None
+    for word in (text or "").split():
+        field, sep, value = word.partition(":")
+        if sep and field.lower() in ("user", "username") and value:
+            username = value
+            continue
+        node = parse_query(word) if sep and field.lower() in ("time", "timestamp") else None
+        if node is None:
+            raise QueryError(f"Export filters support user:NAME and time:RANGE, not '{word}'")
+        _, start, end = node
+    return start, end, username
+
+
+def _cell(value, kind):
+    if value is None:
+        return None
+    if kind is int:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return ";".join(value)
+    return json.dumps(value, ensure_ascii=False)
+
+
+def tabular_row(section, key, record):
+    """Flatten a record into the section's columns plus an extra JSON column"""
+    columns = SECTION_COLUMNS[section]
+    row = []
+    used = set()
+    for position, (name, kind) in enumerate(columns):
+        if position == 0 and key is not None:
+            row.append(key)
+            continue
+        row.append(_cell(record.get(name), kind))
+        used.add(name)
+    extra = {field: value for field, value in record.items() if field not in used}
+    row.append(json.dumps(extra, ensure_ascii=False) if extra else None)
+    return row
+
+
+class _ExportWriter:
+    """Output files are written under temporary names and renamed on commit()"""
+
+    def __init__(self, path):
+        self.path = path
+        self.paths = []
+        self._tmp_paths = []
+        self._file = None
+
+    def _open(self, path, mode="w", **kwargs):
+        tmp_path = f"{path}.tmp"
+        self.paths.append(path)
+        self._tmp_paths.append(tmp_path)
+        return open(tmp_path, mode, **kwargs)
+
+    def section_path(self, section, extension):
+        root, _ = os.path.splitext(self.path)
+        return f"{root}.{section}{extension}"
+
+    def begin(self, info):
+        pass
+
+    def start_section(self, section, kind):
+        pass
+
+    def write(self, key, record):
+        raise NotImplementedError
+
+    def end_section(self):
+        pass
+
+    def finish(self, statistics):
+        pass
+
+    def commit(self):
+        for tmp_path, path in zip(self._tmp_paths, self.paths):
+            os.replace(tmp_path, path)
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+        for tmp_path in self._tmp_paths:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+
+
+class JsonExportWriter(_ExportWriter):
+    """One JSON document; records are written one per line as they arrive"""
+
+    def begin(self, info):
+        self._file = self._open(self.path, encoding="utf-8")
+        self._file.write('{\n  "export_info": ' + json.dumps(info, ensure_ascii=False))
+
+    def start_section(self, section, kind):
+        self._document = kind == DOCUMENT
+        self._first = True
+        self._file.write(f',\n  {json.dumps(section)}: ' + ("{" if self._document else "["))
+
+    def write(self, key, record):
+        self._file.write("\n    " if self._first else ",\n    ")
+        self._first = False
+        if self._document:
+            self._file.write(json.dumps(key, ensure_ascii=False) + ": ")
+        self._file.write(json.dumps(record, ensure_ascii=False))
+
+    def end_section(self):
+        closing = "}" if self._document else "]"
+        self._file.write(closing if self._first else "\n  " + closing)
+
+    def finish(self, statistics):
+        self._file.write(',\n  "system_statistics": ' + json.dumps(statistics) + "\n}\n")
+        self._file.close()
+
+class NdjsonExportWriter(_ExportWriter):
+    """One JSON object per line, tagged with its section"""
+
+    def begin(self, info):
+        self._file = self._open(self.path, encoding="utf-8")
+        self._write({"section": "export_info", "data": info})
+
+    def start_section(self, section, kind):
+        self._section = section
+
+    def _write(self, line):
+        self._file.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    def write(self, key, record):
+        line = {"section": self._section}
+        if key is not None:
+            line["key"] = key
+        line["data"] = record
+        self._write(line)
+
+    def finish(self, statistics):
+        self._write({"section": "system_statistics", "data": statistics})
+        self._file.close()
+
+class CsvExportWriter(_ExportWriter):
+    """One CSV file per section"""
+
+    def start_section(self, section, kind):
+        self._section = section
+        self._file = self._open(self.section_path(section, ".csv"), encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([name for name, _ in SECTION_COLUMNS[section]] + [EXTRA_COLUMN])
+
+    def write(self, key, record):
+        self._writer.writerow(tabular_row(self._section, key, record))
+
+    def end_section(self):
+        self._file.close()
+        self._file = None
+
+class ParquetExportWriter(_ExportWriter):
+    """One Parquet file per section, written a row group at a time"""
+
+    def __init__(self, path):
+        if pyarrow is None:
+            raise ValueError("Parquet export needs the pyarrow package")
+        super().__init__(path)
+        self._writer = None
+
+    def start_section(self, section, kind):
+        self._section = section
+        columns = SECTION_COLUMNS[section]
+        self._schema = pyarrow.schema(
+            [(name, pyarrow.int64() if kind is int else pyarrow.string()) for name, kind in columns]
+            + [(EXTRA_COLUMN, pyarrow.string())]
+        )
+        path = self.section_path(section, ".parquet")
+        self._tmp_paths.append(f"{path}.tmp")
+        self.paths.append(path)
+        self._writer = pyarrow.parquet.ParquetWriter(f"{path}.tmp", self._schema)
+        self._rows = []
+
+    def write(self, key, record):
+        self._rows.append(tabular_row(self._section, key, record))
+        if len(self._rows) >= EXPORT_BATCH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        if self._rows:
+            columns = list(zip(*self._rows))
+            self._writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(columns, self._schema)],
+                schema=self._schema,
+            ))
+            self._rows = []
+
+    def end_section(self):
+        self._flush()
+        self._writer.close()
+        self._writer = None
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+        super().abort()
+
+
+EXPORT_WRITERS = {
+    JSON_FORMAT: JsonExportWriter,
+    NDJSON_FORMAT: NdjsonExportWriter,
+    CSV_FORMAT: CsvExportWriter,
+    PARQUET_FORMAT: ParquetExportWriter,
+}
+
+
+def _section_records(storage, section, start, end, username, user_activity):
+    """Yield (key, record) for one section with the filters applied"""
+    kind, store = EXPORT_SECTIONS[section]
+    if kind == EVENTS:
+        for event in storage.iter_events_between(store, start, end, username):
+            yield None, event
+        return
+    records = storage.iter_document(store) if store is not None else iter((user_activity or {}).items())
+    for key, record in records:
+        if username is not None:
+            if section == "files_data":
+                if username not in record.get("accessed_by", []):
+                    continue
+            elif key != username:
+                continue
+        yield key, record
+
+
+def export_data(path, fmt=None, start=None, end=None, username=None, user_activity=None,
+                exported_by=None, storage=None, progress=None):
+    """Stream every store to path in the given format; returns a summary dict
+
+    progress(records_written) is called periodically; it may raise (e.g. a
+    cancelled job's JobCancelled) to abort, in which case nothing is left
+    behind at the destination.
+    """
+    storage = storage or get_storage()
+    fmt = fmt or format_for_path(path)
+    if fmt not in EXPORT_WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    started = time.monotonic()
+    writer = EXPORT_WRITERS[fmt](path)
+    counts = {}
+    roles = {"admin": 0, "user": 0}
+    written = 0
+    try:
+        writer.begin({
+            "exported_by": exported_by,
+            "export_timestamp": datetime.datetime.now().isoformat(),
+            "system_name": "SecureVault",
+            "version": "1.0",
+            "export_type": "complete_system_backup",
+            "filters": {"start": start, "end": end, "username": username},
+        })
+        for section, (kind, store) in EXPORT_SECTIONS.items():
+            if store is None and user_activity is None:
+                continue
+            writer.start_section(section, kind)
+            count = 0
+            for key, record in _section_records(storage, section, start, end, username, user_activity):
+                writer.write(key, record)
+                count += 1
+                if section == "users_data" and record.get("role") in roles:
+                    roles[record["role"]] += 1
+                written += 1
+                if progress is not None and written % EXPORT_PROGRESS_INTERVAL == 0:
+                    progress(written)
+            writer.end_section()
+            counts[section] = count
+        statistics = {
+            "total_users": counts.get("users_data", 0),
+            "total_logs": counts.get("system_logs", 0),
+            "total_files_tracked": counts.get("files_data", 0),
+            "total_encryption_operations": counts.get("encryption_activity", 0),
+            "admin_users": roles["admin"],
+            "regular_users": roles["user"],
+        }
+        if progress is not None:
+            progress(written)
+        writer.finish(statistics)
+        writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+    return {
+        "format": fmt,
+        "paths": writer.paths,
+        "sections": counts,
+        "statistics": statistics,
+        "records": written,
+        "seconds": round(time.monotonic() - started, 3),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export SecureVault data")
+    parser.add_argument("output", help="Output file; the format follows the extension unless --format is given")
+    parser.add_argument("--format", choices=EXPORT_FORMATS)
+    parser.add_argument("--filter", default="", help="e.g. 'user:alice time:2024-05-01..2024-05-07'")
+    args = parser.parse_args()
+
+    try:
+        start, end, username = parse_export_filter(args.filter)
+        result = export_data(args.output, args.format, start, end, username)
+    except (ValueError, OSError) as e:
+        print(json.dumps({"output": args.output, "error": str(e)}))
+        sys.exit(2)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,528 @@
+import json
+import os
+import atexit
+import threading
+import log_segments
+from file_lock import file_lock, lock_fd, unlock_fd, write_all
+
+# Append-only event stores (one JSON object per line)
+SYSTEM_LOG_FILE = "data/system_logs.jsonl"
+ENCRYPTION_LOG_FILE = "data/encryption_activity.jsonl"
+
+# Legacy whole-file JSON arrays, migrated once on first use
+LEGACY_LOG_FILES = {
+    SYSTEM_LOG_FILE: "data/system_logs.json",
+    ENCRYPTION_LOG_FILE: "data/encryption_activity.json",
+}
+
+# Logs that are split into rolled, compressed segments (see log_segments.py)
+SEGMENTED_LOG_FILES = {SYSTEM_LOG_FILE}
+
+# Group-commit defaults: flush after this many buffered events or this many
+# seconds. The interval plus change_watch's debounce is how long the admin
+# panels take to show a new event, so it stays well under 100 ms
+WRITER_BATCH_SIZE = 256
+WRITER_FLUSH_INTERVAL = 0.05
+# fsync after every batch (survives power loss, costs a disk round trip per batch)
+WRITER_DURABLE = False
+
+# Segment number that event refs use for lines of the live (active) file;
+# sealed segments are numbered from 1
+ACTIVE_SEGMENT = 0
+
+# Leading bytes remembered by read_tail to spot a file that was rewritten in place
+HEAD_FINGERPRINT_BYTES = 256
+
+_migrated_paths = set()
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def encode_event(entry):
+    """Serialize an event to a single JSON line"""
+    return (json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class EventWriter:
+    """Buffered writer that appends batches of events under an advisory lock"""
+
+    def __init__(self, path, batch_size=None, flush_interval=None, durable=None):
+        self.path = path
+        self.batch_size = batch_size or WRITER_BATCH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else WRITER_FLUSH_INTERVAL
+        self.durable = WRITER_DURABLE if durable is None else durable
+
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        # Serializes flushes inside this process; flock serializes across processes
+        self._flush_lock = threading.Lock()
+        # Signalled when events are queued or the writer closes
+        self._queued = threading.Condition(self._buffer_lock)
+        self._closed = False
+        self._flusher = None
+
+    def write(self, entry):
+        """Queue one event; it reaches disk on the next size or time threshold"""
+        self.write_many([entry])
+
+    def write_many(self, entries):
+        """Queue several events as part of the same group commit"""
+        lines = [encode_event(entry) for entry in entries]
+        with self._buffer_lock:
+            if self._closed:
+                raise RuntimeError(f"Event writer for {self.path} is closed")
+            self._buffer.extend(lines)
+            pending = len(self._buffer)
+            self._ensure_flusher()
+            self._queued.notify()
+
+        if pending >= self.batch_size or self.flush_interval <= 0:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered events to disk in one locked append"""
+        with self._flush_lock:
+            with self._buffer_lock:
+                lines, self._buffer = self._buffer, []
+            if not lines:
+                return 0
+
+            ensure_migrated(self.path)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            data = b"".join(lines)
+            if is_segmented(self.path) and log_segments.needs_roll(self.path, len(data)):
+                # Flushes can run on the UI thread, so only the rename happens
+                # here; the segment is compressed in the background
+                log_segments.roll(self.path, seal=False)
+
+            fd = _open_locked_for_append(self.path)
+            try:
+                try:
+                    write_all(fd, data)
+                    if self.durable:
+                        os.fsync(fd)
+                finally:
+                    unlock_fd(fd)
+            finally:
+                os.close(fd)
+            return len(lines)
+
+    def close(self):
+        """Flush remaining events and stop the background flusher"""
+        with self._buffer_lock:
+            self._closed = True
+            self._queued.notify_all()
+        self.flush()
+
+    def _ensure_flusher(self):
+        if self._flusher is None and self.flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            with self._buffer_lock:
+                # Sleep without a timeout until something is queued: no work when idle
+                self._queued.wait_for(lambda: self._buffer or self._closed)
+                if self._closed:
+                    return
+                # Give the batch up to flush_interval to fill before committing it
+                self._queued.wait_for(lambda: self._closed, self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Debug - Background flush of {self.path} failed: {e}")
+
+
+def _open_locked_for_append(path):
+    """Open a log for appending and lock it, retrying if it is rolled away meanwhile"""
+    while True:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        lock_fd(fd)
+        try:
+            if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        # Another process renamed it into a segment between our open and lock
+        unlock_fd(fd)
+        os.close(fd)
+
+
+def is_segmented(path):
+    return path in SEGMENTED_LOG_FILES
+
+
+def get_writer(path):
+    """Return the process-wide writer for an event store"""
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = EventWriter(path)
+            _writers[path] = writer
+        return writer
+
+
+def configure_writers(batch_size=None, flush_interval=None, durable=None):
+    """Change the group-commit settings for writers created from now on"""
+    global WRITER_BATCH_SIZE, WRITER_FLUSH_INTERVAL, WRITER_DURABLE
+    flush_all()
+    with _writers_lock:
+        if batch_size is not None:
+            WRITER_BATCH_SIZE = batch_size
+        if flush_interval is not None:
+            WRITER_FLUSH_INTERVAL = flush_interval
+        if durable is not None:
+            WRITER_DURABLE = durable
+        for writer in _writers.values():
+            writer.close()
+        _writers.clear()
+
+
+def flush_all():
+    """Flush every buffered writer in this process"""
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.flush()
+
+
+def flush_path(path):
+    """Flush this process's pending events for one store, if any"""
+    with _writers_lock:
+        writer = _writers.get(path)
+    if writer is not None:
+        writer.flush()
+
+
+atexit.register(flush_all)
+
+
+def append_event(path, entry):
+    """Append one event to a JSONL store through its buffered writer"""
+    get_writer(path).write(entry)
+
+
+def iter_events(path, segments=True):
+    """Yield events from a JSONL store, skipping blank or partial lines
+
+    For a segmented log this includes every sealed segment, oldest first,
+    unless segments is False.
+    """
+    ensure_migrated(path)
+    flush_path(path)
+    if segments and is_segmented(path):
+        for sequence in log_segments.list_segments(path):
+            yield from log_segments.iter_segment(path, sequence)
+    if not os.path.exists(path):
+        return
+
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                # A writer is still in the middle of this line
+                break
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def scan_tail(path, cursor, visit, on_reset=None):
+    """Call visit(offset, event) for each complete event appended after cursor
+
+    Returns (new_cursor, reset). The cursor records the file's inode, the
+    byte offset already consumed and a fingerprint of the file's first bytes;
+    reset is True when the file was truncated, replaced or rewritten since
+    the cursor was taken, in which case on_reset() is called and the whole
+    file is scanned again.
+    """
+    ensure_migrated(path)
+    flush_path(path)
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        reset = cursor is not None and cursor[1] > 0
+        if reset and on_reset is not None:
+            on_reset()
+        return None, reset
+
+    with f:
+        inode = os.fstat(f.fileno()).st_ino
+        size = os.fstat(f.fileno()).st_size
+        head = f.read(HEAD_FINGERPRINT_BYTES)
+
+        offset = 0
+        reset = False
+        if cursor is not None:
+            old_inode, old_offset, fingerprint = cursor
+            if inode != old_inode or size < old_offset or not head.startswith(fingerprint):
+                reset = old_offset > 0
+            else:
+                offset = old_offset
+        if reset and on_reset is not None:
+            on_reset()
+
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                # A writer is still in the middle of this line
+                break
+            line_offset = offset
+            offset += len(line)
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            visit(line_offset, event)
+
+    return (inode, offset, head[:offset]), reset
+
+
+def scan_log_tail(path, cursor, visit, on_reset=None):
+    """Like scan_tail, but follows a segmented log across rolls: visit(event)
+
+    If the active segment the cursor points into has been rolled away, the
+    rest of it and any later segments are replayed before the new active
+    segment, so a roll is not a reset. A reset (cleared log or lost
+    segment) replays every sealed segment after on_reset().
+    """
+    return scan_log_refs(path, cursor, lambda segment, offset, event: visit(event), on_reset)
+
+
+def scan_log_refs(path, cursor, visit, on_reset=None, on_roll=None):
+    """Like scan_log_tail, but visit(segment, offset, event) says where each event is
+
+    segment is a sealed segment's number or ACTIVE_SEGMENT, and offset is
+    the byte offset of the event's line in it; read_event_refs() fetches the
+    event again from that ref. on_roll(sequence) is called, before any visit,
+    when the active file the cursor pointed into has been sealed as segment
+    sequence: lines reported under ACTIVE_SEGMENT until now live there.
+    """
+    def visit_line(offset, event):
+        visit(ACTIVE_SEGMENT, offset, event)
+
+    if not is_segmented(path):
+        return scan_tail(path, cursor, visit_line, on_reset)
+
+    replay = None
+    active_cursor = cursor
+    reset = False
+    if cursor is None:
+        replay = [(sequence, 0) for sequence in log_segments.list_segments(path)]
+    else:
+        if not _is_same_file(path, cursor):
+            active_cursor = None
+            replay = log_segments.segments_after_cursor(path, *cursor)
+            if replay is None:
+                reset = True
+                if on_reset is not None:
+                    on_reset()
+                replay = [(sequence, 0) for sequence in log_segments.list_segments(path)]
+            elif on_roll is not None:
+                on_roll(replay[0][0])
+
+    for sequence, skip_bytes in replay or ():
+        for offset, event in log_segments.iter_segment_lines(path, sequence, skip_bytes):
+            visit(sequence, offset, event)
+
+    new_cursor, active_reset = scan_tail(path, active_cursor, visit_line, on_reset)
+    if active_reset:
+        # Rolled or cleared after we looked; start over with a full replay
+        if on_reset is not None:
+            on_reset()
+        new_cursor, _ = scan_log_refs(path, None, visit)
+        return new_cursor, True
+    return new_cursor, reset
+
+
+def read_event_refs(path, refs, cursor=None):
+    """Fetch events by the (segment, offset) refs scan_log_refs reported
+
+    Returns a list parallel to refs, with None for events that are gone
+    (cleared, or removed by retention). cursor is the scan cursor the refs
+    were collected under: if the active file has been rolled since, refs
+    into ACTIVE_SEGMENT are read from the segment it became.
+    """
+    flush_path(path)
+    wanted = {}
+    for position, (segment, offset) in enumerate(refs):
+        wanted.setdefault(segment, []).append((offset, position))
+
+    events = [None] * len(refs)
+    for segment, lines in wanted.items():
+        try:
+            f = _open_ref_segment(path, segment, cursor)
+        except FileNotFoundError:
+            continue
+        if f is None:
+            continue
+        with f:
+            # Ascending offsets: a compressed segment is only ever read forwards
+            for offset, position in sorted(lines):
+                f.seek(offset)
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    continue
+                try:
+                    events[position] = json.loads(line)
+                except ValueError:
+                    continue
+    return events
+
+
+def _open_ref_segment(path, segment, cursor):
+    if segment != ACTIVE_SEGMENT:
+        return log_segments.open_segment(path, segment)
+    if cursor is None or not is_segmented(path) or _is_same_file(path, cursor):
+        return open(path, "rb")
+    replay = log_segments.segments_after_cursor(path, *cursor)
+    if replay is None:
+        return None
+    return log_segments.open_segment(path, replay[0][0])
+
+
+def _is_same_file(path, cursor):
+    """True if the file at path is still the one a scan_tail cursor was taken on"""
+    inode, offset, fingerprint = cursor
+    try:
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            return st.st_ino == inode and st.st_size >= offset and f.read(len(fingerprint)) == fingerprint
+    except FileNotFoundError:
+        return False
+
+
+def read_tail(path, cursor=None):
+    """Read events appended after cursor, returning (events, new_cursor, reset)"""
+    events = []
+    cursor, reset = scan_log_tail(path, cursor, events.append, on_reset=events.clear)
+    return events, cursor, reset
+
+
+def iter_range(path, start, end):
+    """Yield events whose lines start within the byte range [start, end)"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        for line in f:
+            if offset >= end or not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def read_last(path, count, end, block_size=64 * 1024):
+    """Return up to count events from the lines just before byte offset end"""
+    lines = []
+    with open(path, "rb") as f:
+        position = end
+        remainder = b""
+        while position > 0 and len(lines) <= count:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            block = f.read(read_size) + remainder
+            parts = block.split(b"\n")
+            # parts[0] may be a partial line unless we reached the file start
+            remainder = parts[0]
+            lines = [part for part in parts[1:] if part.strip()] + lines
+        if position == 0 and remainder.strip():
+            lines.insert(0, remainder)
+
+    events = []
+    for line in lines[-count:] if count else []:
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            continue
+    return events
+
+
+def read_events(path):
+    """Load all events from a JSONL store as a list"""
+    return list(iter_events(path))
+
+
+def clear_events(path):
+    """Truncate a JSONL store to zero events (dropping any sealed segments)"""
+    ensure_migrated(path)
+    flush_path(path)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    # Take the same lock appenders use so no batch is cut in half
+    fd = _open_locked_for_append(path)
+    try:
+        try:
+            os.ftruncate(fd, 0)
+        finally:
+            unlock_fd(fd)
+    finally:
+        os.close(fd)
+    if is_segmented(path):
+        log_segments.remove_all(path)
+
+
+def migrate_json_log(json_path, jsonl_path):
+    """Convert a legacy JSON array log into a JSONL store, returning the event count"""
+    if not os.path.exists(json_path):
+        return 0
+
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            legacy_events = json.load(f)
+    except ValueError:
+        legacy_events = []
+    if not isinstance(legacy_events, list):
+        legacy_events = []
+
+    directory = os.path.dirname(jsonl_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    # Legacy events are older than anything already appended, so they go first
+    tmp_path = jsonl_path + ".migrating"
+    with open(tmp_path, "wb") as out:
+        for entry in legacy_events:
+            out.write(encode_event(entry))
+        if os.path.exists(jsonl_path):
+            with open(jsonl_path, "rb") as existing:
+                for line in existing:
+                    out.write(line)
+        out.flush()
+        os.fsync(out.fileno())
+
+    os.replace(tmp_path, jsonl_path)
+    os.replace(json_path, json_path + ".migrated")
+    return len(legacy_events)
+
+
+def ensure_migrated(path):
+    """Run the one-time legacy migration for a JSONL store if still pending"""
+    if path in _migrated_paths:
+        return
+    legacy_path = LEGACY_LOG_FILES.get(path)
+    if legacy_path and os.path.exists(legacy_path):
+        # Only one process may migrate; the others find the legacy file gone
+        with file_lock(path):
+            if os.path.exists(legacy_path):
+                migrated = migrate_json_log(legacy_path, path)
+                print(f"Debug - Migrated {migrated} events from {legacy_path} to {path}")
+    _migrated_paths.add(path)
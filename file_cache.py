@@ -0,0 +1,93 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Upper bound on the on-disk size of cached files (parsed objects are larger,
+# but proportional, so this keeps memory use bounded and predictable)
+FILE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def file_signature(path):
+    """Return (mtime_ns, size, inode) for a path, or None if it doesn't exist"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class FileCache:
+    """LRU cache of parsed files, validated against the file's stat signature
+
+    Cached objects are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes=FILE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load(self, path, loader, default=None):
+        """Return loader(path), reusing the last result while the file is unchanged"""
+        signature = file_signature(path)
+        if signature is None:
+            return default
+
+        with self._lock:
+            cached = self._entries.get(path)
+            if cached is not None and cached[0] == signature:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        # Parse outside the lock so one large file doesn't block other readers
+        value = loader(path)
+
+        with self._lock:
+            self._discard(path)
+            size = signature[1]
+            if size <= self.max_bytes:
+                self._entries[path] = (signature, value)
+                self._total_bytes += size
+                while self._total_bytes > self.max_bytes:
+                    oldest = next(iter(self._entries))
+                    self._discard(oldest)
+                    self.evictions += 1
+        return value
+
+    def invalidate(self, path=None):
+        """Drop one cached path, or everything when path is None"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._total_bytes = 0
+            else:
+                self._discard(path)
+
+    def stats(self):
+        """Return hit/miss counters and current usage"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _discard(self, path):
+        cached = self._entries.pop(path, None)
+        if cached is not None:
+            self._total_bytes -= cached[0][1]
+
+
+# Process-wide cache used by the JSON storage backend
+default_cache = FileCache()
@@ -0,0 +1,555 @@
+import os
+import hmac
+import struct
+import base64
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidTag
+
+# Encrypted file layout (version 2):
+#   header:  MAGIC | version (1) | chunk size (4) | salt (16) | HMAC-SHA256 of those
+#   records: ciphertext length (4) | AES-GCM ciphertext+tag, one per chunk
+#   index:   INDEX_MARKER (4) | length (4) | AES-GCM(plaintext size, block count,
+#            offset of every record)
+#   trailer: offset of the index (8) | TRAILER_MAGIC
+# Every chunk's nonce carries its sequence number and its associated data
+# carries the header and a final-chunk flag, so reordered, dropped, repeated
+# or truncated chunks all fail authentication. The index makes any block
+# addressable without reading the ones before it (see EncryptedFileReader).
+# Version 1 files are the same without the header MAC, index and trailer.
+FILE_MAGIC = b"SVLTF"
+FILE_FORMAT_VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+FILE_CHUNK_SIZE = 1024 * 1024
+FILE_SALT_BYTES = 16
+FILE_HEADER = struct.Struct(f">{len(FILE_MAGIC)}sBI{FILE_SALT_BYTES}s")
+HEADER_MAC_BYTES = 32
+RECORD_HEADER = struct.Struct(">I")
+TAG_BYTES = 16
+# Record length value that can never be a chunk; starts the index section
+INDEX_MARKER = 0xFFFFFFFF
+INDEX_HEADER = struct.Struct(">QQ")
+INDEX_ENTRY = struct.Struct(">Q")
+FILE_TRAILER = struct.Struct(">Q8s")
+TRAILER_MAGIC = b"SVLTINDX"
+# Refuse absurd chunk sizes from a corrupted header instead of allocating them
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+ENCRYPTED_FILE_SUFFIX = ".svlt"
+# Threads used to seal/open chunks; override with SECUREVAULT_CRYPTO_WORKERS
+FILE_CRYPTO_WORKERS = int(os.environ.get("SECUREVAULT_CRYPTO_WORKERS", 0)) or os.cpu_count() or 1
+
+
+class StreamIntegrityError(Exception):
+    """Raised when an encrypted stream is corrupt, truncated, reordered or keyed differently"""
+
+
+def derive_file_key(user_key, salt):
+    """Derive a per-file AES-256 key from a user's Fernet key and a random salt"""
+    return HKDF(
+        algorithm=hashes.SHA256(), length=32, salt=salt,
+        info=b"securevault file encryption v1"
+    ).derive(base64.urlsafe_b64decode(user_key))
+
+
+def derive_header_key(user_key, salt):
+    """Derive the per-file key that authenticates a version 2 header"""
+    return HKDF(
+        algorithm=hashes.SHA256(), length=32, salt=salt,
+        info=b"securevault file header v2"
+    ).derive(base64.urlsafe_b64decode(user_key))
+
+
+def _header_mac(user_key, salt, header):
+    return hmac.new(derive_header_key(user_key, salt), header, hashlib.sha256).digest()
+
+
+def _nonce(sequence):
+    return struct.pack(">IQ", 0, sequence)
+
+
+# Distinct nonce prefix, so the index can never collide with a chunk nonce
+INDEX_NONCE = struct.pack(">IQ", 1, 0)
+
+
+def _associated_data(header, final):
+    return header + (b"\x01" if final else b"\x00")
+
+
+def _index_associated_data(header):
+    return header + b"index"
+
+
+def _read_exact(src, size):
+    data = src.read(size)
+    while data is not None and len(data) < size:
+        more = src.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data or b""
+
+
+def _ordered_map(func, items, workers, window):
+    """Yield func(item) for each item, in order, using up to `workers` threads
+
+    At most `window` items are submitted but not yet consumed, which bounds
+    how many chunks are held in memory at once. cryptography releases the
+    GIL around OpenSSL calls, so threads scale with cores for large chunks.
+    """
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="file-crypto") as pool:
+        try:
+            for item in items:
+                pending.append(pool.submit(func, item))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _window(workers, max_in_flight):
+    return max_in_flight or workers * 2
+
+
+def _read_chunks(src, chunk_size):
+    """Yield (sequence, chunk, final), peeking one byte ahead to spot the last
+
+    Only the byte is held back, not the next chunk, so the reader adds
+    nothing to the chunks in flight.
+    """
+    sequence = 0
+    chunk = _read_exact(src, chunk_size)
+    while True:
+        peek = _read_exact(src, 1) if len(chunk) == chunk_size else b""
+        final = not peek
+        yield sequence, chunk, final
+        if final:
+            return
+        sequence += 1
+        chunk = peek + _read_exact(src, chunk_size - 1)
+
+
+def encrypt_stream(user_key, src, dst, chunk_size=FILE_CHUNK_SIZE, progress=None,
+                   workers=None, max_in_flight=None):
+    """Encrypt a binary stream chunk by chunk; returns (bytes_read, bytes_written)
+
+    Chunks are sealed independently, on `workers` threads (default
+    FILE_CRYPTO_WORKERS), and written in order. At most max_in_flight chunks
+    (default twice the worker count) are held in memory regardless of input
+    size; the block index kept for the trailer costs 8 bytes per chunk.
+    progress(bytes_read), if given, is called after every chunk.
+    """
+    if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+        raise ValueError(f"chunk_size must be between 1 and {MAX_CHUNK_SIZE}")
+    workers = workers or FILE_CRYPTO_WORKERS
+    sealer = _Sealer(user_key, chunk_size)
+    sealed = _ordered_map(lambda item: sealer.seal(*item), _read_chunks(src, chunk_size),
+                          workers, _window(workers, max_in_flight))
+    return sealer.write(dst, sealed, progress)
+
+
+class _Sealer:
+    """Seals chunks into a new version 2 stream under a fresh salt"""
+
+    def __init__(self, user_key, chunk_size):
+        salt = os.urandom(FILE_SALT_BYTES)
+        self.header = FILE_HEADER.pack(FILE_MAGIC, FILE_FORMAT_VERSION, chunk_size, salt)
+        self._header_mac = _header_mac(user_key, salt, self.header)
+        self._aead = AESGCM(derive_file_key(user_key, salt))
+
+    def seal(self, sequence, chunk, final):
+        """Return (plaintext length, ciphertext) of one chunk; thread-safe"""
+        return len(chunk), self._aead.encrypt(_nonce(sequence), chunk, _associated_data(self.header, final))
+
+    def write(self, dst, sealed, progress=None):
+        """Write the stream around (plaintext length, ciphertext) records taken
+        in order from sealed; returns (bytes_read, bytes_written)"""
+        dst.write(self.header)
+        dst.write(self._header_mac)
+        bytes_read = 0
+        bytes_written = len(self.header) + HEADER_MAC_BYTES
+        offsets = []
+        for plain_length, ciphertext in sealed:
+            offsets.append(bytes_written)
+            dst.write(RECORD_HEADER.pack(len(ciphertext)))
+            dst.write(ciphertext)
+            bytes_read += plain_length
+            bytes_written += RECORD_HEADER.size + len(ciphertext)
+            if progress:
+                progress(bytes_read)
+
+        index = INDEX_HEADER.pack(bytes_read, len(offsets)) + struct.pack(f">{len(offsets)}Q", *offsets)
+        sealed_index = self._aead.encrypt(INDEX_NONCE, index, _index_associated_data(self.header))
+        index_offset = bytes_written
+        dst.write(RECORD_HEADER.pack(INDEX_MARKER))
+        dst.write(RECORD_HEADER.pack(len(sealed_index)))
+        dst.write(sealed_index)
+        dst.write(FILE_TRAILER.pack(index_offset, TRAILER_MAGIC))
+        bytes_written += 2 * RECORD_HEADER.size + len(sealed_index) + FILE_TRAILER.size
+        return bytes_read, bytes_written
+
+
+def _read_header(user_key, src):
+    """Read and verify a file header; returns (header, version, chunk_size, salt, length)"""
+    header = _read_exact(src, FILE_HEADER.size)
+    if len(header) < FILE_HEADER.size:
+        raise StreamIntegrityError("Not a SecureVault encrypted file (header too short)")
+    magic, version, chunk_size, salt = FILE_HEADER.unpack(header)
+    if magic != FILE_MAGIC:
+        raise StreamIntegrityError("Not a SecureVault encrypted file")
+    if version not in SUPPORTED_VERSIONS:
+        raise StreamIntegrityError(f"Unsupported encrypted file version {version}")
+    length = len(header)
+    if version >= 2:
+        mac = _read_exact(src, HEADER_MAC_BYTES)
+        if not hmac.compare_digest(mac, _header_mac(user_key, salt, header)):
+            raise StreamIntegrityError("Header failed authentication (wrong key or tampered header)")
+        length += HEADER_MAC_BYTES
+    if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+        raise StreamIntegrityError("Corrupt header (invalid chunk size)")
+    return header, version, chunk_size, salt, length
+
+
+def _read_records(src, chunk_size, version, start_offset):
+    """Yield (sequence, ciphertext, final, offset) records, reading one length ahead
+
+    A version 1 stream ends at end of file; a version 2 stream ends at the
+    index marker, which is consumed so the caller can read the index next.
+    """
+    sequence = 0
+    offset = start_offset
+    length_bytes = _read_exact(src, RECORD_HEADER.size)
+    if not length_bytes:
+        raise StreamIntegrityError("Encrypted file is truncated (no chunks)")
+    while True:
+        if len(length_bytes) < RECORD_HEADER.size:
+            raise StreamIntegrityError("Encrypted file is truncated mid-record")
+        (length,) = RECORD_HEADER.unpack(length_bytes)
+        if not TAG_BYTES <= length <= chunk_size + TAG_BYTES:
+            raise StreamIntegrityError(f"Corrupt record length in chunk {sequence}")
+        ciphertext = _read_exact(src, length)
+        if len(ciphertext) < length:
+            raise StreamIntegrityError("Encrypted file is truncated mid-chunk")
+        length_bytes = _read_exact(src, RECORD_HEADER.size)
+        if version >= 2:
+            if not length_bytes:
+                raise StreamIntegrityError("Encrypted file is truncated (block index missing)")
+            final = length_bytes == RECORD_HEADER.pack(INDEX_MARKER)
+        else:
+            final = not length_bytes
+        yield sequence, ciphertext, final, offset
+        if final:
+            return
+        sequence += 1
+        offset += RECORD_HEADER.size + length
+
+
+def _open_index(aead, header, sealed_index):
+    """Decrypt a block index; returns (plaintext_size, offsets)"""
+    try:
+        index = aead.decrypt(INDEX_NONCE, sealed_index, _index_associated_data(header))
+    except InvalidTag:
+        raise StreamIntegrityError("Block index failed authentication (tampered or truncated)") from None
+    if len(index) < INDEX_HEADER.size:
+        raise StreamIntegrityError("Corrupt block index")
+    plaintext_size, block_count = INDEX_HEADER.unpack_from(index)
+    if len(index) != INDEX_HEADER.size + block_count * INDEX_ENTRY.size:
+        raise StreamIntegrityError("Corrupt block index (wrong entry count)")
+    offsets = list(struct.unpack_from(f">{block_count}Q", index, INDEX_HEADER.size))
+    return plaintext_size, offsets
+
+
+class _ChunkSource:
+    """Verified plaintext chunks of an encrypted stream, in order
+
+    The header is read and authenticated on construction; chunks() then
+    yields (sequence, plaintext, final) and, for version 2, checks the block
+    index and trailer once the last chunk is out. bytes_read and
+    bytes_written track the ciphertext consumed and plaintext produced.
+    """
+
+    def __init__(self, user_key, src):
+        self.header, self.version, self.chunk_size, salt, header_length = _read_header(user_key, src)
+        self._src = src
+        self._aead = AESGCM(derive_file_key(user_key, salt))
+        self._header_length = header_length
+        self.bytes_read = header_length
+        self.bytes_written = 0
+
+    def _open_record(self, item):
+        sequence, ciphertext, final, offset = item
+        nonce = _nonce(sequence)
+        try:
+            plaintext = self._aead.decrypt(nonce, ciphertext, _associated_data(self.header, final))
+            return sequence, len(ciphertext), offset, plaintext, final
+        except InvalidTag:
+            pass
+        if final:
+            # The stream ended on a chunk that was not written as the last one
+            try:
+                self._aead.decrypt(nonce, ciphertext, _associated_data(self.header, False))
+                raise StreamIntegrityError("Encrypted file is truncated (final chunk missing)")
+            except InvalidTag:
+                pass
+        raise StreamIntegrityError(
+            f"Chunk {sequence} failed authentication (wrong key, tampered or reordered)"
+        )
+
+    def chunks(self, workers, window, progress=None, after=None):
+        """Yield (sequence, plaintext, final) in order
+
+        after(sequence, plaintext, final), if given, runs on the worker right
+        after the chunk is opened, and its result is yielded instead of the
+        plaintext, which is then never queued.
+        """
+        def open_record(item):
+            sequence, record_length, offset, plaintext, final = self._open_record(item)
+            result = plaintext if after is None else after(sequence, plaintext, final)
+            return sequence, record_length, offset, len(plaintext), result, final
+
+        offsets = []
+        records = _read_records(self._src, self.chunk_size, self.version, self._header_length)
+        for sequence, record_length, offset, plain_length, result, final in _ordered_map(
+                open_record, records, workers, window):
+            offsets.append(offset)
+            self.bytes_read += RECORD_HEADER.size + record_length
+            self.bytes_written += plain_length
+            if progress:
+                progress(self.bytes_read)
+            yield sequence, result, final
+        if self.version >= 2:
+            self._check_index(offsets)
+
+    def _check_index(self, offsets):
+        # The index marker was consumed by _read_records; check the index
+        # agrees with what was streamed, then the trailer
+        src = self._src
+        index_offset = self.bytes_read
+        length_bytes = _read_exact(src, RECORD_HEADER.size)
+        if len(length_bytes) < RECORD_HEADER.size:
+            raise StreamIntegrityError("Encrypted file is truncated (block index missing)")
+        (index_length,) = RECORD_HEADER.unpack(length_bytes)
+        sealed_index = _read_exact(src, index_length)
+        if len(sealed_index) < index_length:
+            raise StreamIntegrityError("Encrypted file is truncated (block index incomplete)")
+        plaintext_size, index_offsets = _open_index(self._aead, self.header, sealed_index)
+        if plaintext_size != self.bytes_written or index_offsets != offsets:
+            raise StreamIntegrityError("Block index does not match the file's blocks")
+        trailer = _read_exact(src, FILE_TRAILER.size)
+        if len(trailer) < FILE_TRAILER.size or FILE_TRAILER.unpack(trailer) != (index_offset, TRAILER_MAGIC):
+            raise StreamIntegrityError("Corrupt or missing trailer")
+        self.bytes_read += 2 * RECORD_HEADER.size + index_length + FILE_TRAILER.size
+        if src.read(1):
+            raise StreamIntegrityError("Unexpected data after the trailer")
+
+
+def decrypt_stream(user_key, src, dst, progress=None, workers=None, max_in_flight=None):
+    """Decrypt a stream written by encrypt_stream; returns (bytes_read, bytes_written)
+
+    Raises StreamIntegrityError as soon as a chunk fails authentication or the
+    stream ends before its final chunk. Plaintext of the chunks verified so far
+    has already been written to dst by then, so callers writing to a file
+    should discard it on error (decrypt_file does).
+    """
+    source = _ChunkSource(user_key, src)
+    workers = workers or FILE_CRYPTO_WORKERS
+    for _, plaintext, _ in source.chunks(workers, _window(workers, max_in_flight), progress):
+        dst.write(plaintext)
+    return source.bytes_read, source.bytes_written
+
+
+def reencrypt_stream(user_key, src, dst, new_key, progress=None, workers=1, max_in_flight=None):
+    """Re-encrypt a stream from user_key to new_key; returns (bytes_read, bytes_written)
+
+    Each chunk is decrypted and sealed again under the new key (with a fresh
+    salt, keeping the chunk size) in the same worker call, so plaintext never
+    touches disk and is never queued: at most max_in_flight chunks (default
+    the worker count) are in flight, one per worker. Version 1 input is
+    written out as version 2. progress(bytes_read) reports ciphertext consumed.
+    """
+    source = _ChunkSource(user_key, src)
+    sealer = _Sealer(new_key, source.chunk_size)
+    chunks = source.chunks(workers, max_in_flight or workers, progress, after=sealer.seal)
+    _, bytes_written = sealer.write(dst, (sealed for _, sealed, _ in chunks))
+    return source.bytes_read, bytes_written
+
+
+def key_opens_file(user_key, path):
+    """True if path was encrypted with user_key
+
+    Checks the header MAC, or for a version 1 file (which has none) the
+    first block; nothing else is decrypted.
+    """
+    try:
+        with EncryptedFileReader(user_key, path) as reader:
+            if reader.version < 2:
+                reader._block(0)
+        return True
+    except StreamIntegrityError:
+        return False
+
+
+def is_encrypted_file(path):
+    """True if the file starts with the SecureVault encrypted file magic"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(FILE_MAGIC)) == FILE_MAGIC
+    except OSError:
+        return False
+
+
+class EncryptedFileReader:
+    """Random-access reader for an encrypted file
+
+    The header is authenticated and the block index (version 2) decrypted
+    and sanity-checked on open; read(offset, length) then decrypts only the
+    blocks covering the requested range, each verified on its own. Version 1
+    files have no index, but their fixed-size records let offsets be
+    computed from the file size.
+    """
+
+    def __init__(self, user_key, path):
+        self._file = open(path, "rb")
+        try:
+            self._open(user_key)
+        except BaseException:
+            self._file.close()
+            raise
+        self._cached_block = None
+
+    def _open(self, user_key):
+        self._header, self.version, self.chunk_size, salt, header_length = _read_header(user_key, self._file)
+        self._aead = AESGCM(derive_file_key(user_key, salt))
+        file_size = os.fstat(self._file.fileno()).st_size
+        record_size = RECORD_HEADER.size + self.chunk_size + TAG_BYTES
+
+        if self.version >= 2:
+            if file_size < header_length + FILE_TRAILER.size:
+                raise StreamIntegrityError("Encrypted file is truncated (trailer missing)")
+            self._file.seek(file_size - FILE_TRAILER.size)
+            index_offset, magic = FILE_TRAILER.unpack(self._file.read(FILE_TRAILER.size))
+            if magic != TRAILER_MAGIC or not header_length <= index_offset < file_size - FILE_TRAILER.size:
+                raise StreamIntegrityError("Corrupt or missing trailer")
+            self._file.seek(index_offset)
+            index_header = _read_exact(self._file, 2 * RECORD_HEADER.size)
+            if len(index_header) < 2 * RECORD_HEADER.size:
+                raise StreamIntegrityError("Corrupt block index header")
+            marker, index_length = struct.unpack(">II", index_header)
+            if marker != INDEX_MARKER or index_offset + len(index_header) + index_length + FILE_TRAILER.size != file_size:
+                raise StreamIntegrityError("Corrupt block index header")
+            self.size, self._offsets = _open_index(self._aead, self._header, self._file.read(index_length))
+            self._data_end = index_offset
+        else:
+            data_length = file_size - header_length
+            block_count = -(-data_length // record_size)
+            self._offsets = [header_length + i * record_size for i in range(block_count)]
+            self.size = max(data_length - block_count * (RECORD_HEADER.size + TAG_BYTES), 0)
+            self._data_end = file_size
+
+        # Every block but the last holds exactly chunk_size bytes, at fixed strides
+        expected_blocks = max(-(-self.size // self.chunk_size), 1)
+        if len(self._offsets) != expected_blocks or any(
+                offset != header_length + i * record_size for i, offset in enumerate(self._offsets)):
+            raise StreamIntegrityError("Block index is inconsistent with the file size")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def __len__(self):
+        return self.size
+
+    def _block(self, number):
+        if self._cached_block and self._cached_block[0] == number:
+            return self._cached_block[1]
+        final = number == len(self._offsets) - 1
+        start = self._offsets[number]
+        end = self._data_end if final else self._offsets[number + 1]
+        self._file.seek(start)
+        record = _read_exact(self._file, end - start)
+        if len(record) != end - start:
+            raise StreamIntegrityError(f"Block {number} is truncated")
+        (length,) = RECORD_HEADER.unpack_from(record)
+        if length != len(record) - RECORD_HEADER.size:
+            raise StreamIntegrityError(f"Corrupt record length in block {number}")
+        try:
+            plaintext = self._aead.decrypt(_nonce(number), record[RECORD_HEADER.size:],
+                                           _associated_data(self._header, final))
+        except InvalidTag:
+            raise StreamIntegrityError(
+                f"Block {number} failed authentication (tampered, truncated or reordered)"
+            ) from None
+        self._cached_block = (number, plaintext)
+        return plaintext
+
+    def read(self, offset, length):
+        """Return up to length plaintext bytes starting at offset"""
+        if offset < 0 or length < 0:
+            raise ValueError("offset and length must be non-negative")
+        end = min(offset + length, self.size)
+        if offset >= end:
+            return b""
+        parts = []
+        for number in range(offset // self.chunk_size, (end - 1) // self.chunk_size + 1):
+            block_start = number * self.chunk_size
+            block = self._block(number)
+            parts.append(block[max(offset - block_start, 0):end - block_start])
+        return b"".join(parts)
+
+
+def _transform_file(transform, user_key, input_path, output_path, **kwargs):
+    # Write next to the target and rename on success, so a failed or
+    # interrupted run never leaves a partial (or unauthenticated) output
+    temp_path = output_path + ".part"
+    try:
+        with open(input_path, "rb") as src, open(temp_path, "wb") as dst:
+            result = transform(user_key, src, dst, **kwargs)
+        os.replace(temp_path, output_path)
+        return result
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def encrypt_file(user_key, input_path, output_path, chunk_size=FILE_CHUNK_SIZE, progress=None,
+                 workers=None, max_in_flight=None):
+    """Encrypt a file to output_path; returns (bytes_read, bytes_written)"""
+    return _transform_file(encrypt_stream, user_key, input_path, output_path,
+                           chunk_size=chunk_size, progress=progress,
+                           workers=workers, max_in_flight=max_in_flight)
+
+
+def decrypt_file(user_key, input_path, output_path, progress=None, workers=None, max_in_flight=None):
+    """Decrypt a file to output_path; returns (bytes_read, bytes_written)"""
+    return _transform_file(decrypt_stream, user_key, input_path, output_path,
+                           progress=progress, workers=workers, max_in_flight=max_in_flight)
+
+
+def reencrypt_file(user_key, path, new_key, progress=None, workers=1, max_in_flight=None):
+    """Re-encrypt an encrypted file in place under new_key; returns (bytes_read, bytes_written)
+
+    The new file is written alongside and renamed over the original only once
+    it is complete, so an interrupted run leaves the old version intact.
+    """
+    return _transform_file(reencrypt_stream, user_key, path, path, new_key=new_key,
+                           progress=progress, workers=workers, max_in_flight=max_in_flight)
@@ -0,0 +1,78 @@
+import os
+import json
+import contextlib
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks on this platform (e.g. Windows); access is unlocked
+    fcntl = None
+
+
+def lock_fd(fd, shared=False):
+    """Block until an advisory lock on an open file descriptor is held"""
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+
+
+def unlock_fd(fd):
+    """Release an advisory lock taken with lock_fd"""
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def file_lock(path, shared=False):
+    """Hold an advisory lock on the sidecar "<path>.lock" file"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        lock_fd(fd, shared)
+        try:
+            yield
+        finally:
+            unlock_fd(fd)
+    finally:
+        os.close(fd)
+
+
+def write_all(fd, data):
+    """Write every byte of data, retrying short writes"""
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def atomic_write_json(path, data, durable=True):
+    """Replace a JSON file atomically so readers never see a truncated document"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.flush()
+        if durable:
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def update_json_file(path, update, default=None):
+    """Run a locked read-modify-write cycle on a JSON document"""
+    with file_lock(path):
+        data = default() if callable(default) else default
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except ValueError:
+                print(f"Debug - Corrupt JSON in {path}, starting from default")
+
+        result = update(data)
+        atomic_write_json(path, data)
+        return result
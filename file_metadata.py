@@ -0,0 +1,151 @@
+import atexit
+import datetime
+import threading
+from storage import get_storage, FILES
+
+# Flush coalesced access records after this many distinct files or this many seconds
+METADATA_BATCH_SIZE = 256
+METADATA_FLUSH_INTERVAL = 2.0
+
+
+class FileAccessDelta:
+    """Accesses to one file not yet written: a count, a time range and a user set"""
+
+    __slots__ = ("full_path", "count", "first_access", "last_access", "accessed_by", "file_size")
+
+    def __init__(self, full_path):
+        self.full_path = full_path
+        self.count = 0
+        self.first_access = None
+        self.last_access = None
+        self.accessed_by = set()
+        self.file_size = None
+
+    def add(self, full_path, username, timestamp, file_size):
+        self.full_path = full_path
+        self.count += 1
+        if self.first_access is None or timestamp < self.first_access:
+            self.first_access = timestamp
+        if self.last_access is None or timestamp > self.last_access:
+            self.last_access = timestamp
+            if file_size is not None:
+                self.file_size = file_size
+        self.accessed_by.add(username)
+
+    def merge(self, other):
+        """Fold in a delta taken later (used to requeue a failed flush)"""
+        self.count += other.count
+        self.first_access = min(filter(None, (self.first_access, other.first_access)), default=None)
+        if other.last_access is not None and (self.last_access is None or other.last_access >= self.last_access):
+            self.last_access = other.last_access
+            self.full_path = other.full_path
+            if other.file_size is not None:
+                self.file_size = other.file_size
+        self.accessed_by |= other.accessed_by
+
+    def apply(self, record):
+        """Return the stored record (or a new one) with this delta applied"""
+        if record is None:
+            record = {
+                "full_path": self.full_path,
+                "accessed_count": 0,
+                "first_access": None,
+                "last_access": None,
+                "accessed_by": [],
+                "file_size": 0
+            }
+        record["full_path"] = self.full_path
+        record["accessed_count"] = record.get("accessed_count", 0) + self.count
+        if not record.get("first_access") or self.first_access < record["first_access"]:
+            record["first_access"] = self.first_access
+        if not record.get("last_access") or self.last_access >= record["last_access"]:
+            record["last_access"] = self.last_access
+            if self.file_size is not None:
+                record["file_size"] = self.file_size
+        # Stored as a list for compatibility; membership is checked against a set
+        accessed_by = record.get("accessed_by", [])
+        known = set(accessed_by)
+        record["accessed_by"] = accessed_by + sorted(self.accessed_by - known)
+        return record
+
+
+class FileMetadataStore:
+    """Coalescing writer for the file-tracking document
+
+    record_access() only updates an in-memory delta per file, so repeated
+    accesses to the same file cost one dictionary lookup. Deltas are written
+    as one keyed batch (storage.update_records) once METADATA_BATCH_SIZE files
+    are pending or every METADATA_FLUSH_INTERVAL seconds, and on close.
+    Counts add up across processes because each flush applies increments to
+    the stored records rather than overwriting them.
+    """
+
+    def __init__(self, storage=None, batch_size=None, flush_interval=None):
+        self.storage = storage or get_storage()
+        self.batch_size = batch_size or METADATA_BATCH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else METADATA_FLUSH_INTERVAL
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._flusher = None
+        atexit.register(self.flush)
+
+    def record_access(self, file_key, full_path, username, file_size=None, timestamp=None):
+        """Queue one access to a tracked file"""
+        timestamp = timestamp or datetime.datetime.now().isoformat()
+        with self._pending_lock:
+            delta = self._pending.get(file_key)
+            if delta is None:
+                delta = self._pending[file_key] = FileAccessDelta(full_path)
+            delta.add(full_path, username, timestamp, file_size)
+            pending = len(self._pending)
+            self._ensure_flusher()
+        if pending >= self.batch_size or self.flush_interval <= 0:
+            self.flush()
+
+    def pending(self):
+        with self._pending_lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Write every pending delta in one batch; returns the number of records written"""
+        with self._flush_lock:
+            with self._pending_lock:
+                deltas, self._pending = self._pending, {}
+            if not deltas:
+                return 0
+            try:
+                self.storage.update_records(FILES, {key: delta.apply for key, delta in deltas.items()})
+            except Exception:
+                # Put the deltas back in front of anything recorded meanwhile
+                with self._pending_lock:
+                    for key, newer in self._pending.items():
+                        if key in deltas:
+                            deltas[key].merge(newer)
+                        else:
+                            deltas[key] = newer
+                    self._pending = deltas
+                raise
+            return len(deltas)
+
+    def close(self):
+        """Flush remaining deltas and stop the background flusher"""
+        self._closed = True
+        self._wakeup.set()
+        self.flush()
+        atexit.unregister(self.flush)
+
+    def _ensure_flusher(self):
+        if self._flusher is None and self.flush_interval > 0 and not self._closed:
+            self._flusher = threading.Thread(target=self._flush_loop, name="file-metadata-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Debug - Background flush of file metadata failed: {e}")
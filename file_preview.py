@@ -0,0 +1,127 @@
+import os
+import mmap
+import time
+import bisect
+import threading
+
+# Lines rendered per page of the File Manager preview
+PREVIEW_PAGE_LINES = 200
+# Distance between line-index checkpoints; a lookup scans at most about this much
+CHECKPOINT_BYTES = 64 * 1024
+# Longest part of a single line that is decoded and shown
+PREVIEW_MAX_LINE_BYTES = 4096
+# Minimum interval between progress callbacks while indexing
+PROGRESS_INTERVAL = 0.1
+
+
+class FilePreview:
+    """Memory-mapped, lazily line-indexed view of a text file
+
+    A background thread walks the mapping in CHECKPOINT_BYTES steps, counting
+    newlines at C speed and remembering where the first line after each step
+    begins. lines(first, count) seeks to the nearest checkpoint and decodes
+    only the requested lines, so opening and paging stay cheap whatever the
+    file size, and memory use is a few bytes per checkpoint rather than a
+    copy of the file.
+
+    on_progress(line_count, scanned_bytes, done), if given, is called from
+    the indexing thread; UI callers must hand it over to their own thread.
+    """
+
+    def __init__(self, path, on_progress=None):
+        self.path = path
+        self._file = open(path, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self._on_progress = on_progress
+        self._lock = threading.Lock()
+        self._stopped = False
+        # Parallel lists: line number -> byte offset where that line starts
+        self._checkpoint_lines = [0]
+        self._checkpoint_offsets = [0]
+        self.scanned_bytes = 0
+        self._newlines = 0
+        self._unterminated_last_line = False
+        self.done = False
+        self._thread = threading.Thread(target=self._build_index, name="file-preview-index", daemon=True)
+        self._thread.start()
+
+    @property
+    def line_count(self):
+        """Lines found so far; final once done is True"""
+        return self._newlines + (1 if self.done and self._unterminated_last_line else 0)
+
+    def _build_index(self):
+        position = 0
+        last_report = 0.0
+        while position < self.size and not self._stopped:
+            end = min(position + CHECKPOINT_BYTES, self.size)
+            # Extend to the end of the line so every checkpoint is a line start
+            newline = self._map.find(b"\n", end - 1)
+            end = newline + 1 if newline != -1 else self.size
+            lines = self._newlines + self._map[position:end].count(b"\n")
+            if newline != -1:
+                with self._lock:
+                    self._checkpoint_lines.append(lines)
+                    self._checkpoint_offsets.append(end)
+            self._newlines = lines
+            position = self.scanned_bytes = end
+
+            now = time.monotonic()
+            if self._on_progress and now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                self._on_progress(lines, end, False)
+        with self._lock:
+            if self._stopped:
+                self._release()
+                return
+            self._unterminated_last_line = bool(self.size) and self._map[self.size - 1:self.size] != b"\n"
+            self.done = True
+        if self._on_progress:
+            self._on_progress(self.line_count, self.size, True)
+
+    def lines(self, first, count):
+        """Return up to count decoded lines starting at line number first"""
+        if not self.size or count <= 0 or self._stopped:
+            return []
+        with self._lock:
+            index = bisect.bisect_right(self._checkpoint_lines, first) - 1
+            line, position = self._checkpoint_lines[index], self._checkpoint_offsets[index]
+
+        # Skip forward from the checkpoint to the first requested line
+        while line < first and position < self.size:
+            newline = self._map.find(b"\n", position)
+            position = newline + 1 if newline != -1 else self.size
+            line += 1
+
+        result = []
+        while len(result) < count and position < self.size:
+            newline = self._map.find(b"\n", position)
+            end = newline if newline != -1 else self.size
+            raw = self._map[position:min(end, position + PREVIEW_MAX_LINE_BYTES)]
+            text = raw.decode("utf-8", errors="replace").rstrip("\r")
+            if end - position > PREVIEW_MAX_LINE_BYTES:
+                text += f" … [{end - position - PREVIEW_MAX_LINE_BYTES} more bytes]"
+            result.append(text)
+            position = end + 1
+        return result
+
+    def page_count(self, page_lines=PREVIEW_PAGE_LINES):
+        return max(1, -(-self.line_count // page_lines))
+
+    def close(self):
+        """Stop indexing and release the mapping
+
+        Doesn't wait for the indexing thread (which may be calling back into
+        the UI); if it is still running it releases the mapping as it exits.
+        """
+        with self._lock:
+            self._stopped = True
+            if self.done or not self._thread.is_alive():
+                self._release()
+
+    def _release(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
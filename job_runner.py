@@ -0,0 +1,159 @@
+import queue
+import itertools
+import threading
+
+# Queue priorities: fire-and-forget tasks (logging) jump ahead of jobs
+TASK_PRIORITY = 0
+JOB_PRIORITY = 1
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work once the job has been cancelled"""
+
+
+class Job:
+    """One unit of queued work with byte-level progress and cancellation
+
+    work(job) receives the job itself and should call job.report(done_bytes)
+    as it goes; report() raises JobCancelled once cancel() has been called,
+    which unwinds the work mid-stream.
+    """
+
+    def __init__(self, runner, name, work, total=None, on_done=None):
+        self.id = None
+        self.name = name
+        self.total = total
+        self.done_bytes = 0
+        self.state = QUEUED
+        self.result = None
+        self.error = None
+        self._runner = runner
+        self._work = work
+        self._on_done = on_done
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Request cancellation; a queued job never starts, a running one stops at its next report()"""
+        self._cancelled.set()
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise JobCancelled()
+
+    def report(self, done_bytes):
+        """Record progress and abort if cancelled (called from the job's thread)"""
+        self.check()
+        self.done_bytes = done_bytes
+        self._runner._notify(self)
+
+    def percent(self):
+        if not self.total:
+            return None
+        return min(self.done_bytes * 100 // self.total, 100)
+
+    def _run(self):
+        if self._cancelled.is_set():
+            self.state = CANCELLED
+        else:
+            self.state = RUNNING
+            self._runner._notify(self)
+            try:
+                self.result = self._work(self)
+                self.state = DONE
+            except JobCancelled:
+                self.state = CANCELLED
+            except Exception as e:
+                self.error = e
+                self.state = FAILED
+        self._runner._notify(self)
+        if self._on_done:
+            self._on_done(self)
+
+
+class JobRunner:
+    """Fixed pool of worker threads fed from one priority queue
+
+    submit() queues a Job (progress, cancellation, completion callback);
+    background() queues a plain fire-and-forget call such as a log write,
+    which runs ahead of any waiting jobs. Background calls start in queue
+    order but overlap on a pool of several workers; give writes that must
+    land in order a one-worker runner. on_update(job) and each job's
+    on_done(job) are called on worker threads; Tk callers should forward
+    them with root.after.
+    """
+
+    def __init__(self, workers=2, on_update=None, name="job-runner"):
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._on_update = on_update
+        self._lock = threading.Lock()
+        self._jobs = []
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, name, work, total=None, on_done=None):
+        """Queue work(job) as a tracked job and return the Job"""
+        job = Job(self, name, work, total, on_done)
+        with self._lock:
+            job.id = next(self._sequence)
+            self._jobs.append(job)
+        self._queue.put((JOB_PRIORITY, job.id, job._run))
+        self._notify(job)
+        return job
+
+    def background(self, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) without tracking; errors are printed, not raised"""
+        def task():
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                print(f"Debug - Background task {getattr(func, '__name__', func)} failed: {e}")
+        self._queue.put((TASK_PRIORITY, next(self._sequence), task))
+
+    def active_jobs(self):
+        """Jobs that are queued or running, oldest first"""
+        with self._lock:
+            return [job for job in self._jobs if job.state in (QUEUED, RUNNING)]
+
+    def cancel_all(self):
+        for job in self.active_jobs():
+            job.cancel()
+
+    def shutdown(self, timeout=5.0):
+        """Cancel jobs, finish queued background tasks and stop the workers"""
+        self.cancel_all()
+        for _ in self._threads:
+            # Sorts after every queued item, so workers drain the queue first
+            self._queue.put((JOB_PRIORITY + 1, next(self._sequence), None))
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+
+    def _notify(self, job):
+        if job.state not in (QUEUED, RUNNING):
+            with self._lock:
+                if job in self._jobs:
+                    self._jobs.remove(job)
+        if self._on_update:
+            self._on_update(job)
+
+    def _worker(self):
+        while True:
+            _, _, task = self._queue.get()
+            if task is None:
+                return
+            task()
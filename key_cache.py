@@ -0,0 +1,136 @@
+import time
+import threading
+from collections import OrderedDict
+from cryptography.fernet import Fernet
+
+# Most keys held at once; the least recently used is evicted beyond this
+KEY_CACHE_MAX_ENTRIES = 256
+# Seconds a loaded key stays usable before it is re-read from the key store
+KEY_CACHE_TTL = 15 * 60
+
+
+def load_user_key(username, version=None):
+    """Default loader: a version of the user's key from the key ring (None: current)"""
+    from key_ring import load_key_version
+    return load_key_version(username, version)
+
+
+def current_user_key_version(username):
+    """Default resolver: the version new data for the user is encrypted with"""
+    from key_ring import current_key_version
+    return current_key_version(username)
+
+
+class _CachedKey:
+    __slots__ = ("material", "fernet", "expires")
+
+    def __init__(self, key, expires):
+        # A bytearray so the cache's own copy can be overwritten on eviction
+        self.material = bytearray(key)
+        self.fernet = None
+        self.expires = expires
+
+    def wipe(self):
+        for i in range(len(self.material)):
+            self.material[i] = 0
+        self.fernet = None
+
+
+class KeyCache:
+    """Bounded LRU of user keys and ready Fernet objects, keyed by (user, version)
+
+    Entries expire after ttl seconds so key changes are picked up without a
+    restart. A lookup without a version asks resolve_version for the user's
+    current one first, so entries are always stored under a concrete version
+    and a rotation takes effect on the next lookup. Evicted or expired key material is zeroed in place; copies
+    already handed to callers, and the immutable key bytes held inside
+    Fernet objects, can't be wiped from Python and are left to the garbage
+    collector.
+    """
+
+    def __init__(self, max_entries=KEY_CACHE_MAX_ENTRIES, ttl=KEY_CACHE_TTL, loader=load_user_key,
+                 clock=time.monotonic, resolve_version=current_user_key_version):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._loader = loader
+        self._resolve_version = resolve_version
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _lookup(self, username, version, use):
+        """Return use(entry) for the user's cached key, loading it on a miss
+
+        use runs under the lock, so an entry can't be wiped while it is read.
+        """
+        if version is None:
+            version = self._resolve_version(username)
+        cache_key = (username, version)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                if entry.expires > self._clock():
+                    self._entries.move_to_end(cache_key)
+                    self.hits += 1
+                    return use(entry)
+                self._discard(cache_key)
+                self.expirations += 1
+            self.misses += 1
+
+        # Load outside the lock so a slow key store doesn't block other users
+        key = self._loader(username, version)
+
+        with self._lock:
+            self._discard(cache_key)
+            entry = _CachedKey(key, self._clock() + self.ttl)
+            self._entries[cache_key] = entry
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+            return use(entry)
+
+    def key(self, username, version=None):
+        """Return the user's key (bytes) for a version (None: the current one)"""
+        return self._lookup(username, version, lambda entry: bytes(entry.material))
+
+    def fernet(self, username, version=None):
+        """Return a Fernet for the user's key, built once per cached key"""
+        def use(entry):
+            if entry.fernet is None:
+                entry.fernet = Fernet(bytes(entry.material))
+            return entry.fernet
+        return self._lookup(username, version, use)
+
+    def invalidate(self, username=None, version=None):
+        """Drop (and wipe) one user's key, every version of it, or everything"""
+        with self._lock:
+            for cache_key in list(self._entries):
+                if username is None or (cache_key[0] == username and version in (None, cache_key[1])):
+                    self._discard(cache_key)
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current usage"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+    def _discard(self, cache_key):
+        entry = self._entries.pop(cache_key, None)
+        if entry is not None:
+            entry.wipe()
+
+
+# Process-wide cache shared by the client and headless tools
+default_key_cache = KeyCache()
@@ -0,0 +1,223 @@
+import os
+import threading
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
+from storage import get_storage, KEY_RING
+
+# Version number of the key get_user_encryption_key has always returned;
+# rotated keys are numbered from here up and kept in the key ring document
+LEGACY_KEY_VERSION = 1
+# Local key that wraps the rotated keys in the ring. It is created on first
+# use, readable by its owner only, and never written into backups, so a
+# copied key ring document or backup alone does not reveal any key.
+MASTER_KEY_FILE = os.environ.get("SECUREVAULT_MASTER_KEY_FILE", "data/master.key")
+
+_master = None
+_master_lock = threading.Lock()
+
+
+def _master_fernet():
+    global _master
+    with _master_lock:
+        if _master is None:
+            try:
+                with open(MASTER_KEY_FILE, "rb") as f:
+                    key = f.read().strip()
+            except FileNotFoundError:
+                key = _create_master_key()
+            _master = Fernet(key)
+        return _master
+
+
+def _create_master_key():
+    directory = os.path.dirname(MASTER_KEY_FILE)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    key = Fernet.generate_key()
+    tmp_path = f"{MASTER_KEY_FILE}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        os.write(fd, key)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    try:
+        # link() fails if another process created the key first; use theirs
+        os.link(tmp_path, MASTER_KEY_FILE)
+    except FileExistsError:
+        with open(MASTER_KEY_FILE, "rb") as f:
+            key = f.read().strip()
+    finally:
+        os.remove(tmp_path)
+    return key
+
+
+def _unwrap(token):
+    try:
+        return _master_fernet().decrypt(token.encode("ascii"))
+    except InvalidToken:
+        raise ValueError(f"Key ring entry is not wrapped with the master key in {MASTER_KEY_FILE}") from None
+
+
+def _entry_keys(entry):
+    """version -> key of a ring entry
+
+    Keys are kept wrapped under "wrapped"; plain keys under "keys" come from
+    rings written before wrapping and are wrapped on the next update.
+    """
+    keys = {int(version): key.encode("ascii") for version, key in entry.get("keys", {}).items()}
+    keys.update((int(version), _unwrap(token)) for version, token in entry.get("wrapped", {}).items())
+    return keys
+
+
+def _wrap_entry(entry):
+    """Move an entry's plain keys under "wrapped"; returns how many moved"""
+    plain = entry.pop("keys", {})
+    wrapped = entry.setdefault("wrapped", {})
+    for version, key in plain.items():
+        wrapped[version] = _master_fernet().encrypt(key.encode("ascii")).decode("ascii")
+    return len(plain)
+
+
+def _ring_entry(username, storage=None):
+    return (storage or get_storage()).load_document(KEY_RING).get(username) or {}
+
+
+def current_key_version(username, storage=None):
+    """The version new data for this user is encrypted with"""
+    return _ring_entry(username, storage).get("current", LEGACY_KEY_VERSION)
+
+
+def key_versions(username, storage=None):
+    """Every usable key version for the user, newest first"""
+    entry = _ring_entry(username, storage)
+    versions = {int(version) for version in entry.get("keys", {})}
+    versions.update(int(version) for version in entry.get("wrapped", {}))
+    if LEGACY_KEY_VERSION not in entry.get("retired", []):
+        versions.add(LEGACY_KEY_VERSION)
+    return sorted(versions, reverse=True)
+
+
+def load_key_version(username, version=None, storage=None):
+    """Return the user's key for a version (None: the current one)
+
+    The legacy version comes from the shared key store; rotated versions from
+    the key ring. Raises KeyError for unknown or retired versions.
+    """
+    entry = _ring_entry(username, storage)
+    if version is None:
+        version = entry.get("current", LEGACY_KEY_VERSION)
+    if version == LEGACY_KEY_VERSION and LEGACY_KEY_VERSION not in entry.get("retired", []):
+        from shared import get_user_encryption_key
+        return get_user_encryption_key(username)
+    if str(version) in entry.get("wrapped", {}):
+        return _unwrap(entry["wrapped"][str(version)])
+    key = entry.get("keys", {}).get(str(version))
+    if key is None:
+        raise KeyError(f"No key version {version!r} for {username}")
+    return key.encode("ascii")
+
+
+def add_key_version(username, storage=None):
+    """Generate a new key, make it the user's current one and return its version
+
+    Older versions stay in the ring so existing data can still be decrypted
+    (and re-encrypted) until they are retired.
+    """
+    new_key = _master_fernet().encrypt(Fernet.generate_key()).decode("ascii")
+
+    def add(ring):
+        entry = ring.setdefault(username, {})
+        _wrap_entry(entry)
+        version = max([int(version) for version in entry["wrapped"]] + [entry.get("current", LEGACY_KEY_VERSION)]) + 1
+        entry["wrapped"][str(version)] = new_key
+        entry["current"] = version
+        return version
+
+    return (storage or get_storage()).update_document(KEY_RING, add)
+
+
+def retire_key_version(username, version, storage=None):
+    """Remove an old key version; data still encrypted with it becomes unreadable"""
+    def retire(ring):
+        entry = ring.setdefault(username, {})
+        if version == entry.get("current", LEGACY_KEY_VERSION):
+            raise ValueError("The current key version can't be retired")
+        _wrap_entry(entry)
+        entry["wrapped"].pop(str(version), None)
+        if version == LEGACY_KEY_VERSION and version not in entry.setdefault("retired", []):
+            entry["retired"].append(version)
+
+    (storage or get_storage()).update_document(KEY_RING, retire)
+
+
+def wrap_key_ring(storage=None):
+    """Wrap any plain keys left in the ring; returns how many were wrapped"""
+    def wrap(ring):
+        return sum(_wrap_entry(entry) for entry in ring.values())
+
+    storage = storage or get_storage()
+    if not any("keys" in entry for entry in storage.load_document(KEY_RING).values()):
+        return 0
+    return storage.update_document(KEY_RING, wrap)
+
+
+def merge_key_ring(restored, storage=None):
+    """Add the key versions of a restored ring to the current one; returns users merged
+
+    Nothing in the current ring is dropped, so keys made after the backup
+    survive the restore. A restored key whose version number has since been
+    reused for a different key is added under a new number (files are opened
+    by trying every version). A version stays retired only if it is retired
+    in both rings, and the newer current version wins.
+    """
+    # Unwrap before touching the ring, so a backup from another master key fails cleanly
+    restored = {username: (entry, _entry_keys(entry)) for username, entry in restored.items()}
+
+    def merge(ring):
+        for username, (restored_entry, restored_keys) in restored.items():
+            entry = ring.setdefault(username, {})
+            _wrap_entry(entry)
+            keys = _entry_keys(entry)
+            versions_by_key = {key: version for version, key in keys.items()}
+            for version, key in sorted(restored_keys.items()):
+                if key in versions_by_key:
+                    continue
+                if version in keys or version == LEGACY_KEY_VERSION:
+                    new_version = max(list(keys) + [entry.get("current", LEGACY_KEY_VERSION), version]) + 1
+                else:
+                    new_version = version
+                keys[new_version] = key
+                versions_by_key[key] = new_version
+                entry["wrapped"][str(new_version)] = _master_fernet().encrypt(key).decode("ascii")
+            # A renumbered key clashed with a version made after the backup, so
+            # only a restored current version that kept its number can be newer
+            restored_current = restored_entry.get("current", LEGACY_KEY_VERSION)
+            if restored_current not in restored_keys or versions_by_key[restored_keys[restored_current]] == restored_current:
+                entry["current"] = max(entry.get("current", LEGACY_KEY_VERSION), restored_current)
+            retired = [version for version in entry.get("retired", []) if version in restored_entry.get("retired", [])]
+            if retired:
+                entry["retired"] = retired
+            else:
+                entry.pop("retired", None)
+        return len(restored)
+
+    return (storage or get_storage()).update_document(KEY_RING, merge)
+
+
+def multi_fernet(username, key_cache=None, storage=None):
+    """MultiFernet over every key version: encrypts with the newest, decrypts with any"""
+    if key_cache is None:
+        from key_cache import default_key_cache as key_cache
+    return MultiFernet([key_cache.fernet(username, version) for version in key_versions(username, storage)])
+
+
+def find_file_key_version(username, path, key_cache=None, storage=None):
+    """Return (version, key) of the key an encrypted file was written with, or (None, None)"""
+    import file_crypto
+    if key_cache is None:
+        from key_cache import default_key_cache as key_cache
+    for version in key_versions(username, storage):
+        key = key_cache.key(username, version)
+        if file_crypto.key_opens_file(key, path):
+            return version, key
+    return None, None
@@ -0,0 +1,240 @@
+"""Rotate a user's encryption key and re-encrypt their files to it
+
+Usage:
+    python key_rotation.py alice ~/vault [more dirs...] [--workers 8] [--retire-old]
+
+A new key version is added to the user's key ring (older versions stay
+readable), then every .svlt file under the given directories is
+re-encrypted to it in place, in parallel. Progress is kept in a checkpoint
+file, so running the same command again after an interruption resumes with
+the same target version instead of starting another rotation. A JSON
+summary is printed to stdout and the finished rotation is recorded as one
+aggregated encryption activity event.
+"""
+import os
+import sys
+import json
+import time
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import file_crypto
+from bulk_crypto import iter_source_files, DECRYPT, BULK_QUEUE_PER_WORKER, SUMMARY_MAX_ERRORS
+from file_lock import atomic_write_json
+from key_cache import default_key_cache
+from key_ring import add_key_version, find_file_key_version, key_versions, retire_key_version
+from storage import get_storage, ENCRYPTION_ACTIVITY
+
+# Checkpoint of an unfinished rotation, one per user
+ROTATION_CHECKPOINT_FILE = "data/key_rotation_{username}.json"
+CHECKPOINT_VERSION = 1
+# Seconds between checkpoint writes while files are being re-encrypted
+CHECKPOINT_SAVE_INTERVAL = 10
+ROTATION_WORKERS = file_crypto.FILE_CRYPTO_WORKERS
+
+
+class RotationCheckpoint:
+    """Target key version and finished files of a rotation in progress"""
+
+    def __init__(self, path, username):
+        self.path = path
+        self.username = username
+        self.target_version = None
+        self.roots = []
+        self.done = set()
+        self._lock = threading.Lock()
+        self._last_save = time.monotonic()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        if data.get("version") != CHECKPOINT_VERSION or data.get("username") != username:
+            raise ValueError(f"{path} is not a rotation checkpoint for {username}")
+        self.target_version = data["target_version"]
+        self.roots = data.get("roots", [])
+        self.done = set(data.get("done", []))
+
+    @property
+    def exists(self):
+        return self.target_version is not None
+
+    def mark_done(self, path):
+        with self._lock:
+            self.done.add(path)
+
+    def save(self, force=True):
+        now = time.monotonic()
+        if not force and now - self._last_save < CHECKPOINT_SAVE_INTERVAL:
+            return
+        with self._lock:
+            self._last_save = now
+            data = {
+                "version": CHECKPOINT_VERSION,
+                "username": self.username,
+                "target_version": self.target_version,
+                "roots": self.roots,
+                "done": sorted(self.done),
+            }
+        atomic_write_json(self.path, data)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _rotate_file(username, path, target_version, new_key, key_cache):
+    """Re-encrypt one file to the target key; returns (from_version, bytes_read, bytes_written)"""
+    version, old_key = find_file_key_version(username, path, key_cache)
+    if version is None:
+        raise file_crypto.StreamIntegrityError("No key version of this user opens the file")
+    if version == target_version:
+        return version, 0, 0
+    # One worker and one chunk in flight: parallelism comes from running files side by side
+    bytes_read, bytes_written = file_crypto.reencrypt_file(old_key, path, new_key, workers=1, max_in_flight=1)
+    return version, bytes_read, bytes_written
+
+
+def rotate_user_key(username, roots=(), workers=None, checkpoint_path=None, retire_old=False,
+                    key_cache=default_key_cache):
+    """Rotate the user's key and re-encrypt every .svlt file under roots; returns a summary dict"""
+    workers = max(1, workers or ROTATION_WORKERS)
+    checkpoint = RotationCheckpoint(checkpoint_path or ROTATION_CHECKPOINT_FILE.format(username=username), username)
+    roots = [os.path.abspath(root) for root in roots] or checkpoint.roots
+    for root in roots:
+        if not os.path.isdir(root):
+            raise ValueError(f"Directory does not exist: {root}")
+
+    resumed = checkpoint.exists
+    if not resumed:
+        checkpoint.target_version = add_key_version(username)
+        key_cache.invalidate(username)
+    checkpoint.roots = roots
+    # Saved before any file changes, so a crash from here on resumes this rotation
+    checkpoint.save()
+    target_version = checkpoint.target_version
+    new_key = key_cache.key(username, target_version)
+
+    started = time.monotonic()
+    summary = {
+        "username": username,
+        "target_version": target_version,
+        "resumed": resumed,
+        "roots": roots,
+        "files_seen": 0,
+        "rotated": 0,
+        "skipped": 0,
+        "failed": 0,
+        "bytes_read": 0,
+        "bytes_written": 0,
+        "from_versions": {},
+        "errors": [],
+    }
+
+    def fail(path, error):
+        summary["failed"] += 1
+        if len(summary["errors"]) < SUMMARY_MAX_ERRORS:
+            summary["errors"].append({"path": path, "error": error})
+
+    def finish(future, path):
+        try:
+            version, bytes_read, bytes_written = future.result()
+        except Exception as e:
+            fail(path, str(e) or type(e).__name__)
+            return
+        checkpoint.mark_done(path)
+        if version == target_version:
+            summary["skipped"] += 1
+            return
+        summary["rotated"] += 1
+        summary["bytes_read"] += bytes_read
+        summary["bytes_written"] += bytes_written
+        summary["from_versions"][str(version)] = summary["from_versions"].get(str(version), 0) + 1
+
+    in_flight = {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="key-rotation") as pool:
+            for root in roots:
+                for _, entry in iter_source_files(root, DECRYPT):
+                    summary["files_seen"] += 1
+                    if entry.path in checkpoint.done:
+                        summary["skipped"] += 1
+                        continue
+                    future = pool.submit(_rotate_file, username, entry.path, target_version, new_key, key_cache)
+                    in_flight[future] = entry.path
+                    if len(in_flight) >= workers * BULK_QUEUE_PER_WORKER:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            finish(future, in_flight.pop(future))
+                        checkpoint.save(force=False)
+            for future in list(in_flight):
+                finish(future, in_flight.pop(future))
+    except BaseException:
+        for future in list(in_flight):
+            future.cancel()
+        checkpoint.save()
+        raise
+
+    if summary["failed"]:
+        # Keep the checkpoint so the failed files are retried on the next run
+        checkpoint.save()
+    else:
+        checkpoint.remove()
+        if retire_old:
+            retired = [version for version in key_versions(username) if version != target_version]
+            for version in retired:
+                retire_key_version(username, version)
+            key_cache.invalidate(username)
+            summary["retired_versions"] = retired
+
+    summary["seconds"] = round(time.monotonic() - started, 3)
+    log_rotation(summary)
+    return summary
+
+
+def log_rotation(summary):
+    """Record a rotation run as a single aggregated encryption activity event"""
+    now = datetime.datetime.now()
+    username = summary["username"]
+    get_storage().append_event(ENCRYPTION_ACTIVITY, {
+        "timestamp": now.isoformat(),
+        "username": username,
+        "action": "key_rotation",
+        "to_version": summary["target_version"],
+        "from_versions": summary["from_versions"],
+        "file_count": summary["rotated"],
+        "skipped": summary["skipped"],
+        "failed": summary["failed"],
+        "encrypted_length": summary["bytes_written"],
+        "complete": not summary["failed"],
+        "session_id": f"{username}_{now.strftime('%Y%m%d_%H%M%S')}",
+    })
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rotate a user's key and re-encrypt their files")
+    parser.add_argument("user")
+    parser.add_argument("roots", nargs="*", help="Directories holding the user's .svlt files "
+                                                 "(default when resuming: those of the interrupted run)")
+    parser.add_argument("--workers", type=int, default=ROTATION_WORKERS, help="Files re-encrypted in parallel")
+    parser.add_argument("--checkpoint", help="Checkpoint path (default: data/key_rotation_USER.json)")
+    parser.add_argument("--retire-old", action="store_true",
+                        help="Remove older key versions once every file has been rotated")
+    args = parser.parse_args()
+
+    try:
+        result = rotate_user_key(args.user, args.roots, workers=args.workers,
+                                 checkpoint_path=args.checkpoint, retire_old=args.retire_old)
+    except (ValueError, KeyError, OSError) as e:
+        print(json.dumps({"username": args.user, "error": str(e)}))
+        sys.exit(2)
+    except KeyboardInterrupt:
+        print(json.dumps({"username": args.user, "error": "interrupted; run again to resume"}))
+        sys.exit(130)
+    print(json.dumps(result, indent=2))
+    sys.exit(1 if result["failed"] else 0)
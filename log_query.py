@@ -0,0 +1,430 @@
+import re
+import bisect
+import threading
+from array import array
+from event_log import ACTIVE_SEGMENT
+from log_view import LogView, LOG_PAGE_SIZE
+
+# Event fields indexed for equality/prefix matching, with their query aliases
+INDEXED_FIELDS = {"username": "username", "user": "username", "action": "action"}
+# Field names that select a time range instead of a value
+TIME_FIELDS = ("time", "timestamp")
+# Words indexed from the free-text details field
+TOKEN_PATTERN = re.compile(r"\w+")
+# Quoted values may contain \" and \\ escapes, and may end in * for a prefix;
+# a leading - negates them like any other term
+QUERY_TOKEN_PATTERN = re.compile(r'\s*(?:(\()|(\))|(-?(?:[A-Za-z_]+:)?"(?:[^"\\]|\\.)*"\*?|[^\s()"]+))')
+QUOTE_ESCAPE_PATTERN = re.compile(r'\\(.)')
+# Sorts after any character that can appear in an ISO timestamp, so an upper
+# bound like "2024-05-01" includes everything within that day
+TIME_PREFIX_END = "\uffff"
+# Events read back from storage at a time when streaming results or
+# checking phrases
+LOAD_BATCH_SIZE = 5000
+
+
+class QueryError(ValueError):
+    """Raised for malformed log queries"""
+
+
+class LogIndex:
+    """Inverted indexes over an event stream, kept current by tail ingestion
+
+    Username and action values map to posting lists of event ids, as do the
+    words of each event's details, and a timestamp-sorted list answers time
+    ranges. Ids are assigned in stream order, so postings stay sorted and
+    compact. Events themselves are not kept: each id records the storage
+    ref (segment, offset) the event was read from, and load() reads events
+    back by id, so results can be paged without holding the stream in
+    memory. Every search first folds in whatever was appended since the
+    last one, so the cost of keeping the index current scales with new events.
+
+    Query language (case-insensitive):
+
+        user:alice              field equality (fields: user, action)
+        action:login*           field prefix
+        time:2024-05-01         everything within a time prefix (day, hour...)
+        time:2024-05-01..2024-05-07, time:>=2024-05-01T12:00, time:<2024-06
+        failed, encrypt*        words or word prefixes in details
+        "wrong password"        phrase in details
+        user:"o'brien (x)"*     quoted value, taken literally (\" and \\
+                                escape); a trailing * still means prefix
+        a b, a AND b            both; a OR b either; NOT a / -a negation
+        ( ... )                 grouping
+    """
+
+    def __init__(self, storage, stream):
+        self.storage = storage
+        self.stream = stream
+        self._lock = threading.RLock()
+        self._cursor = None
+        # Bumped on every reset, so views taken earlier stop loading stale ids
+        self.generation = 0
+        self.reset()
+
+    def reset(self):
+        """Drop all indexed events (the stream was cleared or replaced)"""
+        with self._lock:
+            self.generation += 1
+            self._segments = array('L')
+            self._offsets = array('Q')
+            self._fields = {field: {} for field in set(INDEXED_FIELDS.values())}
+            self._terms = {}
+            self._time_keys = []
+            self._time_ids = []
+            # Timestamp of each id, so a match can be put in time order without
+            # walking the whole time list; while events arrive in time order,
+            # id order already is time order
+            self._timestamps = []
+            self._in_time_order = True
+
+    def add(self, segment, offset, event):
+        """Index one event stored at (segment, offset); called in stream order"""
+        with self._lock:
+            event_id = len(self._offsets)
+            self._segments.append(segment)
+            self._offsets.append(offset)
+
+            for field, postings in self._fields.items():
+                value = str(event.get(field, '')).lower()
+                postings.setdefault(value, array('L')).append(event_id)
+            for term in set(TOKEN_PATTERN.findall(str(event.get('details', '')).lower())):
+                self._terms.setdefault(term, array('L')).append(event_id)
+
+            timestamp = event.get('timestamp', '')
+            self._timestamps.append(timestamp)
+            if not self._time_keys or timestamp >= self._time_keys[-1]:
+                self._time_keys.append(timestamp)
+                self._time_ids.append(event_id)
+            else:
+                self._in_time_order = False
+                position = bisect.bisect_right(self._time_keys, timestamp)
+                self._time_keys.insert(position, timestamp)
+                self._time_ids.insert(position, event_id)
+
+    def _sealed(self, sequence):
+        # The active segment became segment sequence; its refs are the newest ids
+        position = len(self._segments) - 1
+        while position >= 0 and self._segments[position] == ACTIVE_SEGMENT:
+            self._segments[position] = sequence
+            position -= 1
+
+    def refresh(self):
+        """Index newly appended events and return how many were added"""
+        with self._lock:
+            before = len(self._offsets)
+            self._cursor, reset = self.storage.scan_new_event_refs(
+                self.stream, self._cursor, self.add, on_reset=self.reset, on_roll=self._sealed
+            )
+            return len(self._offsets) - (0 if reset else before)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def load(self, ids, generation=None):
+        """Read events back by id; returns a list parallel to ids, None where gone
+
+        With a generation, ids from before a later reset load as None.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return [None] * len(ids)
+            refs = [(self._segments[event_id], self._offsets[event_id]) for event_id in ids]
+            cursor = self._cursor
+        return self.storage.load_event_refs(self.stream, refs, cursor)
+
+    def match(self, query):
+        """Return (ids, timestamps) of the events matching a query, oldest first"""
+        tree = parse_query(query)
+        self.refresh()
+        with self._lock:
+            if tree is None:
+                return array('L', self._time_ids), list(self._time_keys)
+            matched, negated = self._evaluate(tree)
+            if negated:
+                # Everything but matched: the result is most of the index anyway
+                ids = array('L')
+                timestamps = []
+                for timestamp, event_id in zip(self._time_keys, self._time_ids):
+                    if event_id not in matched:
+                        ids.append(event_id)
+                        timestamps.append(timestamp)
+                return ids, timestamps
+            # Ties keep stream order, as in the time list
+            if self._in_time_order:
+                ordered = sorted(matched)
+            else:
+                ordered = sorted(matched, key=lambda event_id: (self._timestamps[event_id], event_id))
+            return array('L', ordered), [self._timestamps[event_id] for event_id in ordered]
+
+    def view(self, query, page_size=LOG_PAGE_SIZE):
+        """Return a LogView of the events matching a query; pages load on demand"""
+        ids, timestamps = self.match(query)
+        generation = self.generation
+        return LogView(ids, timestamps, lambda page_ids: self.load(page_ids, generation), page_size)
+
+    def search(self, query):
+        """Return an iterator over the events matching a query, in stream order
+
+        Events are read back in batches of LOAD_BATCH_SIZE. The query is
+        parsed straight away, so a malformed one raises QueryError here.
+        """
+        ids, _ = self.match(query)
+        return self._iter_events(sorted(ids), self.generation)
+
+    def _iter_events(self, ids, generation):
+        for start in range(0, len(ids), LOAD_BATCH_SIZE):
+            for event in self.load(ids[start:start + LOAD_BATCH_SIZE], generation):
+                if event is not None:
+                    yield event
+
+    def _evaluate(self, node):
+        """Return (ids, negated): the matching ids, or with negated the ids that
+        don't match, so NOT never materializes the full id range"""
+        kind = node[0]
+        if kind == "and":
+            include = []
+            exclude = []
+            # Plain children first: an empty one settles the result unseen
+            for child in sorted(node[1], key=lambda child: child[0] == "not"):
+                ids, negated = self._evaluate(child)
+                if not negated and not ids:
+                    return set(), False
+                (exclude if negated else include).append(ids)
+            if not include:
+                return set().union(*exclude), True
+            include.sort(key=len)
+            return include[0].intersection(*include[1:]).difference(*exclude), False
+        if kind == "or":
+            results = [self._evaluate(child) for child in node[1]]
+            include = [ids for ids, negated in results if not negated]
+            exclude = [ids for ids, negated in results if negated]
+            if not exclude:
+                return set().union(*include), False
+            exclude.sort(key=len)
+            return exclude[0].intersection(*exclude[1:]).difference(*include), True
+        if kind == "not":
+            ids, negated = self._evaluate(node[1])
+            return ids, not negated
+        if kind == "field":
+            return self._lookup(self._fields[node[1]], node[2], node[3]), False
+        if kind == "term":
+            return self._lookup(self._terms, node[1], node[2]), False
+        if kind == "phrase":
+            words = TOKEN_PATTERN.findall(node[1])
+            if words:
+                ids = sorted(self._evaluate(("and", [("term", word, False) for word in words]))[0])
+            else:
+                ids = range(len(self._offsets))
+            return self._with_phrase(ids, node[1]), False
+        if kind == "time":
+            low = bisect.bisect_left(self._time_keys, node[1]) if node[1] is not None else 0
+            high = bisect.bisect_right(self._time_keys, node[2]) if node[2] is not None else len(self._time_keys)
+            return set(self._time_ids[low:high]), False
+        raise QueryError(f"Unknown query node: {kind}")
+
+    def _with_phrase(self, ids, phrase):
+        # Postings only narrow a phrase down to its words; read the candidates
+        # back a batch at a time to check the exact phrase
+        matched = set()
+        for start in range(0, len(ids), LOAD_BATCH_SIZE):
+            batch = ids[start:start + LOAD_BATCH_SIZE]
+            for event_id, event in zip(batch, self.load(batch)):
+                if event is not None and phrase in str(event.get('details', '')).lower():
+                    matched.add(event_id)
+        return matched
+
+    @staticmethod
+    def _lookup(postings, value, prefix):
+        if not prefix:
+            return set(postings.get(value, ()))
+        ids = set()
+        for key, key_ids in postings.items():
+            if key.startswith(value):
+                ids.update(key_ids)
+        return ids
+
+
+def parse_query(text):
+    """Parse a query string into a tree; returns None for an empty query"""
+    tokens = _tokenize(text)
+    if not tokens:
+        return None
+    tree, position = _parse_or(tokens, 0)
+    if position != len(tokens):
+        raise QueryError(f"Unexpected '{tokens[position][1]}'")
+    return tree
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = QUERY_TOKEN_PATTERN.match(text, position)
+        if not match or match.end() == position:
+            raise QueryError(f"Unbalanced quote near '{text[position:].strip()}'")
+        position = match.end()
+        if match.group(1):
+            tokens.append(("(", "("))
+        elif match.group(2):
+            tokens.append((")", ")"))
+        elif match.group(3).upper() in ("AND", "OR", "NOT"):
+            tokens.append((match.group(3).upper(), match.group(3)))
+        else:
+            word = match.group(3)
+            if word.startswith("-") and len(word) > 1:
+                tokens.append(("NOT", "-"))
+                word = word[1:]
+            tokens.append(("WORD", word))
+    return tokens
+
+
+def _parse_or(tokens, position):
+    children = []
+    node, position = _parse_and(tokens, position)
+    children.append(node)
+    while position < len(tokens) and tokens[position][0] == "OR":
+        node, position = _parse_and(tokens, position + 1)
+        children.append(node)
+    return (children[0] if len(children) == 1 else ("or", children)), position
+
+
+def _parse_and(tokens, position):
+    children = []
+    while position < len(tokens) and tokens[position][0] not in ("OR", ")"):
+        if tokens[position][0] == "AND":
+            position += 1
+            continue
+        node, position = _parse_not(tokens, position)
+        children.append(node)
+    if not children:
+        raise QueryError("Expected a search term")
+    return (children[0] if len(children) == 1 else ("and", children)), position
+
+
+def _parse_not(tokens, position):
+    if position >= len(tokens):
+        raise QueryError("Expected a search term")
+    kind, value = tokens[position]
+    if kind == "NOT":
+        node, position = _parse_not(tokens, position + 1)
+        return ("not", node), position
+    if kind == "(":
+        node, position = _parse_or(tokens, position + 1)
+        if position >= len(tokens) or tokens[position][0] != ")":
+            raise QueryError("Missing ')'")
+        return node, position + 1
+    if kind == "WORD":
+        return _parse_term(value), position + 1
+    raise QueryError(f"Unexpected '{value}'")
+
+
+def _parse_term(word):
+    field, sep, value = word.partition(":")
+    if not sep or word.startswith('"') or not field.isidentifier():
+        field, value = None, word
+    field = field.lower() if field else None
+
+    quoted_prefix = len(value) >= 3 and value.startswith('"') and value.endswith('"*')
+    if quoted_prefix:
+        value = value[:-1]
+    quoted = len(value) >= 2 and value.startswith('"') and value.endswith('"')
+    if quoted:
+        value = QUOTE_ESCAPE_PATTERN.sub(r"\1", value[1:-1])
+
+    if field in TIME_FIELDS:
+        return _parse_time_range(value)
+
+    value = value.lower()
+    prefix = quoted_prefix or (value.endswith("*") and not quoted)
+    if prefix and not quoted:
+        value = value[:-1]
+
+    if field is not None:
+        if field not in INDEXED_FIELDS:
+            known = ", ".join(sorted(set(INDEXED_FIELDS) | set(TIME_FIELDS)))
+            raise QueryError(f"Unknown field '{field}' (known fields: {known})")
+        return ("field", INDEXED_FIELDS[field], value, prefix)
+    if quoted:
+        return ("phrase", value)
+    terms = TOKEN_PATTERN.findall(value)
+    if len(terms) != 1:
+        # Punctuated words ("file.txt") match as a phrase of their parts
+        return ("phrase", value)
+    return ("term", terms[0], prefix)
+
+
+def quote_value(value):
+    """Quote a literal value for use in a query, e.g. after "user:" """
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _parse_time_range(value):
+    """Turn time:A..B, time:>=A, time:<B or time:PREFIX into ("time", low, high)
+
+    Bounds are ISO timestamp prefixes; inclusive upper bounds cover every
+    timestamp that starts with them.
+    """
+    if ".." in value:
+        start, _, end = value.partition("..")
+        return ("time", start or None, (end + TIME_PREFIX_END) if end else None)
+    for operator in (">=", "<=", ">", "<"):
+        if value.startswith(operator):
+            bound = value[len(operator):]
+            if not bound:
+                break
+            if operator == ">=":
+                return ("time", bound, None)
+            if operator == ">":
+                return ("time", bound + TIME_PREFIX_END, None)
+            if operator == "<=":
+                return ("time", None, bound + TIME_PREFIX_END)
+            # Strictly before the bound: stop just short of its first timestamp
+            return ("time", None, _prefix_before(bound))
+    if not value or value[0] in "<>":
+        raise QueryError(f"Invalid time range '{value}'")
+    return ("time", value, value + TIME_PREFIX_END)
+
+
+def _prefix_before(bound):
+    # The greatest string sorting before every timestamp that starts with bound
+    return bound[:-1] + chr(ord(bound[-1]) - 1) + TIME_PREFIX_END if bound else ""
+
+
+def query_logs(query, storage=None, stream="system_logs"):
+    """Run one query against a stream without a long-lived index
+
+    Returns an iterator over the matching events. For scripts and one-off
+    tools; long-running code should keep a LogIndex, whose later searches
+    only pay for newly appended events.
+    """
+    if storage is None:
+        from storage import get_storage
+        storage = get_storage()
+    return LogIndex(storage, stream).search(query)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Query SecureVault event logs")
+    parser.add_argument("query", help='Filter expression, e.g. \'user:alice action:login* time:2024-05\'')
+    parser.add_argument("--stream", default="system_logs", choices=["system_logs", "encryption_activity"])
+    parser.add_argument("--count", action="store_true", help="Print only the number of matches")
+    args = parser.parse_args()
+
+    from storage import get_storage
+
+    index = LogIndex(get_storage(), args.stream)
+    try:
+        if args.count:
+            print(len(index.match(args.query)[0]))
+            matches = ()
+        else:
+            matches = index.search(args.query)
+    except QueryError as e:
+        parser.error(str(e))
+    for event in matches:
+        print(json.dumps(event, ensure_ascii=False))
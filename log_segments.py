@@ -0,0 +1,538 @@
+"""Segmented storage for append-only JSONL event logs
+
+The live log ("data/system_logs.jsonl") is the active segment. When it
+grows past SEGMENT_MAX_BYTES, or its first event belongs to an earlier
+period (a day by default) than now, it is rolled: renamed into
+"<log>.segments/NNNNNNNN.jsonl", gzip-compressed and recorded in the
+directory's manifest.json with its event count and time range. Retention
+then archives or deletes sealed segments older than
+SEGMENT_RETENTION_DAYS. Time-range readers consult the manifest and open
+only the segments that overlap the requested range.
+"""
+import os
+import json
+import gzip
+import atexit
+import shutil
+import datetime
+import threading
+import contextlib
+from file_lock import file_lock, lock_fd, unlock_fd, atomic_write_json
+from file_cache import default_cache
+
+# Roll the active segment once it would grow beyond this size...
+SEGMENT_MAX_BYTES = 16 * 1024 * 1024
+# ...or once its first event is from an earlier period: an ISO timestamp
+# prefix length (10: one segment per day, 13: per hour)
+SEGMENT_PERIOD_CHARS = 10
+SEGMENT_COMPRESS_LEVEL = 6
+# Sealed segments whose newest event is older than this many days are
+# archived or deleted; 0 keeps everything
+SEGMENT_RETENTION_DAYS = int(os.environ.get("SECUREVAULT_LOG_RETENTION_DAYS", 0))
+# "archive" (move to LOG_ARCHIVE_DIR) or "delete"
+SEGMENT_RETENTION_ACTION = os.environ.get("SECUREVAULT_LOG_RETENTION_ACTION", "archive")
+LOG_ARCHIVE_DIR = "data/archive"
+
+MANIFEST_FILE_NAME = "manifest.json"
+SEGMENT_SUFFIX = ".jsonl"
+COMPRESSED_SUFFIX = ".jsonl.gz"
+
+# path -> (inode, first timestamp) of the active segment, so the period check
+# reads the file's first line once per segment rather than on every flush
+_first_timestamps = {}
+# Logs being refilled from a backup (see restoring)
+_restoring = set()
+# path -> whether retention should follow, for logs waiting on the background
+# sealer, and the sealer thread of each log that has one running
+_seal_requests = {}
+_sealers = {}
+_sealers_lock = threading.Lock()
+
+
+def segment_dir(path):
+    return path + ".segments"
+
+
+def manifest_path(path):
+    return os.path.join(segment_dir(path), MANIFEST_FILE_NAME)
+
+
+def _segment_name(sequence, compressed):
+    return f"{sequence:08d}{COMPRESSED_SUFFIX if compressed else SEGMENT_SUFFIX}"
+
+
+def _read_manifest_file(manifest_file):
+    try:
+        with open(manifest_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except ValueError:
+        print(f"Debug - Corrupt segment manifest {manifest_file}")
+        return {}
+
+
+def load_manifest(path):
+    """Return {sequence (int): entry} for the log's sealed segments"""
+    data = default_cache.load(manifest_path(path), _read_manifest_file, default={})
+    return {int(sequence): entry for sequence, entry in data.get("segments", {}).items()}
+
+
+def _last_sequence(path):
+    # Highest sequence ever sealed, so numbers aren't reused once retention
+    # has emptied the directory (event refs name segments by number)
+    data = default_cache.load(manifest_path(path), _read_manifest_file, default={})
+    return data.get("last_sequence", 0)
+
+
+def list_segments(path):
+    """Sequence numbers of every segment on disk (sealed or still being sealed), oldest first"""
+    try:
+        names = os.listdir(segment_dir(path))
+    except FileNotFoundError:
+        return []
+    sequences = set()
+    for name in names:
+        for suffix in (COMPRESSED_SUFFIX, SEGMENT_SUFFIX):
+            if name.endswith(suffix) and name[:-len(suffix)].isdigit():
+                sequences.add(int(name[:-len(suffix)]))
+    return sorted(sequences)
+
+
+def open_segment(path, sequence):
+    """Open a segment for reading as a binary stream of JSONL lines"""
+    directory = segment_dir(path)
+    try:
+        # Uncompressed until it has been sealed
+        return open(os.path.join(directory, _segment_name(sequence, False)), "rb")
+    except FileNotFoundError:
+        return gzip.open(os.path.join(directory, _segment_name(sequence, True)), "rb")
+
+
+def iter_segment(path, sequence, skip_bytes=0):
+    """Yield the events of one segment, optionally after its first skip_bytes bytes"""
+    for _, event in iter_segment_lines(path, sequence, skip_bytes):
+        yield event
+
+
+def iter_segment_lines(path, sequence, skip_bytes=0):
+    """Like iter_segment, but yield (offset, event) with each line's byte offset
+
+    Offsets are into the uncompressed segment, which is the active file it
+    was rolled from, byte for byte.
+    """
+    try:
+        f = open_segment(path, sequence)
+    except FileNotFoundError:
+        # Removed by retention or clearing while we were reading
+        return
+    with f:
+        offset = skip_bytes
+        if skip_bytes:
+            f.seek(skip_bytes)
+        for line in f:
+            line_offset = offset
+            offset += len(line)
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_offset, json.loads(line)
+            except ValueError:
+                continue
+
+
+def _segment_inode(path, sequence, manifest):
+    entry = manifest.get(sequence)
+    if entry is not None:
+        return entry.get("inode")
+    try:
+        return os.stat(os.path.join(segment_dir(path), _segment_name(sequence, False))).st_ino
+    except FileNotFoundError:
+        return None
+
+
+def segments_after_cursor(path, inode, offset, fingerprint):
+    """Locate a rolled-away active segment by its inode
+
+    Returns [(sequence, skip_bytes), ...]: the rest of the segment a tail
+    cursor was reading, then every later segment. Returns None if no segment
+    matches (the log was cleared or the segment is gone).
+    """
+    manifest = load_manifest(path)
+    sequences = list_segments(path)
+    # Newest first: the segment is usually the one rolled most recently.
+    # Inode numbers get reused once a plain segment is sealed, so the
+    # leading bytes have to match too
+    for position in range(len(sequences) - 1, -1, -1):
+        sequence = sequences[position]
+        if _segment_inode(path, sequence, manifest) != inode:
+            continue
+        entry = manifest.get(sequence)
+        if entry is not None and entry.get("bytes", 0) < offset:
+            continue
+        try:
+            with open_segment(path, sequence) as f:
+                if f.read(len(fingerprint)) != fingerprint:
+                    continue
+        except FileNotFoundError:
+            continue
+        return [(sequence, offset)] + [(later, 0) for later in sequences[position + 1:]]
+    return None
+
+
+def _overlaps(entry, start, end):
+    if entry is None:
+        # Not sealed yet, so its time range isn't known
+        return True
+    if start is not None and (entry.get("end") or "") < start:
+        return False
+    if end is not None and (entry.get("start") or "") > end:
+        return False
+    return True
+
+
+def iter_events_between(path, start=None, end=None):
+    """Yield sealed-segment events with start <= timestamp <= end, oldest segment first
+
+    Segments whose recorded time range doesn't overlap are never opened.
+    """
+    manifest = load_manifest(path)
+    for sequence in list_segments(path):
+        if not _overlaps(manifest.get(sequence), start, end):
+            continue
+        for event in iter_segment(path, sequence):
+            timestamp = event.get('timestamp', '')
+            if (start is None or timestamp >= start) and (end is None or timestamp <= end):
+                yield event
+
+
+def last_events(path, count):
+    """Return up to count of the newest sealed-segment events, newest first"""
+    events = []
+    for sequence in reversed(list_segments(path)):
+        if len(events) >= count:
+            break
+        events.extend(iter_segment(path, sequence))
+    events.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
+    return events[:count]
+
+
+def _first_timestamp(path, inode):
+    cached = _first_timestamps.get(path)
+    if cached is not None and cached[0] == inode:
+        return cached[1]
+    timestamp = None
+    try:
+        with open(path, "rb") as f:
+            line = f.readline(64 * 1024)
+        if line.endswith(b"\n"):
+            timestamp = json.loads(line).get('timestamp')
+    except (OSError, ValueError, AttributeError):
+        pass
+    _first_timestamps[path] = (inode, timestamp)
+    return timestamp
+
+
+@contextlib.contextmanager
+def restoring(path):
+    """Hold off period rolls and retention for a log while past events are written back
+
+    Restored events carry old timestamps, so the period rule would seal every
+    appended batch as its own segment and retention could expire them right
+    away. Only the size rule rolls the log meanwhile.
+    """
+    _restoring.add(path)
+    try:
+        yield
+    finally:
+        _restoring.discard(path)
+
+
+def needs_roll(path, incoming_bytes=0, now=None):
+    """True if the active segment should be rolled before incoming_bytes are appended"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if not st.st_size:
+        return False
+    if st.st_size + incoming_bytes > SEGMENT_MAX_BYTES:
+        return True
+    if path in _restoring:
+        return False
+    first = _first_timestamp(path, st.st_ino)
+    now = now or datetime.datetime.now().isoformat()
+    return bool(first) and first[:SEGMENT_PERIOD_CHARS] < now[:SEGMENT_PERIOD_CHARS]
+
+
+def roll(path, seal=True):
+    """Turn the active segment into a sealed one; returns its sequence number or None
+
+    The rename happens under the same lock appenders take, so no batch is
+    split across segments; compression happens afterwards without it. With
+    seal=False only the rename is done here: compression and retention run on
+    a background thread, and readers use the plain segment until then.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return None
+    try:
+        lock_fd(fd)
+        try:
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                return None
+            st = os.fstat(fd)
+            if st.st_ino != current.st_ino or not st.st_size:
+                # Another process rolled it first
+                return None
+            directory = segment_dir(path)
+            os.makedirs(directory, exist_ok=True)
+            existing = list_segments(path)
+            sequence = max(existing[-1] if existing else 0, _last_sequence(path)) + 1
+            os.rename(path, os.path.join(directory, _segment_name(sequence, False)))
+            # Start the next active segment straight away, so tail readers
+            # always have a file to hold a cursor on
+            try:
+                os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+            except FileExistsError:
+                pass
+        finally:
+            unlock_fd(fd)
+    finally:
+        os.close(fd)
+
+    if not seal:
+        seal_in_background(path)
+        return sequence
+    seal_pending(path)
+    if path not in _restoring:
+        apply_retention(path)
+    return sequence
+
+
+def seal_in_background(path):
+    """Seal rolled segments and apply retention on a daemon thread; returns at once
+
+    Requests made while the log's sealer is busy are coalesced into one more pass.
+    """
+    with _sealers_lock:
+        _seal_requests[path] = _seal_requests.get(path, False) or path not in _restoring
+        if path in _sealers:
+            return
+        sealer = threading.Thread(target=_seal_loop, args=(path,), name="segment-sealer", daemon=True)
+        _sealers[path] = sealer
+    sealer.start()
+
+
+def _seal_loop(path):
+    while True:
+        with _sealers_lock:
+            if path not in _seal_requests:
+                del _sealers[path]
+                return
+            retention = _seal_requests.pop(path)
+        try:
+            seal_pending(path)
+            if retention:
+                apply_retention(path)
+        except Exception as e:
+            print(f"Debug - Sealing segments of {path} failed: {e}")
+
+
+def wait_for_sealing():
+    """Block until every background sealer has finished"""
+    while True:
+        with _sealers_lock:
+            sealers = list(_sealers.values())
+        if not sealers:
+            return
+        for sealer in sealers:
+            sealer.join()
+
+
+# A process that rolled shortly before exiting still leaves sealed segments
+atexit.register(wait_for_sealing)
+
+
+def seal_pending(path):
+    """Compress every rolled but unsealed segment and record it in the manifest
+
+    Also finishes segments left behind by a process that stopped mid-seal.
+    """
+    directory = segment_dir(path)
+    manifest_file = manifest_path(path)
+    with file_lock(manifest_file):
+        data = _read_manifest_file(manifest_file) if os.path.exists(manifest_file) else {}
+        segments = data.setdefault("segments", {})
+        sealed = []
+        for sequence in list_segments(path):
+            plain_path = os.path.join(directory, _segment_name(sequence, False))
+            if not os.path.exists(plain_path):
+                continue
+            segments[str(sequence)] = _compress_segment(plain_path, os.path.join(directory, _segment_name(sequence, True)))
+            data["last_sequence"] = max(data.get("last_sequence", 0), sequence)
+            sealed.append(plain_path)
+        if not sealed:
+            return 0
+        atomic_write_json(manifest_file, data)
+        # Plain copies go only once the manifest knows the compressed ones
+        for plain_path in sealed:
+            os.remove(plain_path)
+        return len(sealed)
+
+
+def _compress_segment(plain_path, compressed_path):
+    """Write a gzip copy of a segment; returns its manifest entry"""
+    st = os.stat(plain_path)
+    entry = {
+        "file": os.path.basename(compressed_path),
+        "inode": st.st_ino,
+        "bytes": st.st_size,
+        "count": 0,
+        "start": None,
+        "end": None,
+    }
+    tmp_path = compressed_path + ".tmp"
+    with open(plain_path, "rb") as src, open(tmp_path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=SEGMENT_COMPRESS_LEVEL) as dst:
+            for line in src:
+                dst.write(line)
+                try:
+                    timestamp = json.loads(line).get('timestamp')
+                except (ValueError, AttributeError):
+                    continue
+                entry["count"] += 1
+                if timestamp:
+                    if entry["start"] is None or timestamp < entry["start"]:
+                        entry["start"] = timestamp
+                    if entry["end"] is None or timestamp > entry["end"]:
+                        entry["end"] = timestamp
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, compressed_path)
+    entry["compressed_bytes"] = os.path.getsize(compressed_path)
+    return entry
+
+
+def _move_segment(path, sequence, entry, destination):
+    """Move a sealed segment into destination, named after its stream and time range"""
+    os.makedirs(destination, exist_ok=True)
+    stream = os.path.basename(path).split(".")[0]
+    day = (entry.get("start") or "unknown")[:10]
+    target = os.path.join(destination, f"{stream}-{day}-{sequence:08d}{COMPRESSED_SUFFIX}")
+    shutil.move(os.path.join(segment_dir(path), entry.get("file", _segment_name(sequence, True))), target)
+    return target
+
+
+def _newest_time(path, entry):
+    """Newest event time of a sealed segment for retention
+
+    Falls back to the compressed file's mtime (when it was sealed) if no
+    event had a timestamp; None if that is unknown too, so it is kept.
+    """
+    if entry.get("end"):
+        return entry["end"]
+    try:
+        mtime = os.path.getmtime(os.path.join(segment_dir(path), entry["file"]))
+    except (OSError, KeyError):
+        return None
+    return datetime.datetime.fromtimestamp(mtime).isoformat()
+
+
+def apply_retention(path, days=None, action=None, archive_dir=LOG_ARCHIVE_DIR, now=None):
+    """Archive or delete sealed segments whose newest event is older than days; returns how many"""
+    days = SEGMENT_RETENTION_DAYS if days is None else days
+    action = action or SEGMENT_RETENTION_ACTION
+    if days <= 0:
+        return 0
+    cutoff = ((now or datetime.datetime.now()) - datetime.timedelta(days=days)).isoformat()
+    manifest_file = manifest_path(path)
+    with file_lock(manifest_file):
+        if not os.path.exists(manifest_file):
+            return 0
+        data = _read_manifest_file(manifest_file)
+        segments = data.get("segments", {})
+        expired = []
+        for sequence, entry in segments.items():
+            newest = _newest_time(path, entry)
+            if newest is not None and newest < cutoff:
+                expired.append(sequence)
+        for sequence in expired:
+            entry = segments.pop(sequence)
+            try:
+                if action == "delete":
+                    os.remove(os.path.join(segment_dir(path), entry["file"]))
+                else:
+                    _move_segment(path, int(sequence), entry, archive_dir)
+            except FileNotFoundError:
+                pass
+        if expired:
+            atomic_write_json(manifest_file, data)
+        return len(expired)
+
+
+def archive_all(path, destination):
+    """Roll the active segment and move every sealed segment into destination
+
+    Afterwards the log holds no events. Returns (segments moved, events moved).
+    """
+    roll(path)
+    seal_pending(path)
+    manifest_file = manifest_path(path)
+    with file_lock(manifest_file):
+        if not os.path.exists(manifest_file):
+            return 0, 0
+        data = _read_manifest_file(manifest_file)
+        segments = data.get("segments", {})
+        events = 0
+        for sequence, entry in sorted(segments.items()):
+            try:
+                _move_segment(path, int(sequence), entry, destination)
+                events += entry.get("count", 0)
+            except FileNotFoundError:
+                pass
+        atomic_write_json(os.path.join(destination, MANIFEST_FILE_NAME), data)
+        moved = len(segments)
+        data["segments"] = {}
+        atomic_write_json(manifest_file, data)
+    return moved, events
+
+
+def remove_all(path):
+    """Delete every sealed segment of a log (used when the log is cleared)"""
+    manifest_file = manifest_path(path)
+    with file_lock(manifest_file):
+        for sequence in list_segments(path):
+            for compressed in (False, True):
+                try:
+                    os.remove(os.path.join(segment_dir(path), _segment_name(sequence, compressed)))
+                except FileNotFoundError:
+                    pass
+        if os.path.exists(manifest_file):
+            data = _read_manifest_file(manifest_file)
+            atomic_write_json(manifest_file, {"segments": {}, "last_sequence": data.get("last_sequence", 0)})
+
+
+if __name__ == "__main__":
+    import argparse
+    import event_log
+
+    parser = argparse.ArgumentParser(description="Inspect and maintain segmented event logs")
+    parser.add_argument("command", choices=["list", "roll", "retention"])
+    parser.add_argument("--log", default=event_log.SYSTEM_LOG_FILE, help="Active log file")
+    parser.add_argument("--days", type=int, help="Retention age in days (default: SECUREVAULT_LOG_RETENTION_DAYS)")
+    parser.add_argument("--action", choices=["archive", "delete"], help="What retention does with old segments")
+    args = parser.parse_args()
+
+    if args.command == "roll":
+        event_log.flush_path(args.log)
+        print(f"Rolled segment {roll(args.log)}")
+    elif args.command == "retention":
+        print(f"{apply_retention(args.log, args.days, args.action)} segments removed")
+    manifest = load_manifest(args.log)
+    for sequence in list_segments(args.log):
+        entry = manifest.get(sequence, {})
+        print(f"{sequence:08d}  {entry.get('start')} .. {entry.get('end')}  "
+              f"{entry.get('count', '?')} events  {entry.get('bytes', '?')} → {entry.get('compressed_bytes', '?')} bytes")
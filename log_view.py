@@ -0,0 +1,58 @@
+import bisect
+
+# Log entries rendered per page of the System Logs tab
+LOG_PAGE_SIZE = 100
+
+
+class LogView:
+    """Newest-first, randomly addressable view over a set of log events
+
+    Holds only the events' ids and timestamps, in timestamp order; a page's
+    events are fetched with load(ids) when it is shown, so memory grows with
+    the number of ids rather than with the events themselves. load returns a
+    list parallel to ids, with None for events that have since gone.
+    """
+
+    def __init__(self, ids=(), timestamps=(), load=None, page_size=LOG_PAGE_SIZE):
+        self.page_size = page_size
+        self._ids = ids
+        self._timestamps = timestamps
+        self._load = load
+
+    def __len__(self):
+        return len(self._ids)
+
+    def get(self, position):
+        """Return the event at a newest-first position, or None if it is gone"""
+        return self._load([self._ids[len(self._ids) - 1 - position]])[0]
+
+    def timestamp_at(self, position):
+        """Return the timestamp at a newest-first position"""
+        return self._timestamps[len(self._timestamps) - 1 - position]
+
+    def page_count(self):
+        return max(1, -(-len(self._ids) // self.page_size))
+
+    def clamp_page(self, page):
+        return min(max(page, 0), self.page_count() - 1)
+
+    def page(self, page):
+        """Return [(position, event), ...] for one page, newest first"""
+        start = self.clamp_page(page) * self.page_size
+        positions = range(start, min(start + self.page_size, len(self._ids)))
+        if not positions:
+            return []
+        events = self._load([self._ids[len(self._ids) - 1 - position] for position in positions])
+        return [(position, event) for position, event in zip(positions, events) if event is not None]
+
+    def position_for_time(self, timestamp):
+        """Newest-first position of the latest event at or before timestamp"""
+        index = bisect.bisect_right(self._timestamps, timestamp)
+        if index == 0:
+            # Everything is newer; the closest entry is the oldest one
+            return max(len(self._ids) - 1, 0)
+        return len(self._ids) - index
+
+    def page_for_time(self, timestamp):
+        """Page holding the latest event at or before timestamp"""
+        return self.position_for_time(timestamp) // self.page_size
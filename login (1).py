@@ -4,12 +4,17 @@ import hashlib
 import datetime
 import json
 import os
+from storage import get_storage, USERS, STORAGE_BACKEND
+
+# Where accounts were kept before they moved into the storage backend
+LEGACY_USERS_FILE = "users_data.json"
 
 class CyberSecurityApp:
     def __init__(self):
-        # File-based user storage
-        self.users_file = "users_data.json"
-        self.load_users_from_file()
+        # Accounts live in the shared storage backend (JSON or SQLite)
+        self.storage = get_storage()
+        self.import_legacy_users()
+        self.load_users()
         
         # Add admin user if not exists
         self.create_admin_user()
@@ -34,28 +39,42 @@ class CyberSecurityApp:
         # Show login page initially
         self.show_login_page()
     
-    def load_users_from_file(self):
-        """Load users from JSON file"""
+    def import_legacy_users(self):
+        """Copy accounts from the old standalone users file into storage, once"""
+        if not os.path.exists(LEGACY_USERS_FILE):
+            return
         try:
-            if os.path.exists(self.users_file):
-                with open(self.users_file, 'r') as f:
-                    self.users_data = json.load(f)
-                print(f"Debug - Loaded {len(self.users_data)} users from file")
-            else:
-                self.users_data = {}
-                print("Debug - Created new users data structure")
+            with open(LEGACY_USERS_FILE, 'r') as f:
+                legacy_users = json.load(f)
+            # Accounts already in storage win over the legacy copy
+            self.storage.update_records(USERS, {
+                username: (lambda current, record=record: current or record)
+                for username, record in legacy_users.items()
+            })
+            os.replace(LEGACY_USERS_FILE, LEGACY_USERS_FILE + ".migrated")
+            print(f"Debug - Imported {len(legacy_users)} users from {LEGACY_USERS_FILE}")
+        except Exception as e:
+            print(f"Debug - Error importing legacy users file: {e}")
+    
+    def load_users(self):
+        """Load users from the storage backend"""
+        try:
+            # Copy so local edits never touch the backend's cached document
+            self.users_data = dict(self.storage.load_document(USERS))
+            print(f"Debug - Loaded {len(self.users_data)} users from storage")
         except Exception as e:
-            print(f"Debug - Error loading users file: {e}")
+            print(f"Debug - Error loading users: {e}")
             self.users_data = {}
     
-    def save_users_to_file(self):
-        """Save users to JSON file"""
+    def save_user(self, username):
+        """Write one account to the storage backend"""
+        record = self.users_data[username]
         try:
-            with open(self.users_file, 'w') as f:
-                json.dump(self.users_data, f, indent=2)
-            print("Debug - Users data saved to file successfully")
+            self.storage.update_records(USERS, {username: lambda current: record})
+            print(f"Debug - User '{username}' saved to storage successfully")
         except Exception as e:
-            print(f"Debug - Error saving users file: {e}")
+            print(f"Debug - Error saving user '{username}': {e}")
+            raise
     
     def create_admin_user(self):
         """Create admin user 'sagar' with password 'devprit' if not exists"""
@@ -71,7 +90,7 @@ class CyberSecurityApp:
                 "role": "admin",
                 "timestamp": timestamp
             }
-            self.save_users_to_file()
+            self.save_user(admin_username)
             print("Debug - Admin user 'sagar' created successfully")
         else:
             print("Debug - Admin user 'sagar' already exists")
@@ -328,9 +347,9 @@ class CyberSecurityApp:
         users_display.insert("1.0", users_text if users_text else "No users found")
         users_display.configure(state="disabled")
         
-        # File info
+        # Storage info
         file_info_label = ctk.CTkLabel(users_frame, 
-                                     text=f"📁 Data stored in: {self.users_file}", 
+                                     text=f"📁 Data stored in: {STORAGE_BACKEND} storage", 
                                      font=("Courier New", 9),
                                      text_color="#888888")
         file_info_label.pack(pady=(0, 10))
@@ -351,11 +370,11 @@ class CyberSecurityApp:
                    font=("Courier New", 12, "bold"),
                    text_color="#ffffff").pack(pady=(10, 5))
         
-        # Get user info from file data
+        # Get user info from storage
         user_data = self.users_data.get(self.current_user, {})
         
         if user_data:
-            info_text = f"Username: {self.current_user}\nRole: {user_data['role'].upper()}\nRegistered: {user_data['timestamp']}\nStatus: AUTHENTICATED ✅\nData Source: File-based storage"
+            info_text = f"Username: {self.current_user}\nRole: {user_data['role'].upper()}\nRegistered: {user_data['timestamp']}\nStatus: AUTHENTICATED ✅\nData Source: {STORAGE_BACKEND.upper()} storage"
         else:
             info_text = "User information not available"
         
@@ -387,6 +406,8 @@ class CyberSecurityApp:
             messagebox.showerror("❌ Error", "Password must be at least 3 characters long")
             return
 
+        # Another app may have registered accounts since we last looked
+        self.load_users()
         if username in self.users_data:
             messagebox.showerror("❌ Error", "Username already exists")
             return
@@ -402,8 +423,8 @@ class CyberSecurityApp:
                 "timestamp": timestamp
             }
             
-            # Save to file
-            self.save_users_to_file()
+            # Save through the storage backend
+            self.save_user(username)
             
             print(f"Debug - User registration successful: {username}")
             messagebox.showinfo("✅ Success", "Registration successful!\nPlease login with your credentials.")
@@ -416,6 +437,8 @@ class CyberSecurityApp:
             self.show_login_page()
             
         except Exception as e:
+            # Don't keep an account that never reached storage
+            self.users_data.pop(username, None)
             print(f"Debug - Unexpected error during registration: {e}")
             messagebox.showerror("❌ Error", f"Registration failed: {str(e)}")
     
@@ -431,9 +454,10 @@ class CyberSecurityApp:
             return
 
         try:
-            # Check if user exists in file data
+            # Check if user exists in storage
+            self.load_users()
             if username not in self.users_data:
-                print("Debug - User doesn't exist in file")
+                print("Debug - User doesn't exist in storage")
                 messagebox.showerror("❌ Error", "User not found")
                 return
             
@@ -0,0 +1,98 @@
+import threading
+from collections import deque
+
+
+class RefreshCancelled(Exception):
+    """Raised inside a build when a newer refresh has been requested"""
+
+
+class RefreshWorker:
+    """Runs refresh builds on one background thread, newest request wins
+
+    build(generation, *args) runs on the worker thread and returns a result;
+    deliver(generation, result, error) is called with it afterwards, also on
+    the worker thread. Builds never overlap: requests made while one is in
+    flight are coalesced into a single follow-up build, and a build that is
+    overtaken by a newer request is dropped instead of delivered.
+
+    submit() queues one-off tasks on the same thread. They run in order
+    between builds and are never dropped, so they can share state with
+    build without extra locking.
+    """
+
+    def __init__(self, build, deliver, name="refresh-worker"):
+        self._build = build
+        self._deliver = deliver
+        self._cond = threading.Condition()
+        self._pending = None
+        self._tasks = deque()
+        self._generation = 0
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def request(self, *args):
+        """Queue a refresh and return its generation number"""
+        with self._cond:
+            self._generation += 1
+            self._pending = (self._generation, args)
+            self._cond.notify()
+            return self._generation
+
+    def submit(self, task, done):
+        """Run task() on the worker thread, then done(result, error) there too"""
+        with self._cond:
+            self._tasks.append((task, done))
+            self._cond.notify()
+
+    def is_current(self, generation):
+        """True while no newer refresh has been requested"""
+        return generation == self._generation and not self._stopped
+
+    def check(self, generation):
+        """Abort the running build if it has been superseded"""
+        if not self.is_current(generation):
+            raise RefreshCancelled()
+
+    def stop(self):
+        """Stop the worker; an in-flight build finishes but is not delivered"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._tasks and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                if self._tasks:
+                    task = self._tasks.popleft()
+                else:
+                    task = None
+                    generation, args = self._pending
+                    self._pending = None
+
+            if task is not None:
+                self._run_task(*task)
+                continue
+
+            result = error = None
+            try:
+                result = self._build(generation, *args)
+            except RefreshCancelled:
+                continue
+            except Exception as e:
+                error = e
+
+            if self.is_current(generation):
+                self._deliver(generation, result, error)
+
+    def _run_task(self, task, done):
+        result = error = None
+        try:
+            result = task()
+        except Exception as e:
+            error = e
+        done(result, error)
@@ -0,0 +1,583 @@
+import os
+import json
+import gzip
+import heapq
+import itertools
+import sqlite3
+import datetime
+import threading
+import contextlib
+import event_log
+import log_segments
+from file_lock import atomic_write_json, update_json_file
+from file_cache import default_cache
+from time_index import TimeIndexedLog
+
+# Backend selection: "json" (JSON documents + JSONL event logs) or "sqlite"
+STORAGE_BACKEND = os.environ.get("SECUREVAULT_STORAGE", "json")
+SQLITE_DB_FILE = "data/securevault.db"
+
+# Keyed document stores
+USERS = "users"
+FILES = "files"
+KEY_RING = "key_ring"
+DOCUMENT_FILES = {
+    USERS: "data/users_data.json",
+    FILES: "data/files_data.json",
+    KEY_RING: "data/key_ring.json",
+}
+
+# Append-only event streams
+SYSTEM_LOGS = "system_logs"
+ENCRYPTION_ACTIVITY = "encryption_activity"
+EVENT_FILES = {
+    SYSTEM_LOGS: event_log.SYSTEM_LOG_FILE,
+    ENCRYPTION_ACTIVITY: event_log.ENCRYPTION_LOG_FILE,
+}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def _filter_events(events, start=None, end=None, username=None):
+    for event in events:
+        timestamp = event.get('timestamp', '')
+        if start is not None and timestamp < start:
+            continue
+        if end is not None and timestamp > end:
+            continue
+        if username is not None and event.get('username') != username:
+            continue
+        yield event
+
+
+class StorageBackend:
+    """Interface shared by every storage backend"""
+
+    # create_storage() name; read cursors are only valid for the backend that made them
+    name = None
+
+    def load_document(self, name):
+        raise NotImplementedError
+
+    def save_document(self, name, data):
+        raise NotImplementedError
+
+    def update_document(self, name, update):
+        """Apply update(data) to a document atomically and return its result"""
+        raise NotImplementedError
+
+    def update_records(self, name, updates):
+        """Atomically replace records of a keyed document
+
+        updates maps record key -> update(record or None) returning the new
+        record. Backends that store records individually only touch these keys.
+        """
+        def apply(data):
+            for key, update in updates.items():
+                data[key] = update(data.get(key))
+        self.update_document(name, apply)
+
+    def append_events(self, stream, entries):
+        raise NotImplementedError
+
+    def append_event(self, stream, entry):
+        self.append_events(stream, [entry])
+
+    def read_events(self, stream):
+        raise NotImplementedError
+
+    def iter_events(self, stream):
+        """Yield a stream's events oldest first without holding them all in memory"""
+        return iter(self.read_events(stream))
+
+    def iter_document(self, name):
+        """Yield (key, record) pairs of a document"""
+        return iter(self.load_document(name).items())
+
+    def iter_events_between(self, stream, start=None, end=None, username=None):
+        """Yield events with start <= timestamp <= end (and of one user) in stream order
+
+        Any of the filters may be None.
+        """
+        return _filter_events(self.iter_events(stream), start, end, username)
+
+    def clear_events(self, stream):
+        raise NotImplementedError
+
+    def restoring_events(self, stream):
+        """Context manager wrapped around clearing a stream and writing back
+        events from a backup, so the backend stores them as one history
+        """
+        return contextlib.nullcontext()
+
+    def archive_events(self, stream, destination):
+        """Move every event of a stream into the destination directory, leaving it empty
+
+        Returns the number of events archived.
+        """
+        os.makedirs(destination, exist_ok=True)
+        events = self.read_events(stream)
+        with gzip.open(os.path.join(destination, f"{stream}.jsonl.gz"), "wb") as f:
+            for entry in events:
+                f.write(event_log.encode_event(entry))
+        self.clear_events(stream)
+        return len(events)
+
+    def read_new_events(self, stream, cursor=None):
+        """Return (events, new_cursor, reset) for events added after cursor
+
+        reset is True when the stream was cleared or replaced since the cursor
+        was taken; events then holds the stream's full contents.
+        """
+        raise NotImplementedError
+
+    def scan_new_events(self, stream, cursor, visit, on_reset=None):
+        """Like read_new_events, but hands each event to visit(event) instead of
+        collecting them; on_reset() is called before a full replay.
+        Returns (new_cursor, reset).
+        """
+        events, cursor, reset = self.read_new_events(stream, cursor)
+        if reset and on_reset is not None:
+            on_reset()
+        for event in events:
+            visit(event)
+        return cursor, reset
+
+    def scan_new_event_refs(self, stream, cursor, visit, on_reset=None, on_roll=None):
+        """Like scan_new_events, but visit(segment, offset, event) also gets a ref
+        to where the event is stored, for load_event_refs() to fetch it again.
+        on_roll(segment) is called when refs made in event_log.ACTIVE_SEGMENT
+        now point into that sealed segment.
+        """
+        raise NotImplementedError
+
+    def load_event_refs(self, stream, refs, cursor=None):
+        """Fetch events by (segment, offset) ref; returns a list parallel to refs,
+        with None for events that no longer exist. cursor is the scan cursor
+        the refs were collected under.
+        """
+        raise NotImplementedError
+
+    def recent_events(self, stream, limit):
+        """Return the newest events, newest first"""
+        return heapq.nlargest(limit, self.read_events(stream), key=lambda x: x.get('timestamp', ''))
+
+    def events_since(self, stream, timestamp):
+        """Return events with an ISO timestamp later than the given one, oldest first"""
+        events = [e for e in self.read_events(stream) if e.get('timestamp', '') > timestamp]
+        return sorted(events, key=lambda x: x.get('timestamp', ''))
+
+
+def _read_json_document(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except ValueError:
+        print(f"Debug - Corrupt JSON in {path}")
+        return {}
+
+
+class JsonBackend(StorageBackend):
+    """JSON documents plus append-only JSONL event logs under data/
+
+    Reads go through a stat-validated cache, so unchanged files are not re-parsed.
+    """
+
+    name = "json"
+
+    def __init__(self, cache=None):
+        self.cache = cache or default_cache
+        self._time_indexes = {}
+        self._time_indexes_lock = threading.Lock()
+
+    def time_index(self, stream):
+        """Return the sparse time index for an event stream"""
+        with self._time_indexes_lock:
+            index = self._time_indexes.get(stream)
+            if index is None:
+                index = TimeIndexedLog(EVENT_FILES[stream])
+                self._time_indexes[stream] = index
+            return index
+
+    def load_document(self, name):
+        return self.cache.load(DOCUMENT_FILES[name], _read_json_document, default={})
+
+    def save_document(self, name, data):
+        atomic_write_json(DOCUMENT_FILES[name], data)
+
+    def update_document(self, name, update):
+        return update_json_file(DOCUMENT_FILES[name], update, default=dict)
+
+    def append_events(self, stream, entries):
+        event_log.get_writer(EVENT_FILES[stream]).write_many(entries)
+
+    def read_events(self, stream):
+        path = EVENT_FILES[stream]
+        if event_log.is_segmented(path):
+            # Spans every sealed segment; the active file's signature alone
+            # can't validate a cached copy
+            return event_log.read_events(path)
+        # Push out this process's buffered events so the signature reflects them
+        event_log.ensure_migrated(path)
+        event_log.flush_path(path)
+        return self.cache.load(path, event_log.read_events, default=[])
+
+    def iter_events(self, stream):
+        return event_log.iter_events(EVENT_FILES[stream])
+
+    def iter_events_between(self, stream, start=None, end=None, username=None):
+        path = EVENT_FILES[stream]
+        if not event_log.is_segmented(path):
+            return super().iter_events_between(stream, start, end, username)
+        # Sealed segments outside the range are skipped without being opened
+        sealed = _filter_events(log_segments.iter_events_between(path, start, end), username=username)
+        active = _filter_events(event_log.iter_events(path, segments=False), start, end, username)
+        return itertools.chain(sealed, active)
+
+    def clear_events(self, stream):
+        event_log.clear_events(EVENT_FILES[stream])
+
+    @contextlib.contextmanager
+    def restoring_events(self, stream):
+        path = EVENT_FILES[stream]
+        # Buffered events are flushed before leaving, while rolls are still held off
+        with log_segments.restoring(path):
+            try:
+                yield
+            finally:
+                event_log.flush_path(path)
+
+    def archive_events(self, stream, destination):
+        path = EVENT_FILES[stream]
+        if not event_log.is_segmented(path):
+            return super().archive_events(stream, destination)
+        # Sealed segments are already compressed, so archiving just moves them
+        event_log.flush_path(path)
+        _, count = log_segments.archive_all(path, destination)
+        return count
+
+    def read_new_events(self, stream, cursor=None):
+        return event_log.read_tail(EVENT_FILES[stream], cursor)
+
+    def scan_new_events(self, stream, cursor, visit, on_reset=None):
+        path = EVENT_FILES[stream]
+        event_log.ensure_migrated(path)
+        event_log.flush_path(path)
+        return event_log.scan_log_tail(path, cursor, visit, on_reset)
+
+    def scan_new_event_refs(self, stream, cursor, visit, on_reset=None, on_roll=None):
+        path = EVENT_FILES[stream]
+        event_log.ensure_migrated(path)
+        event_log.flush_path(path)
+        return event_log.scan_log_refs(path, cursor, visit, on_reset, on_roll)
+
+    def load_event_refs(self, stream, refs, cursor=None):
+        return event_log.read_event_refs(EVENT_FILES[stream], refs, cursor)
+
+    def recent_events(self, stream, limit):
+        events = self.time_index(stream).last(limit)
+        path = EVENT_FILES[stream]
+        if len(events) < limit and event_log.is_segmented(path):
+            # The active segment is young; top up from the newest sealed ones
+            events += log_segments.last_events(path, limit - len(events))
+        return events
+
+    def _sealed_events(self, stream, start, end):
+        path = EVENT_FILES[stream]
+        if not event_log.is_segmented(path):
+            return []
+        return list(log_segments.iter_events_between(path, start, end))
+
+    def _with_sealed(self, sealed, events):
+        if not sealed:
+            return events
+        return sorted(sealed + events, key=lambda x: x.get('timestamp', ''))
+
+    def events_since(self, stream, timestamp):
+        sealed = [e for e in self._sealed_events(stream, timestamp, None) if e.get('timestamp', '') > timestamp]
+        return self._with_sealed(sealed, self.time_index(stream).since(timestamp))
+
+
+class SQLiteBackend(StorageBackend):
+    """Single SQLite database in WAL mode with indexed event tables"""
+
+    name = "sqlite"
+
+    def __init__(self, db_path=SQLITE_DB_FILE):
+        self.db_path = db_path
+        # sqlite3 connections may only be used by the thread that opened them
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._create_schema(conn)
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self, conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "name TEXT NOT NULL, key TEXT NOT NULL, data TEXT NOT NULL, "
+            "PRIMARY KEY (name, key))"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        for stream in EVENT_FILES:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {stream} ("
+                "id INTEGER PRIMARY KEY, timestamp TEXT, username TEXT, "
+                "action TEXT, data TEXT NOT NULL)"
+            )
+            for column in ("username", "action", "timestamp"):
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{stream}_{column} ON {stream}({column})")
+
+    def _rows_to_events(self, rows):
+        return [json.loads(row[0]) for row in rows]
+
+    def load_document(self, name):
+        rows = self._connect().execute("SELECT key, data FROM documents WHERE name = ?", (name,))
+        return {key: json.loads(data) for key, data in rows}
+
+    def _write_document(self, conn, name, data):
+        conn.execute("DELETE FROM documents WHERE name = ?", (name,))
+        conn.executemany(
+            "INSERT INTO documents (name, key, data) VALUES (?, ?, ?)",
+            [(name, key, json.dumps(value, ensure_ascii=False)) for key, value in data.items()]
+        )
+
+    def save_document(self, name, data):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._write_document(conn, name, data)
+
+    def update_document(self, name, update):
+        conn = self._connect()
+        with conn:
+            # Take the write lock before reading so concurrent updates serialize
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute("SELECT key, data FROM documents WHERE name = ?", (name,))
+            data = {key: json.loads(value) for key, value in rows}
+            result = update(data)
+            self._write_document(conn, name, data)
+        return result
+
+    def update_records(self, name, updates):
+        conn = self._connect()
+        keys = list(updates)
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            current = {}
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT key, data FROM documents WHERE name = ? AND key IN ({','.join('?' * len(batch))})",
+                    [name] + batch
+                )
+                current.update((key, json.loads(data)) for key, data in rows)
+            conn.executemany(
+                "INSERT OR REPLACE INTO documents (name, key, data) VALUES (?, ?, ?)",
+                [(name, key, json.dumps(updates[key](current.get(key)), ensure_ascii=False)) for key in keys]
+            )
+
+    def append_events(self, stream, entries):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                f"INSERT INTO {stream} (timestamp, username, action, data) VALUES (?, ?, ?, ?)",
+                [
+                    (e.get('timestamp'), e.get('username'), e.get('action'),
+                     json.dumps(e, ensure_ascii=False))
+                    for e in entries
+                ]
+            )
+
+    def read_events(self, stream):
+        return self._rows_to_events(self._connect().execute(f"SELECT data FROM {stream} ORDER BY id"))
+
+    def iter_events(self, stream):
+        for (data,) in self._connect().execute(f"SELECT data FROM {stream} ORDER BY id"):
+            yield json.loads(data)
+
+    def iter_events_between(self, stream, start=None, end=None, username=None):
+        conditions = []
+        params = []
+        for condition, value in (("timestamp >= ?", start), ("timestamp <= ?", end), ("username = ?", username)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        for (data,) in self._connect().execute(f"SELECT data FROM {stream} {where}ORDER BY id", params):
+            yield json.loads(data)
+
+    def iter_document(self, name):
+        for key, data in self._connect().execute("SELECT key, data FROM documents WHERE name = ? ORDER BY key", (name,)):
+            yield key, json.loads(data)
+
+    def clear_events(self, stream):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(f"DELETE FROM {stream}")
+            # Row ids may be reused after a delete, so cursors also carry a generation
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, 1) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + 1",
+                (f"generation:{stream}",)
+            )
+
+    def _generation(self, conn, stream):
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (f"generation:{stream}",)).fetchone()
+        return row[0] if row else 0
+
+    def read_new_events(self, stream, cursor=None):
+        conn = self._connect()
+        with conn:
+            # One read transaction so the generation and rows are consistent
+            conn.execute("BEGIN")
+            generation = self._generation(conn, stream)
+            last_id = 0
+            reset = False
+            if cursor is not None:
+                if cursor[0] == generation:
+                    last_id = cursor[1]
+                else:
+                    reset = True
+            rows = conn.execute(
+                f"SELECT id, data FROM {stream} WHERE id > ? ORDER BY id", (last_id,)
+            ).fetchall()
+        if rows:
+            last_id = rows[-1][0]
+        return [json.loads(row[1]) for row in rows], (generation, last_id), reset
+
+    def scan_new_events(self, stream, cursor, visit, on_reset=None):
+        return self._scan_rows(stream, cursor, lambda row_id, data: visit(json.loads(data)), on_reset)
+
+    def scan_new_event_refs(self, stream, cursor, visit, on_reset=None, on_roll=None):
+        # Rows never move, so a ref is just the row id
+        return self._scan_rows(
+            stream, cursor, lambda row_id, data: visit(event_log.ACTIVE_SEGMENT, row_id, json.loads(data)), on_reset
+        )
+
+    def load_event_refs(self, stream, refs, cursor=None):
+        conn = self._connect()
+        rows = {}
+        row_ids = sorted({offset for _, offset in refs})
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(row_ids), 500):
+            batch = row_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows.update(conn.execute(f"SELECT id, data FROM {stream} WHERE id IN ({placeholders})", batch))
+        return [json.loads(rows[offset]) if offset in rows else None for _, offset in refs]
+
+    def _scan_rows(self, stream, cursor, visit, on_reset=None):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            generation = self._generation(conn, stream)
+            last_id = 0
+            reset = False
+            if cursor is not None:
+                if cursor[0] == generation:
+                    last_id = cursor[1]
+                else:
+                    reset = True
+                    if on_reset is not None:
+                        on_reset()
+            rows = conn.execute(f"SELECT id, data FROM {stream} WHERE id > ? ORDER BY id", (last_id,))
+            for row_id, data in rows:
+                visit(row_id, data)
+                last_id = row_id
+        return (generation, last_id), reset
+
+    def recent_events(self, stream, limit):
+        rows = self._connect().execute(
+            f"SELECT data FROM {stream} ORDER BY timestamp DESC LIMIT ?", (limit,)
+        )
+        return self._rows_to_events(rows)
+
+    def events_since(self, stream, timestamp):
+        rows = self._connect().execute(
+            f"SELECT data FROM {stream} WHERE timestamp > ? ORDER BY timestamp", (timestamp,)
+        )
+        return self._rows_to_events(rows)
+
+
+def create_storage(kind=None, **kwargs):
+    """Build a storage backend by name"""
+    kind = kind or STORAGE_BACKEND
+    if kind == "json":
+        return JsonBackend()
+    if kind == "sqlite":
+        return SQLiteBackend(**kwargs)
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+def get_storage():
+    """Return the process-wide storage backend"""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = create_storage()
+        return _storage
+
+
+def log_event(username, action, details):
+    """Record a system event through the configured storage backend"""
+    entry = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "username": username,
+        "action": action,
+        "details": details
+    }
+    get_storage().append_event(SYSTEM_LOGS, entry)
+
+
+def migrate_json_to_sqlite(db_path=SQLITE_DB_FILE, batch_size=10000):
+    """Copy all JSON/JSONL stores into a SQLite database, returning per-store counts"""
+    source = JsonBackend()
+    target = SQLiteBackend(db_path)
+    counts = {}
+
+    for name in DOCUMENT_FILES:
+        data = source.load_document(name)
+        target.save_document(name, data)
+        counts[name] = len(data)
+
+    for stream, path in EVENT_FILES.items():
+        target.clear_events(stream)
+        batch = []
+        counts[stream] = 0
+        for entry in event_log.iter_events(path):
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                target.append_events(stream, batch)
+                counts[stream] += len(batch)
+                batch = []
+        if batch:
+            target.append_events(stream, batch)
+            counts[stream] += len(batch)
+
+    return counts
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SecureVault storage maintenance")
+    parser.add_argument("command", choices=["migrate-to-sqlite"])
+    parser.add_argument("--db", default=SQLITE_DB_FILE, help="Target SQLite database path")
+    args = parser.parse_args()
+
+    if args.command == "migrate-to-sqlite":
+        for store, count in migrate_json_to_sqlite(args.db).items():
+            print(f"{store}: {count} records migrated")
@@ -0,0 +1,53 @@
+import base64
+import hashlib
+import os
+import sys
+import types
+
+import pytest
+
+# The modules live at the repository root rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _legacy_user_key(username):
+    return base64.urlsafe_b64encode(hashlib.sha256(username.encode()).digest())
+
+
+@pytest.fixture
+def vault(tmp_path, monkeypatch):
+    """Run in an empty data/ directory with every process-wide cache reset
+
+    The modules use paths relative to the working directory and keep
+    writers, caches and the storage backend in module globals.
+    """
+    import event_log
+    import file_cache
+    import key_cache
+    import key_ring
+    import log_segments
+    import storage
+
+    # shared.py is deployment specific; derive each user's version 1 key from the name
+    monkeypatch.setitem(sys.modules, "shared", types.SimpleNamespace(get_user_encryption_key=_legacy_user_key))
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+
+    def reset():
+        with event_log._writers_lock:
+            writers = list(event_log._writers.values())
+            event_log._writers.clear()
+        for writer in writers:
+            writer.close()
+        log_segments.wait_for_sealing()
+        event_log._migrated_paths.clear()
+        log_segments._first_timestamps.clear()
+        log_segments._restoring.clear()
+        file_cache.default_cache.invalidate()
+        key_cache.default_key_cache.invalidate()
+        key_ring._master = None
+        storage._storage = None
+
+    reset()
+    yield tmp_path
+    reset()
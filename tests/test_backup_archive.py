@@ -0,0 +1,84 @@
+import pytest
+from cryptography.fernet import Fernet
+
+import event_log
+import log_segments
+from backup_archive import BackupReader, create_backup, restore_backup, restore_records
+from key_ring import add_key_version, current_key_version, key_versions, load_key_version
+from storage import ENCRYPTION_ACTIVITY, FILES, KEY_RING, SYSTEM_LOGS, USERS, get_storage
+
+# Ten events a day from 2024-05-01, well before any test runs
+OLD_EVENTS = [
+    {"timestamp": f"2024-05-{1 + n // 10:02d}T10:00:{n % 10:02d}", "username": "alice", "action": "login", "n": n}
+    for n in range(50)
+]
+
+
+@pytest.fixture
+def backup(vault):
+    storage = get_storage()
+    storage.save_document(USERS, {"alice": {"role": "admin"}, "bob": {"role": "user"}})
+    storage.save_document(FILES, {"a": {"full_path": "/vault/a.txt", "accessed_count": 2}})
+    storage.append_events(SYSTEM_LOGS, OLD_EVENTS[:5])
+    storage.append_events(ENCRYPTION_ACTIVITY, [{"action": "encrypt", "n": 1}])
+    add_key_version("alice")
+    path = str(vault / "backup.svbk")
+    create_backup(path, created_by="admin")
+    return path
+
+
+def test_backup_round_trip(backup):
+    storage = get_storage()
+    storage.save_document(USERS, {})
+    storage.save_document(FILES, {"b": {}})
+    storage.clear_events(SYSTEM_LOGS)
+    storage.append_events(ENCRYPTION_ACTIVITY, [{"action": "decrypt", "n": 2}])
+
+    restored = restore_backup(backup)
+    assert restored == {"users_data": 2, "system_logs": 5, "files_data": 1, "encryption_activity": 1, "key_ring": 1}
+    assert storage.load_document(USERS) == {"alice": {"role": "admin"}, "bob": {"role": "user"}}
+    assert storage.load_document(FILES) == {"a": {"full_path": "/vault/a.txt", "accessed_count": 2}}
+    assert storage.read_events(SYSTEM_LOGS) == OLD_EVENTS[:5]
+    assert storage.read_events(ENCRYPTION_ACTIVITY) == [{"action": "encrypt", "n": 1}]
+
+
+def test_backup_holds_only_wrapped_keys(vault):
+    plain = Fernet.generate_key()
+    get_storage().save_document(KEY_RING, {"alice": {"keys": {"2": plain.decode()}, "current": 2}})
+    path = str(vault / "backup.svbk")
+    create_backup(path)
+
+    records = dict(BackupReader(path).iter_records("key_ring"))
+    assert "keys" not in records["alice"] and "2" in records["alice"]["wrapped"]
+    with open(path, "rb") as f:
+        assert plain not in f.read()
+    assert load_key_version("alice", 2) == plain
+
+
+def test_restore_keeps_keys_made_after_the_backup(backup):
+    backed_up = load_key_version("alice", 2)
+    add_key_version("alice")
+    newer = load_key_version("alice", 3)
+
+    restore_backup(backup, sections=["key_ring"])
+    # The key ring used to be replaced, dropping version 3
+    assert key_versions("alice") == [3, 2, 1]
+    assert current_key_version("alice") == 3
+    assert (load_key_version("alice", 2), load_key_version("alice", 3)) == (backed_up, newer)
+
+
+def test_restoring_old_events_does_not_roll_each_batch(vault, monkeypatch):
+    monkeypatch.setattr("backup_archive.RESTORE_BATCH_SIZE", 10)
+    # Every restore batch is flushed (and could roll the log) as it is appended
+    monkeypatch.setattr(event_log, "WRITER_BATCH_SIZE", 10)
+    monkeypatch.setattr(log_segments, "SEGMENT_RETENTION_DAYS", 30)
+
+    assert restore_records("system_logs", iter(OLD_EVENTS)) == 50
+    # Day rolls would have sealed each day as a segment, and retention removed them
+    assert log_segments.list_segments(event_log.SYSTEM_LOG_FILE) == []
+    assert get_storage().read_events(SYSTEM_LOGS) == OLD_EVENTS
+
+
+def test_unknown_section_is_rejected(vault):
+    with pytest.raises(KeyError, match="Unknown backup section"):
+        restore_records("passwords", [])
@@ -0,0 +1,190 @@
+import datetime
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import event_log
+import log_segments
+from event_log import ENCRYPTION_LOG_FILE, EventWriter
+
+# Not segmented, so every event stays in the one file
+LOG = ENCRYPTION_LOG_FILE
+
+
+def lines(path=LOG):
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        return [json.loads(line) for line in f]
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def test_batch_is_written_when_full(vault):
+    writer = EventWriter(LOG, batch_size=3, flush_interval=60)
+    writer.write({"n": 1})
+    writer.write({"n": 2})
+    assert lines() == []
+    writer.write({"n": 3})
+    assert lines() == [{"n": 1}, {"n": 2}, {"n": 3}]
+    writer.close()
+
+
+def test_partial_batch_is_written_after_interval(vault):
+    writer = EventWriter(LOG, batch_size=100, flush_interval=0.02)
+    writer.write_many([{"n": 1}, {"n": 2}])
+    assert wait_until(lambda: len(lines()) == 2)
+    writer.close()
+
+
+def test_close_flushes_and_rejects_writes(vault):
+    writer = EventWriter(LOG, batch_size=100, flush_interval=60)
+    writer.write({"n": 1})
+    writer.close()
+    assert lines() == [{"n": 1}]
+    with pytest.raises(RuntimeError, match="closed"):
+        writer.write({"n": 2})
+
+
+def test_idle_flusher_does_not_poll(vault):
+    writer = EventWriter(LOG, batch_size=100, flush_interval=0.01)
+    calls = []
+    flush = writer.flush
+    writer.flush = lambda: calls.append(1) or flush()
+
+    writer.write({"n": 1})
+    assert wait_until(lambda: lines() == [{"n": 1}])
+    # The flusher used to wake (and flush) every interval with nothing queued
+    time.sleep(0.2)
+    assert len(calls) == 1
+    writer.write({"n": 2})
+    assert wait_until(lambda: len(lines()) == 2)
+    assert len(calls) == 2
+    writer.close()
+
+
+def test_concurrent_writers_do_not_split_lines(vault):
+    # Two writers on one file stand in for two processes sharing the log
+    writers = [EventWriter(LOG, batch_size=7, flush_interval=60) for _ in range(2)]
+
+    def produce(writer, name):
+        for n in range(500):
+            writer.write({"writer": name, "n": n, "padding": "x" * 200})
+
+    threads = [threading.Thread(target=produce, args=(writer, name)) for name, writer in enumerate(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for writer in writers:
+        writer.close()
+
+    events = lines()
+    assert len(events) == 1000
+    for name in range(2):
+        assert [event["n"] for event in events if event["writer"] == name] == list(range(500))
+
+
+def test_configure_writers_replaces_open_writers(vault, monkeypatch):
+    monkeypatch.setattr(event_log, "WRITER_BATCH_SIZE", event_log.WRITER_BATCH_SIZE)
+    monkeypatch.setattr(event_log, "WRITER_FLUSH_INTERVAL", event_log.WRITER_FLUSH_INTERVAL)
+    old = event_log.get_writer(LOG)
+    old.write({"n": 1})
+
+    event_log.configure_writers(batch_size=1, flush_interval=60)
+    assert lines() == [{"n": 1}]
+    writer = event_log.get_writer(LOG)
+    assert writer is not old
+    writer.write({"n": 2})
+    assert lines() == [{"n": 1}, {"n": 2}]
+
+
+def test_legacy_json_log_is_migrated_before_new_events(vault):
+    legacy = event_log.LEGACY_LOG_FILES[LOG]
+    with open(legacy, "w", encoding="utf-8") as f:
+        json.dump([{"n": 1}, {"n": 2}], f)
+
+    event_log.append_event(LOG, {"n": 3})
+    assert event_log.read_events(LOG) == [{"n": 1}, {"n": 2}, {"n": 3}]
+    assert not os.path.exists(legacy)
+    assert os.path.exists(legacy + ".migrated")
+
+
+def test_partial_last_line_is_skipped(vault):
+    with open(LOG, "wb") as f:
+        f.write(event_log.encode_event({"n": 1}) + b'{"n": 2')
+    assert event_log.read_events(LOG) == [{"n": 1}]
+
+
+def append_system(*numbers):
+    for n in numbers:
+        event_log.append_event(event_log.SYSTEM_LOG_FILE, {"timestamp": datetime.datetime.now().isoformat(), "n": n})
+    event_log.flush_all()
+
+
+def scan_refs(cursor=None, rolls=None):
+    refs = []
+    cursor, reset = event_log.scan_log_refs(
+        event_log.SYSTEM_LOG_FILE, cursor, lambda segment, offset, event: refs.append(((segment, offset), event["n"])),
+        on_roll=None if rolls is None else rolls.append
+    )
+    return refs, cursor, reset
+
+
+def read_refs(refs, cursor=None):
+    events = event_log.read_event_refs(event_log.SYSTEM_LOG_FILE, [ref for ref, _ in refs], cursor)
+    return [event and event["n"] for event in events]
+
+
+def test_refs_follow_the_active_file_into_its_segment(vault):
+    append_system(1, 2, 3)
+    refs, cursor, reset = scan_refs()
+    assert [n for _, n in refs] == [1, 2, 3]
+    assert {segment for (segment, _), _ in refs} == {event_log.ACTIVE_SEGMENT}
+
+    assert log_segments.roll(event_log.SYSTEM_LOG_FILE) == 1
+    append_system(4)
+    assert read_refs(refs, cursor) == [1, 2, 3]
+
+    rolls = []
+    new_refs, cursor, reset = scan_refs(cursor, rolls)
+    assert rolls == [1] and not reset
+    assert [n for _, n in new_refs] == [4]
+    assert read_refs(new_refs, cursor) == [4]
+
+
+def test_refs_into_a_cleared_log_are_gone(vault):
+    append_system(1, 2)
+    refs, cursor, _ = scan_refs()
+    log_segments.roll(event_log.SYSTEM_LOG_FILE)
+    sealed_refs, _, _ = scan_refs()
+    event_log.clear_events(event_log.SYSTEM_LOG_FILE)
+    assert read_refs(refs, cursor) == [None, None]
+    assert read_refs(sealed_refs) == [None, None]
+
+
+def test_segment_numbers_are_not_reused_after_retention(vault):
+    path = event_log.SYSTEM_LOG_FILE
+    append_system(1)
+    log_segments.roll(path)
+    old_refs, _, _ = scan_refs()
+    append_system(2)
+    log_segments.roll(path)
+    later = datetime.datetime.now() + datetime.timedelta(days=30)
+    assert log_segments.apply_retention(path, days=1, action="delete", now=later) == 2
+    assert log_segments.list_segments(path) == []
+
+    append_system(3)
+    # Refs to the expired segment 1 must not find event 3
+    assert log_segments.roll(path) == 3
+    assert read_refs(old_refs) == [None]
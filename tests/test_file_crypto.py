@@ -0,0 +1,155 @@
+import io
+import os
+import struct
+
+import pytest
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+import file_crypto
+from file_crypto import (
+    EncryptedFileReader, StreamIntegrityError, decrypt_stream, encrypt_stream, reencrypt_stream
+)
+
+# Small chunks so a few KB of plaintext spans several blocks
+CHUNK_SIZE = 1024
+PLAINTEXT = os.urandom(5 * CHUNK_SIZE + 100)
+RECORD_SIZE = file_crypto.RECORD_HEADER.size + CHUNK_SIZE + file_crypto.TAG_BYTES
+DATA_START = file_crypto.FILE_HEADER.size + file_crypto.HEADER_MAC_BYTES
+
+
+@pytest.fixture
+def key():
+    return Fernet.generate_key()
+
+
+def encrypt(key, plaintext=PLAINTEXT):
+    dst = io.BytesIO()
+    encrypt_stream(key, io.BytesIO(plaintext), dst, chunk_size=CHUNK_SIZE, workers=1)
+    return dst.getvalue()
+
+
+def decrypt(key, data):
+    dst = io.BytesIO()
+    decrypt_stream(key, io.BytesIO(data), dst, workers=1)
+    return dst.getvalue()
+
+
+def write(tmp_path, data):
+    path = tmp_path / "file.svlt"
+    path.write_bytes(data)
+    return str(path)
+
+
+def encrypt_v1(key, plaintext, chunk_size=CHUNK_SIZE):
+    """Build a version 1 stream: no header MAC, block index or trailer"""
+    salt = os.urandom(file_crypto.FILE_SALT_BYTES)
+    header = file_crypto.FILE_HEADER.pack(file_crypto.FILE_MAGIC, 1, chunk_size, salt)
+    aead = AESGCM(file_crypto.derive_file_key(key, salt))
+    chunks = [plaintext[i:i + chunk_size] for i in range(0, len(plaintext), chunk_size)] or [b""]
+    out = [header]
+    for sequence, chunk in enumerate(chunks):
+        final = sequence == len(chunks) - 1
+        ciphertext = aead.encrypt(file_crypto._nonce(sequence), chunk,
+                                  file_crypto._associated_data(header, final))
+        out.append(file_crypto.RECORD_HEADER.pack(len(ciphertext)) + ciphertext)
+    return b"".join(out)
+
+
+def test_round_trip_and_random_access(key, tmp_path):
+    data = encrypt(key)
+    assert decrypt(key, data) == PLAINTEXT
+    with EncryptedFileReader(key, write(tmp_path, data)) as reader:
+        assert reader.version == 2
+        assert len(reader) == len(PLAINTEXT)
+        assert reader.read(CHUNK_SIZE - 10, 2 * CHUNK_SIZE) == PLAINTEXT[CHUNK_SIZE - 10:3 * CHUNK_SIZE - 10]
+
+
+def test_flipped_ciphertext_byte_is_rejected(key, tmp_path):
+    data = bytearray(encrypt(key))
+    # Inside the ciphertext of block 2
+    data[DATA_START + 2 * RECORD_SIZE + file_crypto.RECORD_HEADER.size + 7] ^= 0x01
+    with pytest.raises(StreamIntegrityError, match="Chunk 2"):
+        decrypt(key, bytes(data))
+    with EncryptedFileReader(key, write(tmp_path, bytes(data))) as reader:
+        assert reader.read(0, CHUNK_SIZE) == PLAINTEXT[:CHUNK_SIZE]
+        with pytest.raises(StreamIntegrityError, match="Block 2"):
+            reader.read(2 * CHUNK_SIZE, 10)
+
+
+def test_swapped_blocks_are_rejected(key, tmp_path):
+    data = bytearray(encrypt(key))
+    first = slice(DATA_START + RECORD_SIZE, DATA_START + 2 * RECORD_SIZE)
+    second = slice(DATA_START + 2 * RECORD_SIZE, DATA_START + 3 * RECORD_SIZE)
+    data[first], data[second] = data[second], data[first]
+    with pytest.raises(StreamIntegrityError, match="Chunk 1"):
+        decrypt(key, bytes(data))
+    with EncryptedFileReader(key, write(tmp_path, bytes(data))) as reader:
+        with pytest.raises(StreamIntegrityError, match="Block 1"):
+            reader.read(CHUNK_SIZE, 10)
+
+
+def test_truncated_trailer_is_rejected(key, tmp_path):
+    data = encrypt(key)[:-3]
+    with pytest.raises(StreamIntegrityError, match="trailer"):
+        decrypt(key, data)
+    with pytest.raises(StreamIntegrityError, match="trailer"):
+        EncryptedFileReader(key, write(tmp_path, data))
+
+
+def test_dropped_final_block_is_rejected(key):
+    data = encrypt(key)
+    # Cut the stream right after block 4, before the short final block
+    with pytest.raises(StreamIntegrityError, match="truncated"):
+        decrypt(key, data[:DATA_START + 5 * RECORD_SIZE])
+
+
+def test_edited_header_mac_is_rejected(key, tmp_path):
+    data = bytearray(encrypt(key))
+    data[file_crypto.FILE_HEADER.size] ^= 0x80
+    with pytest.raises(StreamIntegrityError, match="Header failed authentication"):
+        decrypt(key, bytes(data))
+    with pytest.raises(StreamIntegrityError, match="Header failed authentication"):
+        EncryptedFileReader(key, write(tmp_path, bytes(data)))
+    assert not file_crypto.key_opens_file(key, write(tmp_path, bytes(data)))
+
+
+def test_edited_header_field_is_rejected(key):
+    data = bytearray(encrypt(key))
+    # The chunk size is covered by the header MAC
+    offset = len(file_crypto.FILE_MAGIC) + 1
+    data[offset:offset + 4] = struct.pack(">I", 2 * CHUNK_SIZE)
+    with pytest.raises(StreamIntegrityError, match="Header failed authentication"):
+        decrypt(key, bytes(data))
+
+
+def test_version_1_reencrypts_to_version_2(key, tmp_path):
+    v1 = encrypt_v1(key, PLAINTEXT)
+    assert decrypt(key, v1) == PLAINTEXT
+    with EncryptedFileReader(key, write(tmp_path, v1)) as reader:
+        assert reader.version == 1
+        assert reader.read(3 * CHUNK_SIZE, 50) == PLAINTEXT[3 * CHUNK_SIZE:3 * CHUNK_SIZE + 50]
+
+    new_key = Fernet.generate_key()
+    dst = io.BytesIO()
+    reencrypt_stream(key, io.BytesIO(v1), dst, new_key)
+    v2 = dst.getvalue()
+    assert v2[len(file_crypto.FILE_MAGIC)] == 2
+    assert decrypt(new_key, v2) == PLAINTEXT
+    with pytest.raises(StreamIntegrityError):
+        decrypt(key, v2)
+    with EncryptedFileReader(new_key, write(tmp_path, v2)) as reader:
+        assert reader.version == 2
+        assert reader.read(0, len(PLAINTEXT)) == PLAINTEXT
+
+
+def test_reencrypt_with_several_workers_keeps_chunk_order(key):
+    data = encrypt(key)
+    new_key = Fernet.generate_key()
+    progress = []
+    dst = io.BytesIO()
+    bytes_read, bytes_written = reencrypt_stream(key, io.BytesIO(data), dst, new_key, progress=progress.append,
+                                                 workers=4, max_in_flight=2)
+    assert (bytes_read, bytes_written) == (len(data), len(dst.getvalue()))
+    assert progress == sorted(progress) and progress[-1] <= len(data)
+    assert decrypt(new_key, dst.getvalue()) == PLAINTEXT
@@ -0,0 +1,129 @@
+import time
+
+import pytest
+
+from file_metadata import FileAccessDelta, FileMetadataStore
+from storage import FILES, create_storage
+
+
+def delta(*accesses, path="/vault/a.txt"):
+    """Build a delta from (username, timestamp, file_size) accesses"""
+    result = FileAccessDelta(path)
+    for username, timestamp, file_size in accesses:
+        result.add(path, username, timestamp, file_size)
+    return result
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def storage(vault, request):
+    return create_storage(request.param)
+
+
+class FailingStorage:
+    """Fails the first update, recording an access from "another thread" meanwhile"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.store = None
+        self.failures = 1
+
+    def update_records(self, name, updates):
+        if self.failures:
+            self.failures -= 1
+            self.store.record_access("a", "/vault/moved/a.txt", "carol", 30, "2024-05-03T00:00:00")
+            raise OSError("disk full")
+        self.storage.update_records(name, updates)
+
+
+def test_merge_folds_in_a_later_delta():
+    earlier = delta(("alice", "2024-05-01T10:00:00", 10), ("bob", "2024-05-01T09:00:00", 11))
+    later = delta(("carol", "2024-05-02T00:00:00", 20), path="/vault/moved/a.txt")
+    earlier.merge(later)
+    assert earlier.count == 3
+    assert (earlier.first_access, earlier.last_access) == ("2024-05-01T09:00:00", "2024-05-02T00:00:00")
+    assert earlier.accessed_by == {"alice", "bob", "carol"}
+    assert (earlier.full_path, earlier.file_size) == ("/vault/moved/a.txt", 20)
+
+
+def test_merge_keeps_the_newest_access_details():
+    newer = delta(("alice", "2024-05-02T00:00:00", 10))
+    older = delta(("bob", "2024-05-01T00:00:00", 99), path="/vault/old/a.txt")
+    newer.merge(older)
+    assert newer.count == 2
+    assert (newer.first_access, newer.last_access) == ("2024-05-01T00:00:00", "2024-05-02T00:00:00")
+    assert (newer.full_path, newer.file_size) == ("/vault/a.txt", 10)
+    newer.merge(FileAccessDelta("/vault/a.txt"))
+    assert newer.count == 2 and newer.first_access == "2024-05-01T00:00:00"
+
+
+def test_apply_adds_to_the_stored_record():
+    record = delta(("bob", "2024-05-01T00:00:00", 5)).apply(None)
+    assert record == {
+        "full_path": "/vault/a.txt", "accessed_count": 1, "first_access": "2024-05-01T00:00:00",
+        "last_access": "2024-05-01T00:00:00", "accessed_by": ["bob"], "file_size": 5,
+    }
+    record = delta(("carol", "2024-05-02T00:00:00", 7), ("alice", "2024-04-30T00:00:00", 6)).apply(record)
+    assert record["accessed_count"] == 3
+    assert (record["first_access"], record["last_access"]) == ("2024-04-30T00:00:00", "2024-05-02T00:00:00")
+    assert record["accessed_by"] == ["bob", "alice", "carol"]
+    assert record["file_size"] == 7
+
+
+def test_accesses_are_coalesced_per_file(storage):
+    store = FileMetadataStore(storage, batch_size=100, flush_interval=60)
+    for n in range(5):
+        store.record_access("a", "/vault/a.txt", "alice", 10, f"2024-05-01T0{n}:00:00")
+    store.record_access("b", "/vault/b.txt", "bob", 20, "2024-05-01T00:00:00")
+    assert store.pending() == 2
+    assert store.flush() == 2
+    assert store.pending() == 0
+    store.record_access("a", "/vault/a.txt", "bob", 10, "2024-05-02T00:00:00")
+    store.close()
+
+    records = storage.load_document(FILES)
+    assert records["a"]["accessed_count"] == 6
+    assert records["a"]["accessed_by"] == ["alice", "bob"]
+    assert records["a"]["last_access"] == "2024-05-02T00:00:00"
+    assert records["b"]["accessed_count"] == 1
+
+
+def test_full_batch_is_flushed(storage):
+    store = FileMetadataStore(storage, batch_size=3, flush_interval=60)
+    for key in "ab":
+        store.record_access(key, f"/vault/{key}", "alice")
+    assert storage.load_document(FILES) == {}
+    store.record_access("c", "/vault/c", "alice")
+    assert sorted(storage.load_document(FILES)) == ["a", "b", "c"]
+    store.close()
+
+
+def test_background_flush_after_interval(storage):
+    store = FileMetadataStore(storage, batch_size=100, flush_interval=0.02)
+    store.record_access("a", "/vault/a.txt", "alice")
+    deadline = time.monotonic() + 2
+    while "a" not in storage.load_document(FILES) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert storage.load_document(FILES)["a"]["accessed_count"] == 1
+    store.close()
+
+
+def test_failed_flush_is_requeued_with_later_accesses(storage):
+    failing = FailingStorage(storage)
+    store = failing.store = FileMetadataStore(failing, batch_size=100, flush_interval=60)
+    store.record_access("a", "/vault/a.txt", "alice", 10, "2024-05-01T00:00:00")
+    store.record_access("a", "/vault/a.txt", "bob", 10, "2024-05-02T00:00:00")
+    store.record_access("b", "/vault/b.txt", "bob", 20, "2024-05-01T00:00:00")
+
+    with pytest.raises(OSError, match="disk full"):
+        store.flush()
+    # Nothing is lost, and the access made during the failed flush is merged in
+    assert store.pending() == 2
+    assert store.flush() == 2
+    store.close()
+
+    records = storage.load_document(FILES)
+    assert records["a"]["accessed_count"] == 3
+    assert records["a"]["accessed_by"] == ["alice", "bob", "carol"]
+    assert (records["a"]["first_access"], records["a"]["last_access"]) == ("2024-05-01T00:00:00", "2024-05-03T00:00:00")
+    assert (records["a"]["full_path"], records["a"]["file_size"]) == ("/vault/moved/a.txt", 30)
+    assert records["b"]["accessed_count"] == 1
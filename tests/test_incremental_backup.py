@@ -0,0 +1,156 @@
+import json
+import os
+
+import pytest
+
+import incremental_backup
+from backup_archive import BackupIntegrityError
+from incremental_backup import (
+    ChunkStore, collect_garbage, create_incremental_backup, load_manifest, restore_incremental_backup,
+    verify_backups
+)
+from storage import ENCRYPTION_ACTIVITY, FILES, SYSTEM_LOGS, USERS, create_storage, get_storage
+
+USERS_DATA = {f"user{n:03d}": {"role": "user", "files": n} for n in range(100)}
+
+
+def events(start, count, source="json"):
+    return [{"timestamp": f"2024-05-01T10:{n // 60:02d}:{n % 60:02d}", "username": f"user{n % 7}",
+             "action": "login", "details": f"event {n} from {source}"} for n in range(start, start + count)]
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # A few hundred records then span several chunks
+    monkeypatch.setattr(incremental_backup, "CHUNK_MIN_BYTES", 512)
+    monkeypatch.setattr(incremental_backup, "CHUNK_AVG_BYTES", 2048)
+    monkeypatch.setattr(incremental_backup, "CHUNK_MAX_BYTES", 8192)
+
+
+@pytest.fixture
+def storage(vault):
+    storage = get_storage()
+    storage.save_document(USERS, USERS_DATA)
+    storage.save_document(FILES, {"a": {"full_path": "/vault/a.txt"}})
+    storage.append_events(SYSTEM_LOGS, events(0, 500))
+    return storage
+
+
+def test_backup_round_trip(storage):
+    summary = create_incremental_backup(created_by="admin")
+    assert summary["sections"]["system_logs"] == 500 and summary["sections"]["users_data"] == 100
+    assert summary["new_chunks"] == summary["chunks"] > 3
+
+    storage.save_document(USERS, {})
+    storage.clear_events(SYSTEM_LOGS)
+    storage.append_events(ENCRYPTION_ACTIVITY, [{"action": "encrypt"}])
+    restored = restore_incremental_backup(summary["path"])
+    assert restored["system_logs"] == 500 and restored["encryption_activity"] == 0
+    assert storage.load_document(USERS) == USERS_DATA
+    assert storage.read_events(SYSTEM_LOGS) == events(0, 500)
+    assert storage.read_events(ENCRYPTION_ACTIVITY) == []
+
+
+def test_next_backup_only_adds_new_chunks(storage):
+    first = create_incremental_backup()
+    storage.append_events(SYSTEM_LOGS, events(500, 10))
+    second = create_incremental_backup()
+
+    manifest = load_manifest(second["path"])
+    assert manifest["parent"] == os.path.basename(first["path"])
+    section = manifest["sections"]["system_logs"]
+    assert section["records"] == 510 and not section["replayed"]
+    # Only the re-cut tail of the log is new; the documents are unchanged
+    assert 1 <= second["new_chunks"] <= 2
+    previous = load_manifest(first["path"])["sections"]["system_logs"]["chunks"]
+    assert section["chunks"][:len(previous) - 1] == previous[:-1]
+
+    storage.clear_events(SYSTEM_LOGS)
+    restore_incremental_backup(second["path"], sections=["system_logs"])
+    assert storage.read_events(SYSTEM_LOGS) == events(0, 510)
+
+
+def test_edited_document_reuses_unchanged_chunks(storage):
+    first = create_incremental_backup()
+    storage.save_document(USERS, {**USERS_DATA, "user050": {"role": "admin", "files": 50}})
+    second = create_incremental_backup()
+    assert second["new_chunks"] < len(load_manifest(first["path"])["sections"]["users_data"]["chunks"])
+    storage.save_document(USERS, {})
+    restore_incremental_backup(second["path"], sections=["users_data"])
+    assert storage.load_document(USERS)["user050"]["role"] == "admin"
+
+
+def test_cleared_log_is_backed_up_from_the_start(storage):
+    create_incremental_backup()
+    storage.clear_events(SYSTEM_LOGS)
+    storage.append_events(SYSTEM_LOGS, events(1000, 3))
+    summary = create_incremental_backup()
+    section = load_manifest(summary["path"])["sections"]["system_logs"]
+    assert section["records"] == 3 and section["replayed"]
+    restore_incremental_backup(summary["path"], sections=["system_logs"])
+    assert storage.read_events(SYSTEM_LOGS) == events(1000, 3)
+
+
+def test_cursor_from_another_backend_is_not_resumed(vault):
+    sqlite = create_storage("sqlite")
+    sqlite.append_events(SYSTEM_LOGS, events(0, 300, "sqlite"))
+    create_incremental_backup(storage=sqlite)
+
+    # Switched to the JSON backend: the SQLite row cursor means nothing to it
+    json_storage = get_storage()
+    json_storage.append_events(SYSTEM_LOGS, events(0, 20, "json"))
+    summary = create_incremental_backup(storage=json_storage)
+    section = load_manifest(summary["path"])["sections"]["system_logs"]
+    assert (section["backend"], section["records"], section["replayed"]) == ("json", 20, True)
+
+    json_storage.clear_events(SYSTEM_LOGS)
+    restore_incremental_backup(summary["path"], sections=["system_logs"], storage=json_storage)
+    assert json_storage.read_events(SYSTEM_LOGS) == events(0, 20, "json")
+
+
+def test_damaged_chunk_is_reported_and_not_restored(storage):
+    summary = create_incremental_backup()
+    digest = load_manifest(summary["path"])["sections"]["system_logs"]["chunks"][1][0]
+    path, _ = ChunkStore().find(digest)
+    with open(path, "r+b") as f:
+        f.seek(20)
+        byte = f.read(1)
+        f.seek(20)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    result = verify_backups()
+    assert result["manifests"] == 1
+    assert list(result["damaged"][os.path.basename(summary["path"])]) == ["system_logs"]
+    storage.append_events(SYSTEM_LOGS, events(500, 1))
+    with pytest.raises(BackupIntegrityError, match="system_logs"):
+        restore_incremental_backup(summary["path"], sections=["system_logs"])
+    # Verified before the store is touched
+    assert len(storage.read_events(SYSTEM_LOGS)) == 501
+
+
+def test_garbage_collection_keeps_referenced_chunks(storage):
+    first = create_incremental_backup()
+    storage.save_document(USERS, {"root": {"role": "admin"}})
+    storage.clear_events(SYSTEM_LOGS)
+    storage.append_events(SYSTEM_LOGS, events(2000, 5))
+    second = create_incremental_backup()
+
+    assert collect_garbage()["chunks_removed"] == 0
+    result = collect_garbage(keep_last=1)
+    assert result["manifests_removed"] == 1 and result["chunks_removed"] > 0
+    assert not os.path.exists(first["path"])
+    assert verify_backups() == {"manifests": 1, "chunks": result["chunks_kept"], "damaged": {}}
+    restore_incremental_backup(second["path"])
+    assert storage.load_document(USERS) == {"root": {"role": "admin"}}
+    assert storage.read_events(SYSTEM_LOGS) == events(2000, 5)
+
+
+def test_unknown_manifest_version_is_rejected(storage):
+    summary = create_incremental_backup()
+    with open(summary["path"], "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    manifest["version"] = 99
+    with open(summary["path"], "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    with pytest.raises(ValueError, match="Unsupported backup manifest version"):
+        restore_incremental_backup(summary["path"])
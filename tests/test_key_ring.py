@@ -0,0 +1,122 @@
+import json
+import os
+import stat
+
+import pytest
+from cryptography.fernet import Fernet
+
+import key_ring
+from key_ring import (
+    add_key_version, current_key_version, key_versions, load_key_version, merge_key_ring, retire_key_version,
+    wrap_key_ring
+)
+from storage import KEY_RING, get_storage
+
+USER = "alice"
+
+
+def ring():
+    return get_storage().load_document(KEY_RING)
+
+
+def test_rotated_keys_are_stored_wrapped(vault):
+    assert add_key_version(USER) == 2
+    entry = ring()[USER]
+    assert "keys" not in entry and list(entry["wrapped"]) == ["2"]
+    key = load_key_version(USER, 2)
+    Fernet(key)
+    assert key.decode() not in json.dumps(ring())
+    assert stat.S_IMODE(os.stat(key_ring.MASTER_KEY_FILE).st_mode) == 0o600
+    assert load_key_version(USER) == key
+    assert key_versions(USER) == [2, 1]
+    assert load_key_version(USER, 1) != key
+
+
+def test_plain_keys_from_older_rings_are_read_and_wrapped(vault):
+    plain = Fernet.generate_key()
+    get_storage().save_document(KEY_RING, {USER: {"keys": {"2": plain.decode()}, "current": 2}})
+    assert key_versions(USER) == [2, 1]
+    assert load_key_version(USER, 2) == plain
+
+    assert wrap_key_ring() == 1
+    assert wrap_key_ring() == 0
+    assert "keys" not in ring()[USER]
+    assert load_key_version(USER, 2) == plain
+    # Updates wrap as well
+    assert add_key_version(USER) == 3
+    assert key_versions(USER) == [3, 2, 1]
+
+
+def test_ring_wrapped_with_another_master_key_is_rejected(vault):
+    add_key_version(USER)
+    key_ring._master = None
+    with open(key_ring.MASTER_KEY_FILE, "wb") as f:
+        f.write(Fernet.generate_key())
+    with pytest.raises(ValueError, match="not wrapped with the master key"):
+        load_key_version(USER, 2)
+
+
+def test_retired_versions_are_gone(vault):
+    add_key_version(USER)
+    with pytest.raises(ValueError, match="current key version"):
+        retire_key_version(USER, 2)
+    retire_key_version(USER, 1)
+    assert key_versions(USER) == [2]
+    with pytest.raises(KeyError):
+        load_key_version(USER, 1)
+
+
+def test_merge_keeps_versions_made_after_the_backup(vault):
+    add_key_version(USER)
+    backup = ring()
+    add_key_version(USER)
+    keys = {version: load_key_version(USER, version) for version in (2, 3)}
+
+    assert merge_key_ring(backup) == 1
+    assert key_versions(USER) == [3, 2, 1]
+    assert current_key_version(USER) == 3
+    assert {version: load_key_version(USER, version) for version in (2, 3)} == keys
+
+
+def test_merge_adds_versions_missing_from_the_ring(vault):
+    add_key_version(USER)
+    add_key_version("bob")
+    backup = ring()
+    restored_key = load_key_version(USER, 2)
+    get_storage().save_document(KEY_RING, {})
+
+    assert merge_key_ring(backup) == 2
+    assert current_key_version(USER) == 2 and current_key_version("bob") == 2
+    assert load_key_version(USER, 2) == restored_key
+
+
+def test_merge_renumbers_a_reused_version(vault):
+    add_key_version(USER)
+    backup = ring()
+    backup_key = load_key_version(USER, 2)
+    # Started over after the backup: version 2 is now a different key
+    get_storage().save_document(KEY_RING, {})
+    add_key_version(USER)
+    current_key = load_key_version(USER, 2)
+
+    merge_key_ring(backup)
+    assert key_versions(USER) == [3, 2, 1]
+    assert load_key_version(USER, 2) == current_key
+    assert load_key_version(USER, 3) == backup_key
+    # The restored current version was renumbered, so it is not newer
+    assert current_key_version(USER) == 2
+    # Merging again adds nothing
+    merge_key_ring(backup)
+    assert key_versions(USER) == [3, 2, 1]
+
+
+def test_merge_keeps_a_version_retired_only_if_both_rings_retired_it(vault):
+    add_key_version(USER)
+    retire_key_version(USER, 1)
+    backup = ring()
+    assert merge_key_ring(backup) == 1
+    assert key_versions(USER) == [2]
+
+    get_storage().save_document(KEY_RING, {USER: {"wrapped": backup[USER]["wrapped"], "current": 2}})
+    merge_key_ring(backup)
+    assert key_versions(USER) == [2, 1]
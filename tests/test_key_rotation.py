@@ -0,0 +1,121 @@
+import os
+
+import pytest
+from cryptography.fernet import Fernet
+
+import event_log
+import file_crypto
+import key_rotation
+from bulk_crypto import DECRYPT, run_bulk
+from key_ring import find_file_key_version, key_versions, load_key_version
+from key_rotation import rotate_user_key
+
+CHUNK_SIZE = 1024
+USER = "alice"
+
+
+def encrypt_files(root, key, count, prefix="f"):
+    """Encrypt count small files into root; returns {encrypted path: plaintext}"""
+    root.mkdir(exist_ok=True)
+    files = {}
+    for n in range(count):
+        plaintext = os.urandom(3 * CHUNK_SIZE + n)
+        plain_path = root / f"{prefix}{n}.bin"
+        plain_path.write_bytes(plaintext)
+        encrypted = str(plain_path) + file_crypto.ENCRYPTED_FILE_SUFFIX
+        file_crypto.encrypt_file(key, str(plain_path), encrypted, chunk_size=CHUNK_SIZE, workers=1)
+        plain_path.unlink()
+        files[encrypted] = plaintext
+    return files
+
+
+def decrypt(key, path, tmp_path):
+    output = str(tmp_path / "decrypted")
+    file_crypto.decrypt_file(key, path, output, workers=1)
+    with open(output, "rb") as f:
+        return f.read()
+
+
+def output_name(path):
+    return os.path.basename(path)[:-len(file_crypto.ENCRYPTED_FILE_SUFFIX)]
+
+
+def file_version(path):
+    return find_file_key_version(USER, path)[0]
+
+
+@pytest.fixture
+def files(vault):
+    return encrypt_files(vault / "files", load_key_version(USER, 1), 4)
+
+
+def test_rotation_reencrypts_every_file(vault, files):
+    summary = rotate_user_key(USER, [str(vault / "files")], workers=2)
+    assert summary["target_version"] == 2 and not summary["resumed"]
+    assert (summary["rotated"], summary["skipped"], summary["failed"]) == (4, 0, 0)
+    assert summary["from_versions"] == {"1": 4}
+    assert key_versions(USER) == [2, 1]
+    new_key = load_key_version(USER, 2)
+    for path, plaintext in files.items():
+        assert file_version(path) == 2
+        assert decrypt(new_key, path, vault) == plaintext
+    assert not os.path.exists(key_rotation.ROTATION_CHECKPOINT_FILE.format(username=USER))
+    assert event_log.read_events(event_log.ENCRYPTION_LOG_FILE)[-1]["action"] == "key_rotation"
+
+
+def test_interrupted_rotation_resumes_the_same_version(vault, files, monkeypatch):
+    broken = sorted(files)[1]
+    rotate_file = key_rotation._rotate_file
+
+    def failing(username, path, *args):
+        if path == broken:
+            raise OSError("disk full")
+        return rotate_file(username, path, *args)
+
+    monkeypatch.setattr(key_rotation, "_rotate_file", failing)
+    first = rotate_user_key(USER, [str(vault / "files")], workers=2)
+    assert (first["rotated"], first["failed"]) == (3, 1)
+    assert first["errors"] == [{"path": broken, "error": "disk full"}]
+    assert file_version(broken) == 1
+
+    monkeypatch.setattr(key_rotation, "_rotate_file", rotate_file)
+    # No roots: the checkpoint remembers them
+    second = rotate_user_key(USER, workers=2)
+    assert second["resumed"] and second["target_version"] == 2
+    assert (second["rotated"], second["skipped"], second["failed"]) == (1, 3, 0)
+    # Resuming must not start another rotation
+    assert key_versions(USER) == [2, 1]
+    assert {file_version(path) for path in files} == {2}
+    assert not os.path.exists(key_rotation.ROTATION_CHECKPOINT_FILE.format(username=USER))
+
+
+def test_checkpoint_of_another_user_is_rejected(vault, files):
+    checkpoint = key_rotation.RotationCheckpoint(str(vault / "checkpoint.json"), "bob")
+    checkpoint.target_version = 2
+    checkpoint.save()
+    with pytest.raises(ValueError, match="not a rotation checkpoint for alice"):
+        rotate_user_key(USER, [str(vault / "files")], checkpoint_path=str(vault / "checkpoint.json"))
+
+
+def test_retire_old_drops_the_previous_versions(vault, files):
+    summary = rotate_user_key(USER, [str(vault / "files")], workers=2, retire_old=True)
+    assert summary["retired_versions"] == [1]
+    assert key_versions(USER) == [2]
+    with pytest.raises(KeyError):
+        load_key_version(USER, 1)
+    assert {file_version(path) for path in files} == {2}
+
+
+def test_bulk_decrypt_finds_each_files_key_version(vault, files):
+    # Files outside the rotated directory keep version 1, new ones get version 2
+    rotate_user_key(USER, [str(vault / "files")], workers=2)
+    old = encrypt_files(vault / "mixed", load_key_version(USER, 1), 2, prefix="old")
+    new = encrypt_files(vault / "mixed", load_key_version(USER, 2), 2, prefix="new")
+    stranger = encrypt_files(vault / "mixed", Fernet.generate_key(), 1, prefix="other")
+
+    summary = run_bulk(DECRYPT, str(vault / "mixed"), str(vault / "out"), USER, workers=2)
+    assert (summary["processed"], summary["failed"]) == (4, 1)
+    assert "No key version" in summary["errors"][0]["error"]
+    for path, plaintext in {**old, **new}.items():
+        assert (vault / "out" / output_name(path)).read_bytes() == plaintext
+    assert not (vault / "out" / output_name(next(iter(stranger)))).exists()
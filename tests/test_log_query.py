@@ -0,0 +1,155 @@
+import pytest
+
+from event_log import ACTIVE_SEGMENT
+from log_query import LogIndex, QueryError, parse_query, quote_value
+
+ODD_USER = 'o"brien\\ (x)'
+
+# Event 4 arrives out of time order, and events 2 and 5 share a timestamp
+EVENTS = [
+    {"timestamp": "2024-05-01T09:00:00", "username": "alice", "action": "login", "details": "login ok"},
+    {"timestamp": "2024-05-01T10:00:00", "username": "bob", "action": "login_failed", "details": "Wrong password for bob"},
+    {"timestamp": "2024-05-02T08:00:00", "username": "alice", "action": "encrypt", "details": "encrypted report.pdf"},
+    {"timestamp": "2024-05-03T12:00:00", "username": ODD_USER, "action": "login", "details": "password wrong"},
+    {"timestamp": "2024-04-30T23:00:00", "username": "carol", "action": "decrypt", "details": "decrypted report.pdf"},
+    {"timestamp": "2024-05-02T08:00:00", "username": "bob", "action": "logout", "details": ""},
+]
+TIME_ORDER = [4, 0, 1, 2, 5, 3]
+
+
+class ListStorage:
+    """Event stream held in a list; a ref's offset is the event's position"""
+
+    def __init__(self, events=()):
+        self.events = list(events)
+
+    def scan_new_event_refs(self, stream, cursor, visit, on_reset=None, on_roll=None):
+        reset = cursor is not None and cursor > len(self.events)
+        if reset:
+            if on_reset is not None:
+                on_reset()
+            cursor = 0
+        for offset in range(cursor or 0, len(self.events)):
+            visit(ACTIVE_SEGMENT, offset, self.events[offset])
+        return len(self.events), reset
+
+    def load_event_refs(self, stream, refs, cursor=None):
+        return [self.events[offset] if offset < len(self.events) else None for _, offset in refs]
+
+
+@pytest.fixture
+def index():
+    return LogIndex(ListStorage(EVENTS), "system_logs")
+
+
+def ids(index, query):
+    return list(index.match(query)[0])
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("", TIME_ORDER),
+    ("user:alice", [0, 2]),
+    ("USER:Alice", [0, 2]),
+    ("action:login*", [0, 1, 3]),
+    ("user:alice user:bob", []),
+    ("user:alice OR user:carol", [4, 0, 2]),
+    ("user:bob -action:logout", [1]),
+    ("encrypt*", [2]),
+    ("wrong password", [1, 3]),
+    ('"wrong password"', [1]),
+    ("report.pdf", [4, 2]),
+    ("(user:alice OR user:bob) AND time:2024-05-02", [2, 5]),
+])
+def test_match(index, query, expected):
+    assert ids(index, query) == expected
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("-user:alice", [4, 1, 5, 3]),
+    ("NOT user:alice", [4, 1, 5, 3]),
+    ("NOT NOT user:alice", [0, 2]),
+    ("-user:alice -user:bob", [4, 3]),
+    ("NOT (user:bob OR user:carol)", [0, 2, 3]),
+    ("user:alice OR -action:login", [4, 0, 1, 2, 5]),
+    ("-user:alice OR -time:2024-05-01", [4, 1, 2, 5, 3]),
+    ('-"wrong password"', [4, 0, 2, 5, 3]),
+])
+def test_negation(index, query, expected):
+    assert ids(index, query) == expected
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("time:2024-05-02", [2, 5]),
+    ("time:2024-05-01..2024-05-02", [0, 1, 2, 5]),
+    ("time:2024-05-02..", [2, 5, 3]),
+    ("time:..2024-04", [4]),
+    ("time:>=2024-05-02", [2, 5, 3]),
+    ("time:>2024-05-02", [3]),
+    ("time:<=2024-05-01", [4, 0, 1]),
+    ("time:<2024-05", [4]),
+    ("timestamp:<2024-05-01T10", [4, 0]),
+])
+def test_time_ranges(index, query, expected):
+    assert ids(index, query) == expected
+
+
+@pytest.mark.parametrize("query, message", [
+    ("(user:alice", "Missing"),
+    ("user:alice)", "Unexpected"),
+    ('user:"alice', "Unbalanced quote"),
+    ("host:alice", "Unknown field"),
+    ("time:<", "Invalid time range"),
+    ("user:alice OR", "Expected a search term"),
+    ("NOT", "Expected a search term"),
+])
+def test_malformed_queries_are_rejected(query, message):
+    with pytest.raises(QueryError, match=message):
+        parse_query(query)
+
+
+def test_quoted_values_are_taken_literally(index):
+    # The filter dialog builds these; unquoted, the parentheses and quote broke the query
+    assert ids(index, "user:" + quote_value(ODD_USER)) == [3]
+    assert ids(index, "user:" + quote_value('o"brien\\') + "*") == [3]
+    assert ids(index, "user:" + quote_value("o") + "*") == [3]
+    assert ids(index, "user:" + quote_value("alice") + "* time:2024-05-02") == [2]
+    assert parse_query("user:" + quote_value("a*")) == ("field", "username", "a*", False)
+    assert ids(index, "-user:" + quote_value(ODD_USER)) == [4, 0, 1, 2, 5]
+
+
+def test_timestamps_are_returned_in_time_order(index):
+    matched, timestamps = index.match("")
+    assert timestamps == sorted(event["timestamp"] for event in EVENTS)
+    assert list(matched) == TIME_ORDER
+    assert index.match("-user:carol")[1] == sorted(timestamps[1:])
+
+
+def test_in_order_stream_matches_by_id():
+    events = sorted(EVENTS, key=lambda event: event["timestamp"])
+    index = LogIndex(ListStorage(events), "system_logs")
+    assert ids(index, "user:bob") == [2, 4]
+    assert ids(index, "login*") == [1]
+
+
+def test_new_events_are_indexed_before_matching(index):
+    assert ids(index, "user:dave") == []
+    index.storage.events.append({"timestamp": "2024-05-04T00:00:00", "username": "dave", "action": "login", "details": ""})
+    assert ids(index, "user:dave") == [6]
+    assert ids(index, "action:login")[-1] == 6
+
+
+def test_cleared_stream_resets_the_index(index):
+    view = index.view("user:alice")
+    index.storage.events = [{"timestamp": "2024-06-01T00:00:00", "username": "erin", "action": "login", "details": ""}]
+    assert ids(index, "user:alice") == []
+    assert ids(index, "user:erin") == [0]
+    # Ids from before the reset mean other events now
+    assert view.page(0) == []
+
+
+def test_search_and_view_read_events_back(index):
+    assert [event["username"] for event in index.search("action:login*")] == ["alice", "bob", ODD_USER]
+    view = index.view("user:alice OR user:bob", page_size=2)
+    assert len(view) == 4 and view.page_count() == 2
+    assert [event["timestamp"] for _, event in view.page(0)] == ["2024-05-02T08:00:00", "2024-05-02T08:00:00"]
+    assert [event["action"] for _, event in view.page(1)] == ["login_failed", "login"]
@@ -0,0 +1,144 @@
+import datetime
+import os
+import threading
+
+import pytest
+
+import event_log
+import log_segments
+from event_log import SYSTEM_LOG_FILE
+
+LOG = SYSTEM_LOG_FILE
+NOW = datetime.datetime(2024, 6, 1, 12, 0, 0)
+
+
+def append(*timestamps):
+    """Append one event per timestamp (None: no timestamp) and flush them"""
+    for timestamp in timestamps:
+        event = {"details": "no timestamp"} if timestamp is None else {"timestamp": timestamp}
+        event_log.append_event(LOG, event)
+    event_log.flush_all()
+
+
+def sealed_segment(*timestamps):
+    append(*timestamps)
+    return log_segments.roll(LOG)
+
+
+def segment_files():
+    return sorted(name for name in os.listdir(log_segments.segment_dir(LOG)) if not name.endswith(".lock"))
+
+
+def today(hour=0):
+    return datetime.datetime.now().replace(hour=hour, minute=0, second=0, microsecond=0).isoformat()
+
+
+def test_roll_seals_the_active_file(vault):
+    append(today(1), today(2))
+    assert log_segments.roll(LOG) == 1
+    assert os.path.getsize(LOG) == 0
+    assert segment_files() == ["00000001.jsonl.gz", "manifest.json"]
+    entry = log_segments.load_manifest(LOG)[1]
+    assert (entry["count"], entry["start"], entry["end"]) == (2, today(1), today(2))
+    append(today(3))
+    assert [event["timestamp"] for event in event_log.iter_events(LOG)] == [today(1), today(2), today(3)]
+    # Nothing to roll
+    log_segments.roll(LOG)
+    assert log_segments.roll(LOG) is None
+
+
+def test_log_rolls_when_full(vault, monkeypatch):
+    # Room for two events per segment
+    monkeypatch.setattr(log_segments, "SEGMENT_MAX_BYTES", 80)
+    for hour in range(10):
+        append(today(hour))
+    log_segments.wait_for_sealing()
+    assert len(log_segments.list_segments(LOG)) >= 3
+    assert all(entry["bytes"] <= 80 for entry in log_segments.load_manifest(LOG).values())
+    assert [event["timestamp"] for event in event_log.iter_events(LOG)] == [today(hour) for hour in range(10)]
+
+
+def test_log_rolls_on_a_new_day(vault):
+    yesterday = (datetime.datetime.now() - datetime.timedelta(days=1)).isoformat()
+    append(yesterday)
+    assert log_segments.needs_roll(LOG)
+    append(today())
+    log_segments.wait_for_sealing()
+    assert log_segments.list_segments(LOG) == [1]
+    assert event_log.read_events(LOG) == [{"timestamp": yesterday}, {"timestamp": today()}]
+    assert not log_segments.needs_roll(LOG)
+
+
+def test_flush_does_not_wait_for_compression(vault, monkeypatch):
+    release = threading.Event()
+    compress = log_segments._compress_segment
+
+    def slow_compress(plain_path, compressed_path):
+        release.wait(5)
+        return compress(plain_path, compressed_path)
+
+    monkeypatch.setattr(log_segments, "_compress_segment", slow_compress)
+    yesterday = (datetime.datetime.now() - datetime.timedelta(days=1)).isoformat()
+    append(yesterday)
+    # This flush rolls the log; it used to compress the segment before returning
+    append(today())
+    assert segment_files() == ["00000001.jsonl"]
+    # The plain segment is readable while it waits to be sealed
+    assert len(event_log.read_events(LOG)) == 2
+    release.set()
+    log_segments.wait_for_sealing()
+    assert segment_files() == ["00000001.jsonl.gz", "manifest.json"]
+    assert len(event_log.read_events(LOG)) == 2
+
+
+@pytest.mark.parametrize("action", ["archive", "delete"])
+def test_retention_expires_old_segments(vault, action):
+    sealed_segment("2024-05-01T10:00:00")
+    sealed_segment("2024-05-20T10:00:00", "2024-05-29T10:00:00")
+    sealed_segment("2024-05-31T10:00:00")
+
+    assert log_segments.apply_retention(LOG, days=7, action=action, archive_dir="data/archive", now=NOW) == 1
+    assert log_segments.list_segments(LOG) == [2, 3]
+    archived = os.listdir("data/archive") if os.path.isdir("data/archive") else []
+    assert archived == (["system_logs-2024-05-01-00000001.jsonl.gz"] if action == "archive" else [])
+    assert log_segments.apply_retention(LOG, days=2, action=action, archive_dir="data/archive", now=NOW) == 1
+    assert log_segments.list_segments(LOG) == [3]
+    assert log_segments.apply_retention(LOG, days=0, action=action, now=NOW) == 0
+
+
+def test_retention_keeps_segments_without_timestamps(vault):
+    sealed_segment(None, None)
+    assert log_segments.load_manifest(LOG)[1]["end"] is None
+    now = datetime.datetime.now()
+    # Such a segment used to expire at once; its sealing time counts instead
+    assert log_segments.apply_retention(LOG, days=7, action="delete", now=now + datetime.timedelta(days=1)) == 0
+    assert log_segments.list_segments(LOG) == [1]
+    assert log_segments.apply_retention(LOG, days=7, action="delete", now=now + datetime.timedelta(days=8)) == 1
+    assert log_segments.list_segments(LOG) == []
+
+
+def test_restoring_holds_off_day_rolls_and_retention(vault, monkeypatch):
+    monkeypatch.setattr(log_segments, "SEGMENT_RETENTION_DAYS", 1)
+    with log_segments.restoring(LOG):
+        for day in range(1, 6):
+            append(f"2024-05-0{day}T10:00:00")
+        assert not log_segments.needs_roll(LOG)
+        assert log_segments.roll(LOG) == 1
+        log_segments.wait_for_sealing()
+        assert log_segments.list_segments(LOG) == [1]
+    assert len(event_log.read_events(LOG)) == 5
+
+    # Once restored, old segments are subject to retention again
+    append("2024-05-06T10:00:00")
+    log_segments.roll(LOG)
+    assert log_segments.list_segments(LOG) == []
+
+
+def test_archive_all_empties_the_log(vault):
+    sealed_segment(today(1))
+    append(today(2), today(3))
+    assert log_segments.archive_all(LOG, "data/export") == (2, 3)
+    assert event_log.read_events(LOG) == []
+    assert "manifest.json" in os.listdir("data/export")
+    append(today(4))
+    assert log_segments.roll(LOG) == 3
@@ -0,0 +1,97 @@
+import bisect
+import threading
+import event_log
+
+# Index granularity: ISO timestamp prefix "YYYY-MM-DDTHH:MM" (one entry per minute)
+INDEX_BUCKET_CHARS = 16
+# Extra buckets scanned past a range's end, covering the small reordering that
+# concurrent group-committing writers can introduce (well under a minute)
+ORDER_SLACK_BUCKETS = 1
+
+
+class TimeIndexedLog:
+    """Sparse per-minute time index over an append-only JSONL event log
+
+    Each index entry maps a minute to the byte offset where events of that
+    minute begin, so range queries seek straight to the first relevant line
+    and read only the k matching events: O(log n + k) instead of a full scan.
+    Buckets are keyed by the running maximum timestamp, which keeps them
+    ordered even if a few events arrive slightly out of order. The index is
+    extended incrementally as the log grows and rebuilt if it is cleared.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._keys = []
+        self._offsets = []
+        self._max_timestamp = ""
+        self._cursor = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Index any events appended since the last refresh"""
+        with self._lock:
+            def visit(offset, event):
+                timestamp = event.get('timestamp', '')
+                if timestamp > self._max_timestamp:
+                    self._max_timestamp = timestamp
+                key = self._max_timestamp[:INDEX_BUCKET_CHARS]
+                if not self._keys or key != self._keys[-1]:
+                    self._keys.append(key)
+                    self._offsets.append(offset)
+
+            self._cursor, _ = event_log.scan_tail(self.path, self._cursor, visit, on_reset=self._clear)
+            return self._end_offset()
+
+    def _clear(self):
+        # The log was cleared or replaced; the whole file is about to be rescanned
+        self._keys = []
+        self._offsets = []
+        self._max_timestamp = ""
+
+    def _end_offset(self):
+        return self._cursor[1] if self._cursor else 0
+
+    def last(self, count):
+        """Return the newest count events, newest first"""
+        end = self.refresh()
+        if not end or count <= 0:
+            return []
+        # Read a little extra so slightly reordered events still sort correctly
+        events = event_log.read_last(self.path, count * 2, end)
+        events.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
+        return events[:count]
+
+    def between(self, start=None, end=None, inclusive_start=True):
+        """Return events with start <= timestamp <= end, oldest first"""
+        end_offset = self.refresh()
+        with self._lock:
+            if not self._keys:
+                return []
+            first = 0
+            if start is not None:
+                first = bisect.bisect_left(self._keys, start[:INDEX_BUCKET_CHARS])
+                if first == len(self._keys):
+                    return []
+            start_offset = self._offsets[first]
+
+            stop_offset = end_offset
+            if end is not None:
+                last = bisect.bisect_right(self._keys, end[:INDEX_BUCKET_CHARS]) + ORDER_SLACK_BUCKETS
+                if last < len(self._keys):
+                    stop_offset = self._offsets[last]
+
+        events = []
+        for event in event_log.iter_range(self.path, start_offset, stop_offset):
+            timestamp = event.get('timestamp', '')
+            if start is not None and (timestamp < start or (not inclusive_start and timestamp == start)):
+                continue
+            if end is not None and timestamp > end:
+                continue
+            events.append(event)
+        events.sort(key=lambda x: x.get('timestamp', ''))
+        return events
+
+    def since(self, timestamp):
+        """Return events strictly newer than timestamp, oldest first"""
+        return self.between(timestamp, None, inclusive_start=False)